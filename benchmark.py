@@ -0,0 +1,461 @@
+from run import MyTransformer, Storage, create_sql_parser, get_table_data_path, STORAGE_FORMATS
+from run import StatementCache, run_statement, DURABILITY_FLAGS, DEFAULT_PARALLEL_DEGREE, DEFAULT_BATCH_SIZE
+from run import Catalog, add_record_id, put_record, scan_table, drop_pk_index, set_row_count, get_parser_cache_path
+from run import compact_column_table, TABLE_STORAGES, DEFAULT_SORT_MEMORY
+from server import Server
+from client import Client
+import asyncio
+import os
+import time
+import random
+import csv
+import argparse
+import tempfile
+
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark")
+
+
+def run_query(sql_parser, storage, query, storage_format="json"):    # Run single query and return its result
+    transformer = MyTransformer(storage, storage_format)
+    transformer.transform(sql_parser.parse(query))
+    return transformer.result
+
+def make_bench_records(row_count):                                  # Rows of bench table ("table.column": value)
+    random.seed(0)
+    return [
+        {
+            "bench.id": i,
+            "bench.name": "name" + str(random.randrange(10 ** 6)),
+            "bench.created": f"20{random.randrange(24):02d}-{random.randrange(1, 13):02d}-{random.randrange(1, 29):02d}",
+            "bench.amount": random.randrange(10 ** 6) if i % 10 else None,
+        }
+        for i in range(row_count)
+    ]
+
+def load_bench_records(storage, records):                           # Write rows of bench table directly into storage
+    database = storage.get_database()
+    directory = storage.get_directory()
+    codec = Catalog().get_table(database, "bench").codec
+    table_data = storage.get_table_data("bench")
+
+    for record_id, record in enumerate(records):
+        put_record(table_data, codec, record_id, record)
+        add_record_id(database, directory, "bench", record_id)
+    database.put(b"table_list/bench/uuid", bytes(str(len(records)), "utf-8"))
+    set_row_count(database, "bench", len(records))
+    drop_pk_index(storage.get_pk_index(), "bench")                  # primary key index is built from loaded rows when needed
+
+def bench_storage(args):                                            # Compare scan throughput and file size of record formats
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+    records = make_bench_records(args.rows)
+
+    print(f"{'format':<10}{'file size (KB)':>16}{'scan (rows/s)':>16}")
+    for storage_format in STORAGE_FORMATS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "bench.db")
+            storage = Storage(db_path)
+            run_query(sql_parser, storage, "create table bench (id int, name char(20), created date, amount int, primary key (id));", storage_format)
+            load_bench_records(storage, records)
+
+            table = Catalog().get_table(storage.get_database(), "bench")
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for _ in scan_table(storage, table):
+                    pass
+            elapsed = time.perf_counter() - start
+            storage.close()
+
+            file_size = os.path.getsize(get_table_data_path(db_path)) / 1024
+            print(f"{storage_format:<10}{file_size:>16.1f}{args.rows * args.repeat / elapsed:>16.0f}")
+
+def format_bench_values(record):                                    # Value list of bench record in insert query syntax
+    amount = record["bench.amount"]
+    return f"({record['bench.id']}, '{record['bench.name']}', {record['bench.created']}, {amount if amount is not None else 'null'})"
+
+def bench_load(args):                                               # Compare single row insert, multi row insert and copy
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+    records = make_bench_records(args.rows)
+    create_query = "create table bench (id int, name char(20), created date, amount int, primary key (id));"
+
+    def single_insert(storage, tmp_dir):
+        for record in records:
+            run_query(sql_parser, storage, f"insert into bench values {format_bench_values(record)};")
+
+    def multi_insert(storage, tmp_dir):
+        for start in range(0, len(records), args.batch):
+            values = ", ".join(format_bench_values(record) for record in records[start:start + args.batch])
+            run_query(sql_parser, storage, f"insert into bench values {values};")
+
+    def copy(storage, tmp_dir):
+        csv_path = os.path.join(tmp_dir, "bench.csv")
+        with open(csv_path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            for record in records:
+                writer.writerow(["" if value is None else value for value in record.values()])
+        run_query(sql_parser, storage, f"copy bench from '{csv_path}';")
+
+    print(f"{'method':<16}{'load (rows/s)':>16}")
+    for method, load in [("insert", single_insert), ("insert (batch)", multi_insert), ("copy", copy)]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage = Storage(os.path.join(tmp_dir, "bench.db"))
+            run_query(sql_parser, storage, create_query)
+
+            start = time.perf_counter()
+            load(storage, tmp_dir)
+            elapsed = time.perf_counter() - start
+            storage.close()
+
+            print(f"{method:<16}{args.rows / elapsed:>16.0f}")
+
+def bench_update(args):                                             # Compare update with delete + insert workaround
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+    records = make_bench_records(args.rows)
+    updated_records = [dict(record, **{"bench.amount": 0}) for record in records[:args.rows // 2]]
+    create_query = "create table bench (id int, name char(20), created date, amount int, primary key (id));"
+
+    def update(storage):
+        return run_query(sql_parser, storage, f"update bench set amount = 0 where id < {args.rows // 2};")
+
+    def delete_insert(storage):
+        run_query(sql_parser, storage, f"delete from bench where id < {args.rows // 2};")
+        values = ", ".join(format_bench_values(record) for record in updated_records)
+        return run_query(sql_parser, storage, f"insert into bench values {values};")
+
+    print(f"{'method':<16}{'update (rows/s)':>16}")
+    for method, rewrite in [("update", update), ("delete + insert", delete_insert)]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage = Storage(os.path.join(tmp_dir, "bench.db"))
+            run_query(sql_parser, storage, create_query)
+            load_bench_records(storage, records)
+
+            start = time.perf_counter()
+            rewrite(storage)
+            elapsed = time.perf_counter() - start
+            storage.close()
+
+            print(f"{method:<16}{len(updated_records) / elapsed:>16.0f}")
+
+PARSE_BENCH_QUERIES = [
+    "select * from bench where id = 10;",
+    "select bench.name, amount from bench as b where created >= 2020-01-01 and not amount is null or id < 5;",
+    "insert into bench values (1, 'name1', 2020-01-01, 100), (2, 'name2', 2021-02-02, null);",
+    "update bench set amount = 0 where id > 100;",
+    "delete from bench where name = 'name3';",
+    "create table bench (id int, name char(20), created date, amount int, primary key (id));",
+    "desc bench;",
+]
+
+def bench_parse(args):                                              # Compare parser construction and per statement parse time
+    print(f"{'parser':<16}{'startup (ms)':>16}{'parse (stmts/s)':>18}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        grammar_path = os.path.join(tmp_dir, "grammar.lark")        # private copy so that cache file starts out missing
+        with open(GRAMMAR_PATH) as src, open(grammar_path, "w") as dst:
+            dst.write(src.read())
+
+        for name, parser in [("earley", "earley"), ("lalr (cold)", "lalr"), ("lalr (cached)", "lalr")]:
+            if name == "lalr (cold)" and os.path.exists(get_parser_cache_path(grammar_path)):
+                os.remove(get_parser_cache_path(grammar_path))
+
+            start = time.perf_counter()
+            sql_parser = create_sql_parser(grammar_path, parser)
+            startup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for query in PARSE_BENCH_QUERIES:
+                    sql_parser.parse(query)
+            elapsed = time.perf_counter() - start
+
+            print(f"{name:<16}{startup * 1000:>16.1f}{args.repeat * len(PARSE_BENCH_QUERIES) / elapsed:>18.0f}")
+
+def bench_commit(args):                                             # Compare commit throughput of durability settings
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+    records = make_bench_records(args.rows)
+    create_query = "create table bench (id int, name char(20), created date, amount int, primary key (id));"
+
+    print(f"{'durability':<16}{'transaction':<16}{'insert (rows/s)':>16}")
+    for durability in DURABILITY_FLAGS:
+        for batch in [1, args.batch]:                               # each statement committed alone, or batch statements per commit
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                storage = Storage(os.path.join(tmp_dir, "bench.db"), durability=durability)
+                transformer = MyTransformer(storage)
+                statements = StatementCache(sql_parser)
+                run_statement(transformer, statements, create_query)
+
+                start = time.perf_counter()
+                for idx, record in enumerate(records):
+                    if batch > 1 and idx % batch == 0:
+                        run_statement(transformer, statements, "begin;")
+                    run_statement(transformer, statements, f"insert into bench values {format_bench_values(record)};")
+                    if batch > 1 and (idx % batch == batch - 1 or idx == len(records) - 1):
+                        run_statement(transformer, statements, "commit;")
+                elapsed = time.perf_counter() - start
+                storage.close()
+
+                print(f"{durability:<16}{'statement' if batch == 1 else f'{batch} statements':<16}{args.rows / elapsed:>16.0f}")
+
+def bench_parallel(args):                                           # Compare filtered select on one process and parallel scan workers
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+    query = "select id, name from bench where amount < 100000 and name != 'name0';"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        storage = Storage(db_path)
+        run_query(sql_parser, storage, "create table bench (id int, name char(20), created date, amount int, primary key (id));", args.storage_format)
+        load_bench_records(storage, make_bench_records(args.rows))
+        storage.close()
+
+        print(f"{'workers':<10}{'scan (rows/s)':>16}{'result rows':>14}")
+        for degree in sorted({1, args.degree}):
+            storage = Storage(db_path, parallel_degree=degree, parallel_min_rows=0)
+            list(run_query(sql_parser, storage, query)[1])          # workers are started before timing
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                lines = list(run_query(sql_parser, storage, query)[1])
+            elapsed = time.perf_counter() - start
+            storage.close()
+
+            print(f"{degree:<10}{args.rows * args.repeat / elapsed:>16.0f}{len(lines) - 4:>14}")
+
+BATCH_BENCH_QUERIES = {                                             # filtered select with projection, each shape of batch kernels
+    "comparison": "select id, amount from bench where amount < 500000 and created >= 2010-01-01;",
+    "or / null": "select id, name from bench where amount is null or (amount > 900000 and not name = 'name0');",
+}
+
+def bench_batch(args):                                              # Compare row at a time and batch execution of single table select
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+
+    print(f"{'format':<10}{'query':<14}{'row (rows/s)':>16}{'batch (rows/s)':>18}")
+    for storage_format in STORAGE_FORMATS:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "bench.db")
+            storage = Storage(db_path)
+            run_query(sql_parser, storage, "create table bench (id int, name char(20), created date, amount int, primary key (id));", storage_format)
+            load_bench_records(storage, make_bench_records(args.rows))
+            storage.close()
+
+            for name, query in BATCH_BENCH_QUERIES.items():
+                throughput = []
+                for batch_size in [0, args.batch_size]:
+                    storage = Storage(db_path, parallel_degree=1, batch_size=batch_size)
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        for _ in run_query(sql_parser, storage, query)[1]:
+                            pass
+                    throughput.append(args.rows * args.repeat / (time.perf_counter() - start))
+                    storage.close()
+                print(f"{storage_format:<10}{name:<14}{throughput[0]:>16.0f}{throughput[1]:>18.0f}")
+
+COLUMN_BENCH_QUERIES = {                                            # few columns of wide table, whole table and range of ids
+    "one column": "select amount from bench where amount < 100000;",
+    "id range": "select id, name from bench where id >= 0 and id < 5000;",
+}
+
+def bench_column(args):                                             # Compare select on row table and column table
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+    records = make_bench_records(args.rows)
+
+    print(f"{'storage':<10}{'query':<14}{'select (rows/s)':>18}")
+    for table_storage in TABLE_STORAGES:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "bench.db")
+            storage = Storage(db_path, parallel_degree=1)
+            run_query(sql_parser, storage, "create table bench (id int, name char(20), created date, amount int, primary key (id))"
+                                           f" with (storage = {table_storage});", args.storage_format)
+            load_bench_records(storage, records)
+            table = Catalog().get_table(storage.get_database(), "bench")
+            if table.storage == "column":
+                compact_column_table(storage, table)                # loaded records move from append buffer into chunks
+
+            for name, query in COLUMN_BENCH_QUERIES.items():
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    for _ in run_query(sql_parser, storage, query)[1]:
+                        pass
+                print(f"{table_storage:<10}{name:<14}{args.rows * args.repeat / (time.perf_counter() - start):>18.0f}")
+            storage.close()
+
+AGGREGATE_BENCH_QUERIES = {                                         # result rows read to count them, and aggregates answering same questions
+    "select rows": "select amount from bench;",
+    "count(*)": "select count(*) from bench;",
+    "count where": "select count(*) from bench where amount < 500000;",
+    "sum, avg": "select sum(amount), avg(amount) from bench;",
+    "group by": "select created, count(*), max(amount) from bench group by created;",
+}
+
+def bench_aggregate(args):                                          # Compare reading all rows with aggregates computed by query
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        storage = Storage(db_path, parallel_degree=1)
+        run_query(sql_parser, storage, "create table bench (id int, name char(20), created date, amount int, primary key (id));", args.storage_format)
+        load_bench_records(storage, make_bench_records(args.rows))
+
+        print(f"{'query':<14}{'time (ms)':>12}{'result lines':>14}")
+        for name, query in AGGREGATE_BENCH_QUERIES.items():
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                lines = list(run_query(sql_parser, storage, query)[1])
+            print(f"{name:<14}{(time.perf_counter() - start) * 1000 / args.repeat:>12.2f}{len(lines):>14}")
+        storage.close()
+
+SORT_BENCH_QUERIES = {                                              # top-k heap, full sort and orders read from primary key and index
+    "top 10": "select id, amount from bench order by amount desc limit 10;",
+    "full sort": "select id, name from bench order by name;",
+    "pk order": "select id, name from bench order by id desc limit 100;",
+    "index order": "select id, created from bench where created >= 2020-01-01 order by created;",
+}
+
+def bench_sort(args):                                               # Compare order by on sort memory large enough and on small memory spilling runs
+    sql_parser = create_sql_parser(GRAMMAR_PATH)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        storage = Storage(db_path)
+        run_query(sql_parser, storage, "create table bench (id int, name char(20), created date, amount int, primary key (id));", args.storage_format)
+        load_bench_records(storage, make_bench_records(args.rows))
+        run_query(sql_parser, storage, "create index bench_created on bench (created);")
+        for _ in run_query(sql_parser, storage, "select id from bench order by id limit 1;")[1]:   # build primary key index dropped by loading
+            pass
+        storage.close()
+
+        print(f"{'query':<14}{'in memory (ms)':>16}{'spill (ms)':>14}")
+        for name, query in SORT_BENCH_QUERIES.items():
+            elapsed = []
+            for sort_memory in [DEFAULT_SORT_MEMORY, args.spill_memory * 1024]:
+                storage = Storage(db_path, parallel_degree=1, sort_memory=sort_memory)
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    result = run_query(sql_parser, storage, query)
+                    if result[0]:                                   # message instead of rows
+                        raise SystemExit(f"{name}: {result[1]}")
+                    for _ in result[1]:
+                        pass
+                elapsed.append((time.perf_counter() - start) * 1000 / args.repeat)
+                storage.close()
+            print(f"{name:<14}{elapsed[0]:>16.2f}{elapsed[1]:>14.2f}")
+
+async def run_load_clients(args, host, port, table_name):          # Run clients concurrently, return elapsed time and statement latencies
+    setup = await Client.connect(host, port)
+    await setup.execute(f"create table {table_name} (id int, name char(20), amount int, primary key (id));")
+    await setup.close()
+
+    async def run_client(client_id):                                # each client inserts its own rows and reads them back by key
+        client = await Client.connect(host, port)
+        latencies = []
+        for idx in range(args.statements // 2):
+            row_id = client_id * args.statements + idx
+            for query in [f"insert into {table_name} values ({row_id}, 'name{row_id}', {idx});",
+                          f"select * from {table_name} where id = {row_id};"]:
+                start = time.perf_counter()
+                await client.execute(query)
+                latencies.append(time.perf_counter() - start)
+        await client.close()
+        return latencies
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[run_client(client_id) for client_id in range(args.clients)])
+    return time.perf_counter() - start, sorted(latency for latencies in results for latency in latencies)
+
+async def load_server(args):                                        # Load server given by host and port, or server started on temporary database
+    print(f"{'clients':<10}{'throughput (stmts/s)':>22}{'p50 (ms)':>12}{'p99 (ms)':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = server = listener = None
+        host, port = args.host, args.port
+        if port is None:
+            storage = Storage(os.path.join(tmp_dir, "bench.db"), durability=args.durability)
+            server = Server(storage, create_sql_parser(GRAMMAR_PATH), workers=args.workers)
+            listener = await server.start(host, 0)
+            port = listener.sockets[0].getsockname()[1]
+
+        try:
+            for clients in sorted({1, args.clients}):
+                args_run = argparse.Namespace(**{**vars(args), "clients": clients})
+                elapsed, latencies = await run_load_clients(args_run, host, port, f"bench_{clients}_{int(time.time())}")
+                p50 = latencies[len(latencies) // 2]
+                p99 = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+                print(f"{clients:<10}{len(latencies) / elapsed:>22.0f}{p50 * 1000:>12.2f}{p99 * 1000:>12.2f}")
+        finally:
+            if listener is not None:
+                listener.close()
+                await listener.wait_closed()
+                server.close()
+                storage.close()
+
+def bench_server(args):                                             # Compare throughput and latency of one client and concurrent clients
+    asyncio.run(load_server(args))
+
+
+if __name__ == "__main__":                                          # Run benchmark given as sub command
+    arg_parser = argparse.ArgumentParser()
+    sub_parsers = arg_parser.add_subparsers(dest="benchmark", required=True)
+
+    storage_parser = sub_parsers.add_parser("storage", help="scan throughput and file size of json and binary record formats")
+    storage_parser.add_argument("--rows", type=int, default=20000)
+    storage_parser.add_argument("--repeat", type=int, default=3)
+    storage_parser.set_defaults(func=bench_storage)
+
+    load_parser = sub_parsers.add_parser("load", help="load throughput of single row insert, multi row insert and copy")
+    load_parser.add_argument("--rows", type=int, default=20000)
+    load_parser.add_argument("--batch", type=int, default=1000, help="rows per multi row insert")
+    load_parser.set_defaults(func=bench_load)
+
+    update_parser = sub_parsers.add_parser("update", help="update throughput of update and delete + insert workaround")
+    update_parser.add_argument("--rows", type=int, default=20000)
+    update_parser.set_defaults(func=bench_update)
+
+    parse_parser = sub_parsers.add_parser("parse", help="startup and per statement parse time of earley and lalr parsers")
+    parse_parser.add_argument("--repeat", type=int, default=200, help="times each sample statement is parsed")
+    parse_parser.set_defaults(func=bench_parse)
+
+    commit_parser = sub_parsers.add_parser("commit", help="insert throughput of durability settings with and without explicit transactions")
+    commit_parser.add_argument("--rows", type=int, default=5000)
+    commit_parser.add_argument("--batch", type=int, default=100, help="statements per explicit transaction")
+    commit_parser.set_defaults(func=bench_commit)
+
+    parallel_parser = sub_parsers.add_parser("parallel", help="filtered select throughput of single process and parallel scan workers")
+    parallel_parser.add_argument("--rows", type=int, default=200000)
+    parallel_parser.add_argument("--repeat", type=int, default=3)
+    parallel_parser.add_argument("--degree", type=int, default=DEFAULT_PARALLEL_DEGREE, help="worker processes of parallel scan")
+    parallel_parser.add_argument("--storage-format", choices=STORAGE_FORMATS, default="json")
+    parallel_parser.set_defaults(func=bench_parallel)
+
+    batch_parser = sub_parsers.add_parser("batch", help="select throughput of row at a time and batch execution")
+    batch_parser.add_argument("--rows", type=int, default=50000)
+    batch_parser.add_argument("--repeat", type=int, default=3)
+    batch_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    batch_parser.set_defaults(func=bench_batch)
+
+    column_parser = sub_parsers.add_parser("column", help="select throughput of row table and column table")
+    column_parser.add_argument("--rows", type=int, default=50000)
+    column_parser.add_argument("--repeat", type=int, default=3)
+    column_parser.add_argument("--storage-format", choices=STORAGE_FORMATS, default="json")
+    column_parser.set_defaults(func=bench_column)
+
+    aggregate_parser = sub_parsers.add_parser("aggregate", help="time of reading all rows and of aggregates computed by query")
+    aggregate_parser.add_argument("--rows", type=int, default=50000)
+    aggregate_parser.add_argument("--repeat", type=int, default=3)
+    aggregate_parser.add_argument("--storage-format", choices=STORAGE_FORMATS, default="json")
+    aggregate_parser.set_defaults(func=bench_aggregate)
+
+    sort_parser = sub_parsers.add_parser("sort", help="time of order by with top-k, full sort and index order, in memory and spilling to disk")
+    sort_parser.add_argument("--rows", type=int, default=50000)
+    sort_parser.add_argument("--repeat", type=int, default=3)
+    sort_parser.add_argument("--spill-memory", type=int, default=256, help="KB of sort memory of spilling run")
+    sort_parser.add_argument("--storage-format", choices=STORAGE_FORMATS, default="json")
+    sort_parser.set_defaults(func=bench_sort)
+
+    server_parser = sub_parsers.add_parser("server", help="throughput and latency of concurrent clients of network server")
+    server_parser.add_argument("--clients", type=int, default=8)
+    server_parser.add_argument("--statements", type=int, default=200, help="statements sent by each client")
+    server_parser.add_argument("--host", default="127.0.0.1")
+    server_parser.add_argument("--port", type=int, help="port of running server (default: start server on temporary database)")
+    server_parser.add_argument("--workers", type=int, default=8, help="worker threads of started server")
+    server_parser.add_argument("--durability", choices=DURABILITY_FLAGS.keys(), default="sync")
+    server_parser.set_defaults(func=bench_server)
+
+    args = arg_parser.parse_args()
+    args.func(args)
@@ -0,0 +1,72 @@
+import asyncio
+import argparse
+
+# line protocol: client sends statements of one input as a single line, server answers with number of lines followed by the lines
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5433
+
+
+def encode_response(lines):                                         # Response of server to one request line
+    return bytes(f"{len(lines)}\n" + "".join(line + "\n" for line in lines), "utf-8")
+
+async def read_response(reader):                                    # Read lines of one response
+    header = await reader.readline()
+    if not header:
+        raise ConnectionError("server closed connection")
+    return [(await reader.readline()).decode("utf-8").rstrip("\n") for _ in range(int(header))]
+
+class Client:                                                       # Connection to server (statements run in one session)
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        if socket_path is not None:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def execute(self, queries):                               # Run statements (separated by semicolon) and return lines of their output
+        self.writer.write(bytes(" ".join(queries.splitlines()) + "\n", "utf-8"))
+        await self.writer.drain()
+        return await read_response(self.reader)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def input_statements():                                             # Input lines until semicolon followed by enter (None on end of input)
+    input_lines = []
+    print("DB_2018-15001>", end=" ")                                # Show prompt message
+    while True:
+        try:
+            line = input()
+        except EOFError:
+            return None
+        input_lines.append(line)
+        if line.strip().endswith(";"):
+            return " ".join(input_lines)
+
+async def interact(args):                                           # Prompt loop sending input to server
+    client = await Client.connect(args.host, args.port, args.socket)
+    try:
+        while True:
+            queries = input_statements()
+            if queries is None or queries.strip()[:-1].strip().lower() == "exit":
+                break
+            for line in await client.execute(queries):
+                print(line)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":                                          # Connect to server started by server.py
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default=DEFAULT_HOST)
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--socket", help="unix socket path of server (instead of host and port)")
+    args = arg_parser.parse_args()
+
+    asyncio.run(interact(args))
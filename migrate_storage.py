@@ -0,0 +1,18 @@
+from run import Storage, migrate_storage_format, STORAGE_FORMATS
+import argparse
+
+
+if __name__ == "__main__":                                          # Convert records of existing database to given format
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("storage_format", choices=STORAGE_FORMATS)
+    arg_parser.add_argument("--db-path", default="myDB.db")
+    args = arg_parser.parse_args()
+
+    storage = Storage(args.db_path)
+    try:
+        storage.begin()                                             # records are converted all or nothing
+        record_count = migrate_storage_format(storage, args.storage_format)
+        storage.commit()
+    finally:                                                        # unfinished conversion is rolled back
+        storage.close()
+    print(f"{record_count} record(s) converted to {args.storage_format} format")
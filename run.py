@@ -1,12 +1,35 @@
-from lark import Lark, Transformer
+from lark import Lark, Transformer, Tree, Token
 from berkeleydb import db
 from json import dumps, loads
-from lark.exceptions import UnexpectedCharacters
+from lark.exceptions import UnexpectedInput
+import os
+import sys
+import struct
+import argparse
+import operator
+import csv
+import time
+import hashlib
+import math
+import random
+import threading
+import multiprocessing
+import re
+import heapq
+import pickle
+import tempfile
+from collections import OrderedDict, deque
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, compress, repeat
+from collections.abc import Iterator
 
 
 class MyTransformer(Transformer):                   # Transformer class
-    def __init__(self, db_path):
-        self.db_path = db_path
+    def __init__(self, storage, storage_format="json", catalog=None):
+        self.storage = storage                      # database handles shared across statements
+        self.storage_format = storage_format        # record format used when database is newly created (json, binary)
+        self.catalog = catalog if catalog else Catalog()    # table metadata cache shared across statements
         self.result = None
 
     def create_table_query(self, items):
@@ -25,7 +48,6 @@ class MyTransformer(Transformer):                   # Transformer class
         referencing_tables = []
         referencing_columns = []
         uuid = 0
-        record_ids = []
         is_pk_assigned = False
 
         for column_def in column_definitions:                                      # for each parsed column
@@ -93,6 +115,16 @@ class MyTransformer(Transformer):                   # Transformer class
                 referencing_tables.append(reference_table)
                 referencing_columns.append(reference_col)
 
+        table_storage = "row"
+        if items[4] is not None:                                                    # table options (WITH (storage = column))
+            for table_option in items[4].find_data('table_option'):
+                option_name, option_operator, option_value = [token.value.lower() for token in table_option.children]
+                # TableOptionError
+                if option_name != "storage" or option_operator != "=" or option_value not in TABLE_STORAGES:
+                    self.result = [True, f"Create table has failed: invalid table option '{option_name}'"]
+                    return
+                table_storage = option_value
+
         ########################################## things to put in database ##############################################
         # table_name                (table_list)    *append to table_list
         # column_names              (table_list/{table_name}/column_names)
@@ -105,44 +137,44 @@ class MyTransformer(Transformer):                   # Transformer class
         # col_is_pk                 (table_list/{table_name}/{column_name}/is_pk)
         # col_is_fk                 (table_list/{table_name}/{colomn_name}/is_fk)
         # uuid                      (table_list/{table_name}/uuid)
-        # record_ids                (table_list/{table_name}/record_ids)
+        # storage                   (table_list/{table_name}/storage)    *column tables only
+        # record ids are kept in record directory ({table_name}/{uuid} in record directory database)
         ########################################## things to put in database ##############################################
 
-        database = db.DB()
-        database.open(self.db_path, None, db.DB_HASH, db.DB_CREATE)             # Create database
+        database = self.storage.get_database(create=True)                      # Create database
+        self.catalog.refresh(database)
 
         # TableExistenceError
-        if b"table_list" in database.keys():
-            if table_name in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
-                self.result = [True, "Create table has failed: table with the same name already exists"]
-                return
+        if self.catalog.has_table(database, table_name):
+            self.result = [True, "Create table has failed: table with the same name already exists"]
+            return
             
         for i in range(len(referencing_tables)):
             # ReferenceTableExistenceError
-            if referencing_tables[i] not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+            reference_table = self.catalog.get_table(database, referencing_tables[i])
+            if reference_table is None:
                 self.result = [True, "Create table has failed: foreign key references non existing table"]
                 return
             
             # ReferenceColumnExistenceError
-            if referencing_columns[i] not in loads(database.get(bytes("table_list/" + referencing_tables[i] + "/column_names", "utf-8")).decode("utf-8")):    
+            if referencing_columns[i] not in reference_table.columns:
                 self.result = [True, "Create table has failed: foreign key references non existing column"]
                 return
             
             # ReferenceTypeError
-            if column_types[column_names.index(foreign_key_values[i])] != database.get(bytes("table_list/" + referencing_tables[i] + "/" + referencing_columns[i] + "/type", "utf-8")).decode("utf-8"):
+            if column_types[column_names.index(foreign_key_values[i])] != reference_table.columns[referencing_columns[i]].type:
                 self.result = [True, "Create table has failed: foreign key references wrong type"]
                 return
             
             # ReferenceNonPrimaryKeyError
-            if [referencing_columns[i]] != loads(database.get(bytes("table_list/" + referencing_tables[i] + "/primary_key", "utf-8")).decode("utf-8")):
+            if [referencing_columns[i]] != reference_table.primary_key:
                 self.result = [True, "Create table has failed: foreign key references non primary key column"]
                 return
 
-        if b"table_list" in database.keys():
-            table_list = loads(database.get(bytes("table_list", "utf-8")).decode("utf-8"))
-        else:
-            table_list = []                                                         # Create table list if not exists
-        table_list.append(table_name)
+        if database.get(b"table_list") is None and database.get(b"storage_format") is None:
+            database.put(b"storage_format", bytes(self.storage_format, "utf-8"))   # choose record format of new database
+        table_list = self.catalog.get_table_list(database) + [table_name]
+        self.storage.change_schema(table_name)
         # put table metadata in database
         database.put(bytes("table_list", "utf-8"), bytes(dumps(table_list), "utf-8"))
         database.put(bytes("table_list/" + table_name + "/column_names", "utf-8"), bytes(dumps(column_names), "utf-8"))
@@ -151,7 +183,9 @@ class MyTransformer(Transformer):                   # Transformer class
         database.put(bytes("table_list/" + table_name + "/referencing_columns", "utf-8"), bytes(dumps(referencing_columns), "utf-8"))
         database.put(bytes("table_list/" + table_name + "/foreign_key_values", "utf-8"), bytes(dumps(foreign_key_values), "utf-8"))
         database.put(bytes("table_list/" + table_name + "/uuid", "utf-8"), bytes(str(uuid), "utf-8"))
-        database.put(bytes("table_list/" + table_name + "/record_ids", "utf-8"), bytes(dumps(record_ids), "utf-8"))
+        database.put(bytes("table_list/" + table_name + "/row_count", "utf-8"), bytes(str(0), "utf-8"))
+        if table_storage != "row":
+            database.put(bytes("table_list/" + table_name + "/storage", "utf-8"), bytes(table_storage, "utf-8"))
         # put column metadata in database
         for i in range(len(column_names)):
             database.put(bytes("table_list/" + table_name + "/" + column_names[i] + "/type", "utf-8"), bytes(column_types[i], "utf-8"))
@@ -159,75 +193,155 @@ class MyTransformer(Transformer):                   # Transformer class
             database.put(bytes("table_list/" + table_name + "/" + column_names[i] + "/is_pk", "utf-8"), bytes(str(column_names[i] in primary_keys), "utf-8"))
             database.put(bytes("table_list/" + table_name + "/" + column_names[i] + "/is_fk", "utf-8"), bytes(str(column_names[i] in foreign_key_values), "utf-8"))
 
-        database.close()                                                        # Close database
+        # create sub-database holding records of table
+        self.storage.get_table_data(table_name)
+
+        # mark primary key index and reference counts of the new (empty) table as built
+        if primary_keys:
+            pk_index = self.storage.get_pk_index()
+            pk_index.put(encode_pk_key(table_name), b"")
+            fk_refs = self.storage.get_fk_refs()
+            fk_refs.put(encode_pk_key(table_name), b"")
+
+        self.catalog.bump_version(database)                                     # invalidate cached metadata
         self.result = [True, f"'{table_name}' table is created"]
         return 
 
+    def create_index_query(self, items):
+        index_name = items[2].children[0].value.lower()
+        table_name = items[4].children[0].value.lower()
+        column_name = items[6].children[0].value.lower()
+
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
+            self.result = [True, "No such table"]
+            return
+        self.catalog.refresh(database)
+
+        # NoSuchTable
+        table = self.catalog.get_table(database, table_name)
+        if table is None:
+            self.result = [True, "No such table"]
+            return
+
+        # IndexExistenceError
+        if self.catalog.find_index(database, index_name) is not None:
+            self.result = [True, "Create index has failed: index with the same name already exists"]
+            return
+
+        # IndexColumnExistenceError
+        if column_name not in table.columns:
+            self.result = [True, f"Create index has failed: '{column_name}' does not exist"]
+            return
+
+        # IndexColumnTableError (records of column table are found by min/max of chunks instead)
+        if table.storage == "column":
+            self.result = [True, f"Create index has failed: '{table_name}' is column table"]
+            return
+
+        # put index metadata in database, then build index from existing records
+        indexes = dict(table.indexes, **{index_name: column_name})
+        self.storage.change_schema(table_name)
+        database.put(bytes("table_list/" + table_name + "/indexes", "utf-8"), bytes(dumps(indexes), "utf-8"))
+        self.catalog.bump_version(database)                                 # invalidate cached metadata
+        self.storage.get_index(self.catalog.get_table(database, table_name), index_name)
+
+        self.result = [True, f"'{index_name}' index is created"]
+        return
+
+    def drop_index_query(self, items):
+        index_name = items[2].children[0].value.lower()
+
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
+            self.result = [True, "No such index"]
+            return
+        self.catalog.refresh(database)
+
+        # NoSuchIndex
+        table = self.catalog.find_index(database, index_name)
+        if table is None:
+            self.result = [True, "No such index"]
+            return
+
+        indexes = {name: column for name, column in table.indexes.items() if name != index_name}
+        self.storage.change_schema(table.name)
+        database.put(bytes("table_list/" + table.name + "/indexes", "utf-8"), bytes(dumps(indexes), "utf-8"))
+        self.storage.drop_index(index_name)
+        self.catalog.bump_version(database)                                 # invalidate cached metadata
+
+        self.result = [True, f"'{index_name}' index is dropped"]
+        return
+
     def drop_table_query(self, items):
 
         table_name = items[2].children[0].value.lower()
 
-        database = db.DB()
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # NoSuchFile
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
             self.result = [True, "No such table"]
             return
-        
-        cursor = database.cursor()                                          # Create cursor
-        x = cursor.first()                                                  # Get first key-value pair
+        self.catalog.refresh(database)
 
         # NoSuchTable
-        if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+        table = self.catalog.get_table(database, table_name)
+        if table is None:
             self.result = [True, "No such table"]
             return
         
         # DropReferencedTableError
-        while x is not None:
-            if x[0].endswith(b"/referencing_tables"):
-                if table_name in loads(x[1].decode("utf-8")):
-                    self.result = [True, f"Drop table has failed: '{table_name}' is referenced by other table"]
-                    return
-            x = cursor.next()
+        if self.catalog.get_referenced_by(database, table_name):
+            self.result = [True, f"Drop table has failed: '{table_name}' is referenced by other table"]
+            return
 
-        # delete all data related to given table
-        x = cursor.first()
-        while x is not None:
-            if x[0].startswith(bytes("table_list/" + table_name, "utf-8")):
-                database.delete(x[0])
-            x = cursor.next()
+        # delete all records of given table at once by removing its sub-database
+        self.storage.change_schema(table_name)
+        self.storage.drop_table_data(table)
+
+        # delete metadata of given table from catalog
+        for key in get_table_schema_keys(table):
+            if database.exists(key):
+                database.delete(key)
 
         # delete table from table list
-        table_list = loads(database.get(bytes("table_list", "utf-8")).decode("utf-8"))
-        table_list.remove(table_name)
+        table_list = [table for table in self.catalog.get_table_list(database) if table != table_name]
         database.put(bytes("table_list", "utf-8"), bytes(dumps(table_list), "utf-8"))
 
-        cursor.close()                                                        # Close cursor
-        database.close()                                                      # Close database
+        # delete primary key index entries of given table
+        pk_index = self.storage.get_pk_index()
+        drop_pk_index(pk_index, table_name)
+
+        # delete record directory entries of given table
+        directory = self.storage.get_directory()
+        drop_record_directory(directory, table_name)
+
+        # reference counts of tables referenced by given table are rebuilt when they are needed next
+        fk_refs = self.storage.get_fk_refs()
+        for referencing_table in set(table.referencing_tables + [table_name]):
+            drop_fk_refs(fk_refs, referencing_table)
+
+        self.catalog.bump_version(database)                                 # invalidate cached metadata
         self.result = [True, f"'{table_name}' table is dropped"]
         return
     
     def desc_query(self, items):
         table_name = items[1].children[0].value.lower()
 
-        database = db.DB()
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # NoSuchFile
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
             self.result = [True, "No such table"]
             return
+        self.catalog.refresh(database)
 
         # NoSuchTable
-        if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+        table = self.catalog.get_table(database, table_name)
+        if table is None:
             self.result = [True, "No such table"]
             return
-        
-        column_names = loads(database.get(bytes("table_list/" + table_name + "/column_names", "utf-8")).decode("utf-8"))
 
         # print formatted table info.
-        result = print_table_schema(table_name, column_names, database)
+        result = print_table_schema(table)
 
-        database.close()                                                    # Close database
         self.result = [False, result]
         return
     
@@ -235,22 +349,15 @@ class MyTransformer(Transformer):                   # Transformer class
         seperator = "-" * 24
         result = seperator + "\n"
 
-        database = db.DB()
+        database = self.storage.get_database()                              # Open database
 
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        
-            # print table list if exists
-            if b"table_list" in database.keys():
-                table_list = loads(database.get(bytes("table_list", "utf-8")).decode("utf-8"))
-                for table in table_list:
-                    result += table + "\n"
-
-            database.close()                                                    # Close database
-            result += seperator
-            
-        except db.DBNoSuchFileError:                                        # NoSuchFile
-            result += seperator
+        # print table list if exists
+        if database is not None:
+            self.catalog.refresh(database)
+            for table in self.catalog.get_table_list(database):
+                result += table + "\n"
+
+        result += seperator
 
         self.result = [False, result]
         return
@@ -258,798 +365,2906 @@ class MyTransformer(Transformer):                   # Transformer class
     def describe_query(self, items):
         table_name = items[1].children[0].value.lower()
 
-        database = db.DB()
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # NoSuchFile
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
             self.result = [True, "No such table"]
             return
+        self.catalog.refresh(database)
 
         # NoSuchTable
-        if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+        table = self.catalog.get_table(database, table_name)
+        if table is None:
             self.result = [True, "No such table"]
             return
-        
-        column_names = loads(database.get(bytes("table_list/" + table_name + "/column_names", "utf-8")).decode("utf-8"))
 
         # print formatted table info.
-        result = print_table_schema(table_name, column_names, database)
+        result = print_table_schema(table)
 
-        database.close()                                                    # Close database
         self.result = [False, result]
         return
     
     def explain_query(self, items):
         table_name = items[1].children[0].value.lower()
 
-        database = db.DB()
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # NoSuchFile
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
             self.result = [True, "No such table"]
             return
+        self.catalog.refresh(database)
 
         # NoSuchTable
-        if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+        table = self.catalog.get_table(database, table_name)
+        if table is None:
             self.result = [True, "No such table"]
             return
-        
-        column_names = loads(database.get(bytes("table_list/" + table_name + "/column_names", "utf-8")).decode("utf-8"))
 
         # print formatted table info.
-        result = print_table_schema(table_name, column_names, database)
+        result = print_table_schema(table)
 
-        database.close()                                                    # Close database
         self.result = [False, result]
         return
     
     def select_query(self, items):
-        database = db.DB()
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # SelectDBExistenceError(CustomError)
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # SelectDBExistenceError(CustomError)
             self.result = [True, f"Selection has failed: database does not exist"]
             return
+        self.catalog.refresh(database)
         
         # get table names
         table_names = []
         cartesian_column_names = []
         column_in_which_table = dict()
+        column_types = dict()
+        tables = dict()
 
         for table in items[2].children[0].find_data('table_name'):
             table_name = table.children[0].value.lower()
 
             # SelectTableExistenceError
-            if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+            tables[table_name] = self.catalog.get_table(database, table_name)
+            if tables[table_name] is None:
                 self.result = [True, f"Selection has failed: '{table_name}' does not exist"]
                 return
             
             table_names.append(table.children[0].value.lower())
 
             # put all column names in cartesian_column_names
-            column_names = loads(database.get(bytes("table_list/" + table_name + "/column_names", "utf-8")).decode("utf-8"))
-            for column_name in column_names:
+            for column_name in tables[table_name].column_names:
                 if column_in_which_table.get(column_name) != None:
                     column_in_which_table[column_name].append(table_name)
                 else:
                     column_in_which_table[column_name] = [table_name]
                 cartesian_column_names.append(table_name + "." + column_name)
+                column_types[table_name + "." + column_name] = tables[table_name].columns[column_name].type
 
-        # make cartesian product of tables
-        cartesian_product = []
-
-        if len(table_names) == 1:                                       # if only one table is given
-            table_name = table_names[0]
-            record_ids = loads(database.get(bytes("table_list/" + table_name + "/record_ids", "utf-8")).decode("utf-8"))
-
-            if record_ids:                                              # if table is not empty
-                for record_id in record_ids:
-                    record = loads(database.get(bytes("table_list/" + table_name + "/" + str(record_id), "utf-8")).decode("utf-8"))
-                    cartesian_product.append(record)
-
-        elif len(table_names) == 2:                                     # if two tables are given
-            table_name1 = table_names[0]
-            table_name2 = table_names[1]
-            record_ids1 = loads(database.get(bytes("table_list/" + table_name1 + "/record_ids", "utf-8")).decode("utf-8"))
-            record_ids2 = loads(database.get(bytes("table_list/" + table_name2 + "/record_ids", "utf-8")).decode("utf-8"))
-            
-            if record_ids1 and record_ids2:                             # if both tables are not empty
-                for record_id1 in record_ids1:
-                    for record_id2 in record_ids2:
-                        record1 = loads(database.get(bytes("table_list/" + table_name1 + "/" + str(record_id1), "utf-8")).decode("utf-8"))
-                        record2 = loads(database.get(bytes("table_list/" + table_name2 + "/" + str(record_id2), "utf-8")).decode("utf-8"))
-                        record = {**record1, **record2}
-                        cartesian_product.append(record)
-
-        else:                                                           # if three tables are given
-            table_name1 = table_names[0]
-            table_name2 = table_names[1]
-            table_name3 = table_names[2]
-            record_ids1 = loads(database.get(bytes("table_list/" + table_name1 + "/record_ids", "utf-8")).decode("utf-8"))
-            record_ids2 = loads(database.get(bytes("table_list/" + table_name2 + "/record_ids", "utf-8")).decode("utf-8"))
-            record_ids3 = loads(database.get(bytes("table_list/" + table_name3 + "/record_ids", "utf-8")).decode("utf-8"))
-            
-            if record_ids1 and record_ids2 and record_ids3:             # if all tables are not empty
-                for record_id1 in record_ids1:
-                    for record_id2 in record_ids2:
-                        for record_id3 in record_ids3:
-                            record1 = loads(database.get(bytes("table_list/" + table_name1 + "/" + str(record_id1), "utf-8")).decode("utf-8"))
-                            record2 = loads(database.get(bytes("table_list/" + table_name2 + "/" + str(record_id2), "utf-8")).decode("utf-8"))
-                            record3 = loads(database.get(bytes("table_list/" + table_name3 + "/" + str(record_id3), "utf-8")).decode("utf-8"))
-                            record = {**record1, **record2, **record3}
-                            cartesian_product.append(record)
-
-        # get where clause
-        where_clause = items[2].children[1]
-        selected_records = []
-
-        if where_clause is None:                                        # select all records
-            selected_records = cartesian_product
-        else:                                                           # select records that satisfy where clause
-            # determine condition
-            boolean_terms = list(where_clause.find_data('boolean_term'))
-            boolean_factors = list(where_clause.find_data('boolean_factor'))
-            predicate_list = []
-
-            # check logical condition
-            log_con = "or" if len(boolean_terms) == 2 else "and" if len(boolean_factors) == 2 else "single"
-            
-            # parse predicates
-            for boolean_factor in boolean_factors:
-                expr_negation = True if boolean_factor.children[0] else False
-                predicate = list(boolean_factor.find_data('predicate'))
-
-                consequent_table_name = None
-                consequent_column_name = None
-
-                is_null_predicate = False
-                is_comparison_with_column = False
-
-                if predicate[0].children[0].data == "comparison_predicate":             # comparison predicate
-                    first_operand = predicate[0].children[0].children[0]
-                    antecedent_table_name = first_operand.children[0].children[0].value.lower() if first_operand.children[0] else None
-                    antecedent_column_name = first_operand.children[1].children[0].value.lower()
-
-                    operator = predicate[0].children[0].children[1].value
-
-                    second_operand = predicate[0].children[0].children[2]
-
-                    # case: compare with column
-                    if not second_operand.children[0] or second_operand.children[0].data != "comparable_value":
-                        is_comparison_with_column = True
-                        
-                        consequent_table_name = second_operand.children[0].children[0].value.lower() if second_operand.children[0] else None
-                        consequent_column_name = second_operand.children[1].children[0].value.lower()
+        # compile where clause into predicates (conjuncts of where clause)
+        try:
+            predicates = parse_where_clause(items[2].children[1], table_names, column_in_which_table, column_types)
+        except QueryError as e:
+            self.result = [True, str(e)]
+            return
 
-                    # case: compare with value
+        # get select columns and aggregates (select list), and group by columns
+        group_by_clause = items[2].children[2]
+        aggregates = []
+        output = []                                                     # (True, index of aggregate) or (False, "table.column") of each select item
+        try:
+            group_column_names = [] if group_by_clause is None else [
+                resolve_select_column(group_column.children[0], group_column.children[1], column_in_which_table, column_types)
+                for group_column in group_by_clause.find_data('group_column')
+            ]
+            if not items[1].children:                                   # select *
+                select_column_names = cartesian_column_names
+                output = [(False, col_name) for col_name in cartesian_column_names]
+            else:                                                       # select column_name, aggregate(column_name)
+                select_column_names = []
+                for select_item in items[1].children:
+                    if select_item.data == 'aggregate':
+                        aggregate = make_aggregate(select_item, column_in_which_table, column_types)
+                        output.append((True, len(aggregates)))
+                        aggregates.append(aggregate)
+                        select_column_names.append(aggregate.label)
+                        column_types[aggregate.label] = aggregate.type
                     else:
-                        comparable_value = second_operand.children[0].children[0].value
-                        comparable_value_type = second_operand.children[0].children[0].type.lower()
-                
-                else:                                                                   # null predicate
-                    is_null_predicate = True
-                    antecedent_table_name = predicate[0].children[0].children[0].children[0].value.lower() if predicate[0].children[0].children[0] else None
-                    antecedent_column_name = predicate[0].children[0].children[1].children[0].value.lower()
-                    null_negation = True if predicate[0].children[0].children[2].children[1] else False
-
-                    operator = "is not" if null_negation else "is"
+                        col_name = resolve_select_column(select_item.children[0], select_item.children[1], column_in_which_table, column_types)
+                        output.append((False, col_name))
+                        select_column_names.append(col_name)
+        except QueryError as e:
+            self.result = [True, str(e)]
+            return
 
-                # WhereTableNotSpecified
-                if antecedent_table_name and antecedent_table_name not in table_names:
-                    self.result = [True, f"Where clause trying to reference tables which are not specified"]
-                    return
-                if consequent_table_name and consequent_table_name not in table_names:
-                    self.result = [True, f"Where clause trying to reference tables which are not specified"]
-                    return
-                
-                # compare to null with operators other than is/is not
-                if consequent_column_name == "null":
-                    self.result = [True, "Where clause trying to compare incomparable values"]
-                    return
-                
-                # WhereColumnNotExist
-                if not antecedent_table_name and antecedent_column_name not in column_in_which_table:
-                    self.result = [True, f"Where clause trying to reference non existing column"]
-                    return
-                if antecedent_table_name and antecedent_table_name + "." + antecedent_column_name not in cartesian_column_names:
-                    self.result = [True, f"Where clause trying to reference non existing column"]
-                    return
-                if not consequent_table_name and consequent_column_name and consequent_column_name not in column_in_which_table:
-                    self.result = [True, f"Where clause trying to reference non existing column"]
-                    return
-                if consequent_table_name and consequent_table_name + "." + consequent_column_name not in cartesian_column_names:
-                    self.result = [True, f"Where clause trying to reference non existing column"]
-                    return
-                
-                # WhereAmbiguousReference
-                if not antecedent_table_name and antecedent_column_name in column_in_which_table and len(column_in_which_table[antecedent_column_name]) != 1:
-                    self.result = [True, f"Where clause contains ambiguous reference"]
-                    return
-                if not consequent_table_name and consequent_column_name in column_in_which_table and len(column_in_which_table[consequent_column_name]) != 1:
-                    self.result = [True, f"Where clause contains ambiguous reference"]
+        # SelectGroupByError: with aggregates or group by, selected column needs single value per group
+        if aggregates or group_column_names:
+            for is_aggregate, col_name in output:
+                if not is_aggregate and col_name not in group_column_names:
+                    self.result = [True, f"Selection has failed: '{col_name}' must appear in group by clause"]
                     return
-
-                # clarify table name if ambiguous
-                antecedent_table_name = antecedent_table_name if antecedent_table_name else column_in_which_table[antecedent_column_name][0]
-
-                antecedent_col_type = database.get(bytes("table_list/" + antecedent_table_name + "/" + antecedent_column_name + "/type", "utf-8")).decode("utf-8")
-                
-                if antecedent_col_type.startswith("char"):
-                    antecedent_col_type = "char"
-                
-                # WhereIncomparableError
-                if not is_null_predicate:
-
-                    if is_comparison_with_column:
-                        consequent_table_name = consequent_table_name if consequent_table_name else column_in_which_table[consequent_column_name][0]
-                    
-                        # compare to null with operators other than is/is not
-                        if consequent_column_name == "null":
-                            self.result = [True, "Where clause trying to compare incomparable values"]
-                            return
-                    
-                    # classify case whether comparing with column or value
-                    consequent_col_type = (
-                        database.get(bytes(f"table_list/{consequent_table_name}/{consequent_column_name}/type", "utf-8"))
-                        .decode("utf-8") if is_comparison_with_column else comparable_value_type
-                    )
-
-                    if consequent_col_type.startswith("char"):
-                        consequent_col_type = "char"
-
-                    # check type constraint between antecedent and consequent
-                    type_constraints = {"char": {"str", "char"}, "int": {"int"}, "date": {"date"}}
-
-                    if antecedent_col_type not in type_constraints or (consequent_col_type not in type_constraints and consequent_col_type != "str"):
-                        self.result = [True, "Where clause trying to compare incomparable values"]
-                        return
-
-                    if not type_constraints[antecedent_col_type].intersection({consequent_col_type}):
-                        self.result = [True, "Where clause trying to compare incomparable values"]
-                        return
-                                 
-                    if antecedent_col_type == "char":
-                        if operator not in ["=", "!="]:
-                            self.result = [True, "Where clause trying to compare incomparable values"]
-                            return
-                        if not is_comparison_with_column:
-                            comparable_value = comparable_value[1:-1]                         # remove quotes
-
-                # set consequent      
-                if is_null_predicate:
-                    consequent = None
-                elif is_comparison_with_column:
-                    consequent = [consequent_table_name, consequent_col_type, consequent_column_name]
-                else:
-                    consequent = [comparable_value, comparable_value_type]
-
-                predicate_list.append([expr_negation, [antecedent_table_name, antecedent_column_name, antecedent_col_type], operator, consequent])
-            
-            for record in cartesian_product:
-                if log_con == "single":
-                    if check_predicate_condition(predicate_list[0], record):
-                        selected_records.append(record)
-                elif log_con == "and":
-                    if check_predicate_condition(predicate_list[0], record) and check_predicate_condition(predicate_list[1], record):
-                        selected_records.append(record)
-                else:
-                    if check_predicate_condition(predicate_list[0], record) or check_predicate_condition(predicate_list[1], record):
-                        selected_records.append(record)
-
-        # get select columns                                          
-        if not items[1].children:                                       # select *
-            select_column_names = cartesian_column_names
-        else:                                                           # select column_name
-            select_column_names = []
-            for select_column in items[1].find_data('selected_column'):
-                selected_table_name = select_column.children[0].children[0].value.lower() if select_column.children[0] else None
-                selected_column_name = select_column.children[1].children[0].value.lower()
-                
-                # SelectColumnResolveError
-                if selected_table_name:                                 # if table name is specified
-                    candidate_column_name = selected_table_name + "." + selected_column_name
-                    if candidate_column_name not in cartesian_column_names:
-                        self.result = [True, f"Selection has failed: fail to resolve '{selected_table_name}.{selected_column_name}'"]
-                        return
-                else:                                                   # if table name is ambiguous
-                    column_existence = column_in_which_table.get(selected_column_name)
-                    if not column_existence or len(column_existence) > 1:
-                        self.result = [True, f"Selection has failed: fail to resolve '{selected_column_name}'"]
-                        return
-                    
-                    # assign proper table name to selected_table_name
-                    selected_table_name = column_existence[0]
-                    
-                select_column_names.append(selected_table_name + "." + selected_column_name)
-
-        # calculate max length of each column(including column name) to align columns
-        max_col_width_list = [18 for _ in range(len(select_column_names))]
-        for idx, col_name in enumerate(select_column_names):
-            max_col_width_list[idx] = max(max_col_width_list[idx], len(col_name))
-            for record in selected_records:
-                value = record[col_name] if record[col_name] else "NULL"
-                max_col_width_list[idx] = max(max_col_width_list[idx], len(str(value)))
-
-        # assign formatted table to self.result
-        result = print_table_select(select_column_names, selected_records, max_col_width_list)
-
-        database.close()                                                    # Close database
-        self.result = [False, result]
-        return
-    
-    def insert_query(self, items):
-        table_name = items[2].children[0].value.lower()
-        nullable_values = items[5].find_data('nullable_value')
-
-        database = db.DB()
+            output = [(is_aggregate, item if is_aggregate else group_column_names.index(item)) for is_aggregate, item in output]
+
+        # get sort keys (order by) and limit, order by column which is not selected is carried after selected columns until rows are sorted
+        grouped = bool(aggregates or group_column_names)
+        order_by_clause, limit_clause = items[2].children[3], items[2].children[4]
+        row_column_names = list(select_column_names)                    # columns of rows produced by plan (without group by)
+        labels = [aggregate.label for aggregate in aggregates]
+        sort_keys = []                                                  # (position in row, descending) of each order by column
+        order_keys = []                                                 # ("table.column" or aggregate name, descending) of each order by column
+        limit = None
         try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # NoSuchFile
-            self.result = [True, "No such table"]
+            for sort_key in [] if order_by_clause is None else order_by_clause.find_data('sort_key'):
+                descending = sort_key.children[2] is not None and sort_key.children[2].type == "DESC"
+                column_name = sort_key.children[1].children[0].value.lower()
+                if grouped and not sort_key.children[0] and column_name in labels:     # name given to aggregate by as
+                    col_name = column_name
+                    position = output.index((True, labels.index(column_name)))
+                else:
+                    col_name = resolve_select_column(sort_key.children[0], sort_key.children[1], column_in_which_table, column_types)
+                    if grouped:
+                        # SelectGroupByError
+                        if col_name not in group_column_names:
+                            raise QueryError(f"Selection has failed: '{col_name}' must appear in group by clause")
+                        if (False, group_column_names.index(col_name)) not in output:
+                            output.append((False, group_column_names.index(col_name)))
+                        position = output.index((False, group_column_names.index(col_name)))
+                    else:
+                        if col_name not in row_column_names:
+                            row_column_names.append(col_name)
+                        position = row_column_names.index(col_name)
+                sort_keys.append((position, descending))
+                order_keys.append((col_name, descending))
+
+            if limit_clause is not None:
+                # SelectLimitError
+                token = limit_clause.children[1]
+                if token.type != "INT" or int(token.value) < 0:
+                    raise QueryError("Selection has failed: limit needs non-negative int value")
+                limit = int(token.value)
+        except QueryError as e:
+            self.result = [True, str(e)]
             return
+        width = len(select_column_names) if len(output if grouped else row_column_names) > len(select_column_names) else None
+        sort_text = ", ".join(col_name + (" desc" if descending else "") for col_name, descending in order_keys)
+
+        # calculate width of each column from its name and type, so that rows can be printed as soon as they are produced
+        max_col_width_list = [get_column_width(col_name, column_types[col_name]) for col_name in select_column_names]
+
+        # plan pipeline: access path -> filter -> join -> project (rows flow one at a time through operators)
+        # aggregate keeps one accumulator per group and yields rows once its input is consumed, sort holds rows until last one
+        plan = None
+        if order_keys and not grouped and len(table_names) == 1:        # records read in primary key or index order are not sorted
+            plan = plan_ordered_select(self.storage, tables[table_names[0]], predicates, select_column_names, order_keys, limit)
+        if plan is None:
+            if grouped:
+                plan = plan_aggregate(self.storage, tables, table_names, predicates, group_column_names, aggregates, output)
+            else:
+                plan = plan_select(self.storage, tables, table_names, predicates, row_column_names)
+            plan = plan_order(self.storage, plan, sort_keys, sort_text, limit, width)
+        result = render_table_select(select_column_names, plan.execute(), max_col_width_list)
 
-        # NoSuchTable
-        if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
-            self.result = [True, "No such table"]
+        self.result = [False, result]                                       # rows are streamed when result is printed
+        return plan                                                         # plan is used by explain when select is part of it
+    
+    def explain_select_query(self, items):
+        analyze = items[1] is not None
+        plan = items[2]                                                     # plan returned by select_query
+        if plan is None:                                                    # select has failed (its error is kept as result)
             return
 
-        ########################################## things to put in database ##############################################
-        # record_dict                (table_list/{table_name}/{uuid})
-        # uuid                       (table_list/{table_name}/uuid)
-        # record_ids                 (table_list/{table_name}/record_ids)
-        ########################################## things to put in database ##############################################
-
-        table_column_names = loads(database.get(bytes("table_list/" + table_name + "/column_names", "utf-8")).decode("utf-8"))
-        value_list = []
-        value_types = []
+        if analyze:                                                         # run query to fill actual rows and time of each operator
+            start = time.perf_counter()
+            for _ in plan.execute(analyze=True):
+                pass
+            elapsed = time.perf_counter() - start
 
-        # parse column names from input query if exists
-        column_names = []
+        lines = list(render_plan(plan, analyze))
+        if analyze:
+            lines.append(f"Execution time: {elapsed * 1000:.3f} ms")
+        self.result = [False, "\n".join(lines)]
+        return
 
-        if items[3] == None:
-            column_names = table_column_names
-        else:
-            insert_columns = items[3].find_data('column_name')
-            for insert_column in insert_columns:
-                column_names.append(insert_column.children[0].value.lower())
-
-        # append each parsed value to value list
-        for nullable_value in nullable_values:
-            if nullable_value.children[0] == "null":                        # store null values as None
-                value = None
-                value_type = "null"
-            else:
-                value = nullable_value.children[0].children[0].value
-                value_type = nullable_value.children[0].children[0].type.lower()
-            value_types.append(value_type)                                  # store value type
-            value_list.append(value)                                        # store value
-
-        # InsertTypeMismatchError (column # != value #)
-        if len(column_names) != len(value_list):
-            self.result = [True, "Insertion has failed: Types are not matched"]
+    def analyze_query(self, items):
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
+            self.result = [True, "No such table"] if items[1] is not None else [True, "0 table(s) analyzed"]
             return
+        self.catalog.refresh(database)
 
-        record_dict = {}
-
-        for idx, col_name in enumerate(column_names):
-            # InsertColumnExistenceError
-            if col_name not in table_column_names:
-                self.result = [True, f"Insertion has failed: '{col_name}' does not exist"]
+        if items[1] is not None:
+            table_names = [items[1].children[0].value.lower()]
+            # NoSuchTable
+            if not self.catalog.has_table(database, table_names[0]):
+                self.result = [True, "No such table"]
                 return
+        else:                                                               # analyze every table
+            table_names = self.catalog.get_table_list(database)
+
+        # scan each table once, store its statistics next to its metadata and correct its row count
+        for table_name in table_names:
+            statistics = analyze_table(self.storage, self.catalog.get_table(database, table_name))
+            database.put(bytes("table_list/" + table_name + "/statistics", "utf-8"), bytes(dumps(statistics), "utf-8"))
+            set_row_count(database, table_name, statistics["row_count"])
+        self.catalog.bump_version(database)                                 # invalidate cached metadata
+
+        if items[1] is not None:
+            self.result = [True, f"'{table_names[0]}' table is analyzed"]
+        else:
+            self.result = [True, f"{len(table_names)} table(s) analyzed"]
+        return
 
-            col_type = database.get(bytes("table_list/" + table_name + "/" + col_name + "/type", "utf-8")).decode("utf-8")
-
-            # InsertTypeMismatchError (column type != value type)
-            if value_types[idx] != "null":
-                if col_type.startswith("char"):
-                    if value_types[idx] != "str":
-                        self.result = [True, "Insertion has failed: Types are not matched"]
-                        return
-                elif col_type != value_types[idx]:
-                    self.result = [True, "Insertion has failed: Types are not matched"]
-                    return
-            
-            # InsertColumnNonNullableError
-            elif database.get(bytes("table_list/" + table_name + "/" + col_name + "/is_nullable", "utf-8")).decode("utf-8") == "False":
-                self.result = [True, f"Insertion has failed: '{col_name}' is not nullable"]
-                return
-                
-            # InsertReferentialIntegrityError
-            if database.get(bytes("table_list/" + table_name + "/" + col_name + "/is_fk", "utf-8")).decode("utf-8") == "True":
-                value = value_list[idx]
-                foreign_key_values = []
-                
-                foreign_key_index = loads(database.get(bytes("table_list/" + table_name + "/foreign_key_values", "utf-8")).decode("utf-8")).index(col_name)
-                
-                referencing_tables = loads(database.get(bytes("table_list/" + table_name + "/referencing_tables", "utf-8")).decode("utf-8"))
-                referencing_columns = loads(database.get(bytes("table_list/" + table_name + "/referencing_columns", "utf-8")).decode("utf-8"))
-                
-                referencing_table_name = referencing_tables[foreign_key_index]
-                referencing_column_name = referencing_columns[foreign_key_index]
-
-                ref_record_ids = loads(database.get(bytes("table_list/" + referencing_table_name + "/record_ids", "utf-8")).decode("utf-8"))
-                for record_id in ref_record_ids:
-                    record = loads(database.get(bytes("table_list/" + referencing_table_name + "/" + str(record_id), "utf-8")).decode("utf-8"))
-                    foreign_key_values.append(record[f"{referencing_table_name}.{referencing_column_name}"])
+    def begin_query(self, items):
+        # TransactionInProgressError
+        if self.storage.txn is not None:
+            self.result = [True, "Begin has failed: transaction is already in progress"]
+            return
+        self.storage.begin()
+        self.result = [True, "Transaction started"]
+        return
 
-                if value_types[idx] == "str":
-                    value = value[1:-1]                                     # Remove quotes
-                elif value_types[idx] == "int":
-                    value = int(value)
+    def commit_query(self, items):
+        # NoTransactionError
+        if self.storage.txn is None:
+            self.result = [True, "Commit has failed: no transaction in progress"]
+            return
+        self.storage.commit()                                               # log is flushed once for all statements of transaction
+        self.result = [True, "Transaction committed"]
+        return
 
-                if value not in foreign_key_values:
-                    self.result = [True, "Insertion has failed: Referential integrity violation"]
-                    return
+    def rollback_query(self, items):
+        # NoTransactionError
+        if self.storage.txn is None:
+            self.result = [True, "Rollback has failed: no transaction in progress"]
+            return
+        self.storage.abort()
+        self.catalog.invalidate()                                           # metadata changed in transaction is discarded
+        self.result = [True, "Transaction rolled back"]
+        return
 
-            # typecasting value
-            if value_types[idx] != "null":
-                if col_type.startswith("char"):
-                    insert_value = value_list[idx][1:-1]                    # Remove quotes
-                    length_constraint = int(col_type[5:-1])
-                    if len(insert_value) > length_constraint:               # Truncate value if it exceeds length constraint                                        
-                        insert_value = insert_value[:length_constraint]
-                elif col_type == "int":
-                    insert_value = int(value_list[idx])
-                elif col_type == "date":
-                    insert_value = value_list[idx]
-            else:
-                insert_value = None            
+    def insert_query(self, items):
+        table_name = items[2].children[0].value.lower()
+        value_lists = [item for item in items[5:] if isinstance(item, Tree)]
 
-            record_dict[table_name + "." + col_name] = insert_value                                   # put each key-value pair in record_dict
-        
-        primary_keys = loads(database.get(bytes("table_list/" + table_name + "/primary_key", "utf-8")).decode("utf-8"))
-        record_ids = loads(database.get(bytes("table_list/" + table_name + "/record_ids", "utf-8")).decode("utf-8"))
+        # parse column names from input query if exists
+        column_names = None
+        if items[3] != None:
+            column_names = [insert_column.children[0].value.lower() for insert_column in items[3].find_data('column_name')]
 
-        # InsertDuplicatePrimaryKeyError
-        for record_id in record_ids:
-            record = loads(database.get(bytes("table_list/" + table_name + "/" + str(record_id), "utf-8")).decode("utf-8"))
+        # parse each value list into row of (value, value type) pairs
+        rows = [parse_value_list(value_list) for value_list in value_lists]
 
-            is_pk_assigned = []
+        try:
+            count = insert_records(self.storage, self.catalog, table_name, column_names, rows)
+        except QueryError as e:
+            self.result = [True, str(e)]
+            return
 
-            for pk in primary_keys:
-                if record_dict[table_name + "." + pk] == record[table_name + "." + pk]:
-                    is_pk_assigned.append(True)
-                else:
-                    is_pk_assigned.append(False)
+        self.result = [True, "1 row inserted" if count == 1 else f"{count} rows inserted"]
+        return
 
-            if len(is_pk_assigned) > 0 and all(is_pk_assigned):
-                self.result = [True, "Insertion has failed: Primary key duplication"]
-                return
-        
-        # put null to columns that are not given in input query
-        empty_column_names = list(set(table_column_names).difference(set(column_names)))
-        if len(empty_column_names) > 0:
-            for col_name in empty_column_names:
-                # InsertColumnNonNullableError
-                if database.get(bytes("table_list/" + table_name + "/" + col_name + "/is_nullable", "utf-8")).decode("utf-8") == "False":
-                    self.result = [True, f"Insertion has failed: '{col_name}' is not nullable"]
-                    return
-                record_dict[table_name + "." + col_name] = None
+    def copy_query(self, items):
+        table_name = items[1].children[0].value.lower()
+        file_path = items[4].value[1:-1]                                    # Remove quotes
 
-        # store record_dict in database
-        uuid = int(database.get(bytes("table_list/" + table_name + "/uuid", "utf-8")).decode("utf-8"))
-        database.put(bytes("table_list/" + table_name + "/" + str(uuid), "utf-8"), bytes(dumps(record_dict), "utf-8"))
+        column_names = None
+        if items[2] != None:
+            column_names = [copy_column.children[0].value.lower() for copy_column in items[2].find_data('column_name')]
 
-        # update record_ids
-        record_ids.append(uuid)
-        database.put(bytes("table_list/" + table_name + "/record_ids", "utf-8"), bytes(dumps(record_ids), "utf-8"))
+        # CopyFileExistenceError
+        if not os.path.isfile(file_path):
+            self.result = [True, f"Copy has failed: '{file_path}' does not exist"]
+            return
 
-        # update uuid
-        uuid += 1
-        database.put(bytes("table_list/" + table_name + "/uuid", "utf-8"), bytes(str(uuid), "utf-8"))
+        try:
+            with open(file_path, newline="") as csv_file:
+                count = insert_records(self.storage, self.catalog, table_name, column_names, csv.reader(csv_file), from_csv=True)
+        except QueryError as e:
+            self.result = [True, str(e)]
+            return
 
-        database.close()                                                    # Close database
-        self.result = [True, "1 row inserted"]
+        self.result = [True, f"{count} row(s) copied"]
         return
     
     def delete_query(self, items):
         table_name = items[2].children[0].value.lower()
         where_clause = items[3]
 
-        database = db.DB()
-        try:
-            database.open(self.db_path, None, db.DB_HASH)                   # Open database
-        except db.DBNoSuchFileError:                                        # NoSuchFile
+        database = self.storage.get_database()                              # Open database
+        if database is None:                                                # NoSuchFile
             self.result = [True, "No such table"]
             return
         
+        self.catalog.refresh(database)
+        
         # NoSuchTable
-        if b"table_list" not in database.keys() or table_name not in loads(database.get(bytes("table_list", "utf-8")).decode("utf-8")):
+        table = self.catalog.get_table(database, table_name)
+        if table is None:
             self.result = [True, "No such table"]
             return
         
-        cursor = database.cursor()                                          # Create cursor
-        x = cursor.first()
-
-        delete_uuids = []
-        record_ids = loads(database.get(bytes("table_list/" + table_name + "/record_ids", "utf-8")).decode("utf-8"))
-
-        if where_clause is None:                                            # delete all records
-            delete_uuids = record_ids
+        directory = self.storage.get_directory()
+        table_data = self.storage.get_table_data(table_name)
+        pk_index = self.storage.get_pk_index() if table.primary_key else None
+        if pk_index is not None:
+            build_pk_index(self.storage, table)
 
-        else:                                                               # delete records that satisfy where clause
-            # determine condition
-            boolean_terms = list(where_clause.find_data('boolean_term'))
-            boolean_factors = list(where_clause.find_data('boolean_factor'))
-            predicate_list = []
+        # compile where clause into predicate
+        try:
+            column_in_which_table = {column_name: [table_name] for column_name in table.column_names}
+            column_types = {table_name + "." + column_name: table.columns[column_name].type for column_name in table.column_names}
+            predicates = parse_where_clause(where_clause, [table_name], column_in_which_table, column_types)
+        except QueryError as e:
+            self.result = [True, str(e)]
+            return
+        check = combine_predicates(predicates)
 
-            # check logical condition
-            log_con = "or" if len(boolean_terms) == 2 else "and" if len(boolean_factors) == 2 else "single"
+        # candidate records are found through primary key or secondary index when where clause allows it
+        access_path = choose_access_path(table, predicates)
 
-            # parse predicates
-            for boolean_factor in boolean_factors:
-                expr_negation = True if boolean_factor.children[0] else False
-                predicate = list(boolean_factor.find_data('predicate'))
+        # get records that satisfy predicate condition
+        delete_records = []                                                 # [(uuid, record)]
+        if use_parallel_scan(self.storage, table, access_path, get_row_count(self.storage, table_name)):
+            delete_records = list(parallel_scan(self.storage, table, predicates, with_ids=True))
+        else:
+            for record_id, record in read_records(self.storage, table, access_path, predicates):
+                if check(record):
+                    delete_records.append((record_id, record))
+
+        # DeleteReferentialIntegrityPassed (point lookup of reference count of each deleted key)
+        fk_refs = self.storage.get_fk_refs()
+        if delete_records and self.catalog.get_referenced_by(database, table_name):
+            build_fk_refs(self.storage, self.catalog, table)
+
+            for _, record in delete_records:
+                if get_fk_ref_count(fk_refs, table_name, [record[table_name + "." + pk] for pk in table.primary_key]) > 0:
+                    self.result = [True, f"{len(delete_records)} row(s) are not deleted due to referential integrity"]
+                    return
 
-                consequent_table_name = None
-                consequent_column_name = None
+        # delete records by key with their primary key index and record directory entries (secondary indexes follow records)
+        row_count = get_row_count(self.storage, table_name)
+        for record_id, record in delete_records:
+            table_data.delete(get_record_key(record_id))
+            remove_record_id(directory, table_name, record_id)
+            if pk_index is not None:
+                pk_key = encode_pk_key(table_name, [record[table_name + "." + pk] for pk in table.primary_key])
+                if pk_index.exists(pk_key):
+                    pk_index.delete(pk_key)
+        set_row_count(database, table_name, row_count - len(delete_records))
+
+        # release references held by deleted records (one update per referenced key)
+        if table.foreign_key_values and delete_records:
+            update_fk_refs(self.storage, table, [record for _, record in delete_records], -1)
+
+        if table.storage == "column" and delete_records:
+            compact_column_table(self.storage, table)
+
+        self.result = [True, f"{len(delete_records)} row(s) deleted"]
+        return
+    
+    def update_query(self, items):
+        table_name = items[1].children[0].value.lower()
+        assign_clauses = list(items[3].find_data('assign_clause'))
+        where_clause = items[3].children[-1]
 
-                is_null_predicate = False
-                is_comparison_with_column = False
+        # only "=" can be used in set clause
+        for assign_clause in assign_clauses:
+            if assign_clause.children[1].value != "=":
+                self.result = [True, "Syntax error"]
+                return
 
-                if predicate[0].children[0].data == "comparison_predicate":             # comparison predicate
-                    first_operand = predicate[0].children[0].children[0]
-                    antecedent_table_name = first_operand.children[0].children[0].value.lower() if first_operand.children[0] else None
-                    antecedent_column_name = first_operand.children[1].children[0].value.lower()
+        # parse each assignment into (column name, (value, value type))
+        assignments = [
+            (assign_clause.children[0].children[0].value.lower(), parse_value_list(assign_clause)[0])
+            for assign_clause in assign_clauses
+        ]
 
-                    operator = predicate[0].children[0].children[1].value
+        try:
+            count = update_records(self.storage, self.catalog, table_name, assignments, where_clause)
+        except QueryError as e:
+            self.result = [True, str(e)]
+            return
 
-                    second_operand = predicate[0].children[0].children[2]
+        self.result = [True, f"{count} row(s) updated"]
+        return
+    
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024                               # Berkeley DB memory pool size in bytes
+LOCK_TABLE_SIZE = 100000                                            # locks (pages) one transaction can hold, bounds size of bulk statements
+LOCK_TIMEOUT = 5 * 1000 * 1000                                      # microseconds statement waits for lock held by other session
+DEFAULT_PARALLEL_DEGREE = min(os.cpu_count() or 1, 8)               # worker processes of parallel scan (1 disables it)
+PARALLEL_SCAN_MIN_ROWS = 100000                                     # smaller tables are scanned by statement itself (pool overhead outweighs gain)
+PARALLEL_SCAN_CHUNK_ROWS = 10000                                    # record ids decoded and filtered by worker at a time
+DEFAULT_BATCH_SIZE = 1024                                           # records per column batch of batch execution (0 runs row at a time)
+DEFAULT_SORT_MEMORY = 64 * 1024 * 1024                              # bytes of rows sort holds in memory before writing sorted run to temporary file
+SORT_MERGE_FAN_IN = 64                                              # sorted runs merged at once (more runs are merged into one run first)
+
+# log flush done at commit: sync flushes log to disk, write_nosync writes it to OS (lost on OS crash), nosync keeps it in memory (lost on crash)
+DURABILITY_FLAGS = {"sync": 0, "write_nosync": db.DB_TXN_WRITE_NOSYNC, "nosync": db.DB_TXN_NOSYNC}
+
+class TransactionalDB:                                              # Database handle running every operation in current transaction of storage
+    def __init__(self, storage, handle):
+        self.storage = storage
+        self.handle = handle                                        # Berkeley DB handle
+
+    def get(self, key, default=None):
+        return self.handle.get(key, default, txn=self.storage.txn)
+
+    def put(self, key, data):
+        return self.handle.put(key, data, txn=self.storage.txn)
+
+    def delete(self, key):
+        return self.handle.delete(key, txn=self.storage.txn)
+
+    def exists(self, key):
+        return self.handle.exists(key, txn=self.storage.txn)
+
+    def cursor(self):
+        return self.handle.cursor(txn=self.storage.txn)
+
+    def close(self):
+        self.handle.close()
+
+class TransactionState:                                             # Open transactions of one session (each client of server has its own)
+    def __init__(self):
+        self.txns = []                                              # open transactions (innermost last)
+        self.changed_tables = set()                                 # tables whose schema open transaction changed (their handles are reset when it is rolled back)
+
+class Storage:                                                      # Database handles opened once and shared by all statements
+    # every statement runs in its own transaction, nested in explicit transaction (begin ... commit) when one is open
+    # operations outside any transaction (migration, benchmarks) are committed one by one
+    # handles are shared by threads of server, each thread runs statements of the session it is given by use_state
+    def __init__(self, db_path, cache_size=DEFAULT_CACHE_SIZE, durability="sync",
+                 parallel_degree=DEFAULT_PARALLEL_DEGREE, parallel_min_rows=PARALLEL_SCAN_MIN_ROWS, batch_size=DEFAULT_BATCH_SIZE,
+                 sort_memory=DEFAULT_SORT_MEMORY):
+        self.db_path = os.path.abspath(db_path)
+        self.env = db.DBEnv()
+        self.env.set_cachesize(cache_size // (1024 ** 3), cache_size % (1024 ** 3))
+        self.env.set_lk_max_locks(LOCK_TABLE_SIZE)
+        self.env.set_lk_max_objects(LOCK_TABLE_SIZE)
+        self.env.set_lk_detect(db.DB_LOCK_DEFAULT)                  # abort one of deadlocked transactions
+        self.env.set_timeout(LOCK_TIMEOUT, db.DB_SET_LOCK_TIMEOUT)   # give up waits no deadlock detection can see (lock held by idle session)
+        self.env.log_set_config(db.DB_LOG_AUTO_REMOVE, 1)           # remove log files no longer needed for recovery
+        self.env.set_flags(db.DB_AUTO_COMMIT, 1)
+        if DURABILITY_FLAGS[durability]:
+            self.env.set_flags(DURABILITY_FLAGS[durability], 1)
+        # recovery brings databases back to last committed state after crash (log of concurrent commits is flushed together)
+        self.env.open(os.path.dirname(self.db_path),
+                      db.DB_CREATE | db.DB_RECOVER | db.DB_INIT_MPOOL | db.DB_INIT_TXN | db.DB_INIT_LOG | db.DB_INIT_LOCK | db.DB_THREAD)
+        self.lock = threading.RLock()                               # guards opening and closing of shared handles
+        self.default_state = TransactionState()                     # session of threads not given one (command line)
+        self.sessions = threading.local()
+        self.database = None
+        self.directory = None
+        self.pk_index = None
+        self.fk_refs = None
+        self.tables_path = get_table_data_path(self.db_path)      # file holding one sub-database of records per table
+        self.tables = {}                                            # table name -> sub-database handle
+        self.indexes_path = get_index_path(self.db_path)            # file holding one sub-database per secondary index
+        self.indexes = {}                                           # index name -> secondary database handle
+        self.index_tables = {}                                      # index name -> name of table it is associated with
+        self.columns_path = get_column_data_path(self.db_path)      # file holding one sub-database of column segments per column table
+        self.parallel_degree = parallel_degree
+        self.parallel_min_rows = parallel_min_rows
+        self.scan_executor = None                                   # worker processes of parallel scan (started on first use)
+        self.batch_size = batch_size
+        self.sort_memory = sort_memory                              # bytes of rows sorted in memory (larger sorts spill sorted runs to disk)
+
+    @property
+    def state(self):                                                # Transactions of session run by current thread
+        return getattr(self.sessions, "state", self.default_state)
+
+    def use_state(self, state):                                     # Run following operations of current thread in given session
+        self.sessions.state = state
+
+    @property
+    def txn(self):                                                  # Innermost open transaction (None outside transactions)
+        txns = self.state.txns
+        return txns[-1] if txns else None
+
+    def begin(self):                                                # Start transaction (nested in current one if any)
+        self.state.txns.append(self.env.txn_begin(self.txn))
+
+    def commit(self):
+        state = self.state
+        state.txns.pop().commit()
+        if not state.txns:
+            state.changed_tables = set()
+
+    def abort(self):                                                # Roll back innermost transaction
+        state = self.state
+        state.txns.pop().abort()
+        if state.changed_tables:                                    # handles of changed tables are reopened, so associations follow restored metadata
+            with self.lock:                                         # handles of other tables stay open for other sessions
+                for index_name in [name for name, table_name in self.index_tables.items() if table_name in state.changed_tables]:
+                    self.indexes.pop(index_name).close()
+                    del self.index_tables[index_name]
+                for table_name in state.changed_tables & set(self.tables):
+                    self.tables.pop(table_name).close()
+        if not state.txns:
+            state.changed_tables = set()
+
+    def change_schema(self, table_name):                            # Open transaction changes schema of table (its handles are reset if rolled back)
+        if self.state.txns:
+            self.state.changed_tables.add(table_name)
+
+    def get_database(self, create=False):                           # Main database (None if it does not exist and create is False)
+        with self.lock:
+            if self.database is None:
+                database = db.DB(self.env)
+                try:
+                    database.open(self.db_path, None, db.DB_HASH, (db.DB_CREATE if create else 0) | db.DB_THREAD)
+                except db.DBNoSuchFileError:
+                    return None
+                self.database = TransactionalDB(self, database)
+            return self.database
+
+    def get_directory(self):
+        with self.lock:
+            if self.directory is None:
+                self.directory = TransactionalDB(self, open_record_directory(self.db_path, self.env))
+            return self.directory
+
+    def get_pk_index(self):
+        with self.lock:
+            if self.pk_index is None:
+                self.pk_index = TransactionalDB(self, open_pk_index(self.db_path, self.env))
+            return self.pk_index
+
+    def open_table_data(self, table_name):                          # Open sub-database of table without its indexes (created on first use)
+        table_data = TransactionalDB(self, db.DB(self.env))
+        try:
+            table_data.handle.open(self.tables_path, table_name, db.DB_HASH, db.DB_THREAD)
+        except db.DBNoSuchFileError:
+            table_data.handle.open(self.tables_path, table_name, db.DB_HASH, db.DB_CREATE | db.DB_THREAD)
+            migrate_table_data(self.get_database(), self.get_directory(), table_data, table_name)
+        return table_data
+
+    def open_column_data(self, table):                              # Open sub-database of column table (created on first use)
+        handle = TransactionalDB(self, db.DB(self.env))
+        handle.handle.open(self.columns_path, table.name, db.DB_BTREE, db.DB_CREATE | db.DB_THREAD)
+        return ColumnTableData(self, handle, table)
+
+    def get_table_data(self, table_name):                           # Sub-database holding records of table (ColumnTableData for column table)
+        # every index of table is associated when table is opened, so all writes keep indexes in sync
+        with self.lock:
+            if table_name not in self.tables:
+                database = self.get_database()
+                table = load_table_schema(database, table_name)
+                table.codec = make_record_codec(table, get_storage_format(database))
+                if table.storage == "column":
+                    self.tables[table_name] = self.open_column_data(table)
+                else:
+                    self.tables[table_name] = self.open_table_data(table_name)
+                    for index_name in table.indexes:
+                        self.get_index(table, index_name)
+            return self.tables[table_name]
+
+    def get_index(self, table, index_name):                         # Secondary database of index (built from records when created)
+        with self.lock:
+            if index_name not in self.indexes:
+                index = TransactionalDB(self, db.DB(self.env))
+                index.handle.set_flags(db.DB_DUPSORT)
+                index.handle.open(self.indexes_path, index_name, db.DB_BTREE, db.DB_CREATE | db.DB_THREAD)
+                self.indexes[index_name] = index
+                self.index_tables[index_name] = table.name
+                self.get_table_data(table.name).handle.associate(
+                    index.handle, make_index_key_function(table, table.indexes[index_name]), db.DB_CREATE, txn=self.txn)
+            return self.indexes[index_name]
+
+    def drop_index(self, index_name):                               # Detach index from its table and remove it
+        with self.lock:
+            if index_name in self.indexes:
+                self.indexes.pop(index_name).close()
+                del self.index_tables[index_name]
+            try:
+                self.env.dbremove(self.indexes_path, index_name, self.txn, 0 if self.txn else db.DB_AUTO_COMMIT)
+            except db.DBNoSuchFileError:                            # index was never opened
+                pass
+
+    def drop_table_data(self, table):                               # Remove sub-database of table with all its records in one call
+        with self.lock:
+            for index_name in table.indexes:
+                self.drop_index(index_name)
+            if table.name in self.tables:
+                self.tables.pop(table.name).close()
+            elif table.storage == "row":
+                self.open_table_data(table.name).close()            # records of old databases are moved out of catalog first
+            self.env.dbremove(self.columns_path if table.storage == "column" else self.tables_path, table.name,
+                              self.txn, 0 if self.txn else db.DB_AUTO_COMMIT)
+
+    def get_fk_refs(self):
+        with self.lock:
+            if self.fk_refs is None:
+                self.fk_refs = TransactionalDB(self, open_fk_refs(self.db_path, self.env))
+            return self.fk_refs
+
+    def get_scan_executor(self):                                    # Worker processes joining environment of storage (kept until storage is closed)
+        with self.lock:
+            if self.scan_executor is None:                          # spawned, because handles of environment must not be inherited by fork
+                self.scan_executor = ProcessPoolExecutor(self.parallel_degree, multiprocessing.get_context("spawn"),
+                                                         initializer=init_scan_worker, initargs=(self.db_path,))
+            return self.scan_executor
+
+    def close(self):                                                # Flush and close all handles (called once on exit)
+        while self.state.txns:                                      # transaction left open is rolled back
+            self.abort()
+        if self.scan_executor is not None:
+            self.scan_executor.shutdown()
+            self.scan_executor = None
+        for handle in list(self.indexes.values()) + list(self.tables.values()) + [self.fk_refs, self.pk_index, self.directory, self.database]:
+            if handle is not None:
+                handle.close()
+        self.indexes = {}
+        self.index_tables = {}
+        self.tables = {}
+        self.database = self.directory = self.pk_index = self.fk_refs = None
+        if self.env is not None:
+            self.env.txn_checkpoint()                               # write dirty pages so that recovery on next start is short
+            self.env.close()
+            self.env = None
+
+class ColumnSchema:                                                 # Metadata of column
+    def __init__(self, name, type, is_nullable, is_pk, is_fk):
+        self.name = name
+        self.type = type                                            # int, char(n), date
+        self.is_nullable = is_nullable
+        self.is_pk = is_pk
+        self.is_fk = is_fk
+
+class TableSchema:                                                  # Metadata of table
+    def __init__(self, name, columns, primary_key, foreign_key_values, referencing_tables, referencing_columns, indexes=None, statistics=None, storage="row"):
+        self.name = name
+        self.column_names = [column.name for column in columns]
+        self.columns = {column.name: column for column in columns}
+        self.primary_key = primary_key
+        self.foreign_key_values = foreign_key_values                # foreign key columns
+        self.referencing_tables = referencing_tables                # table referenced by each foreign key
+        self.referencing_columns = referencing_columns              # column referenced by each foreign key
+        self.indexes = indexes if indexes else {}                   # index name -> indexed column
+        self.statistics = statistics if statistics else {}          # column statistics collected by analyze
+        self.storage = storage                                      # layout of records: row or column
+        self.codec = None                                           # record codec, set by catalog
+
+class Catalog:                                                      # Cache of table metadata kept across statements
+    # cached metadata is dropped whenever catalog version stamp in database is changed (bumped by create/drop table)
+    def __init__(self):
+        self.version = None
+        self.table_list = None
+        self.tables = {}
+        self.storage_format = None
+
+    def refresh(self, database):                                    # Check version stamp once per statement
+        version = database.get(b"catalog_version")
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self):
+        self.table_list = None
+        self.tables = {}
+        self.storage_format = None
+
+    def invalidate(self):                                           # Forget cached metadata (after rollback)
+        self.clear()
+        self.version = None
+
+    def bump_version(self, database):                               # Mark catalog as changed
+        version = int(database.get(b"catalog_version") or b"0") + 1
+        database.put(b"catalog_version", bytes(str(version), "utf-8"))
+        self.clear()
+        self.version = bytes(str(version), "utf-8")
+
+    def get_table_list(self, database):
+        if self.table_list is None:
+            table_list = database.get(bytes("table_list", "utf-8"))
+            self.table_list = loads(table_list.decode("utf-8")) if table_list is not None else []
+        return self.table_list
+
+    def has_table(self, database, table_name):
+        return table_name in self.get_table_list(database)
+
+    def get_storage_format(self, database):
+        if self.storage_format is None:
+            self.storage_format = get_storage_format(database)
+        return self.storage_format
+
+    def get_table(self, database, table_name):                      # TableSchema of table (None if table does not exist)
+        if table_name not in self.tables:
+            if not self.has_table(database, table_name):
+                return None
+            table = load_table_schema(database, table_name)
+            table.codec = make_record_codec(table, self.get_storage_format(database))
+            self.tables[table_name] = table
+        return self.tables[table_name]
+
+    def find_index(self, database, index_name):                     # TableSchema of table having index (None if index does not exist)
+        for table_name in self.get_table_list(database):
+            table = self.get_table(database, table_name)
+            if index_name in table.indexes:
+                return table
+        return None
+
+    def get_referenced_by(self, database, table_name):              # [(child table, foreign key index)] which reference table
+        referenced_by = []
+        for child_table_name in self.get_table_list(database):
+            child_table = self.get_table(database, child_table_name)
+            for idx, referencing_table in enumerate(child_table.referencing_tables):
+                if referencing_table == table_name:
+                    referenced_by.append((child_table_name, idx))
+        return referenced_by
+
+def load_table_schema(database, table_name):                        # Read metadata of table from database
+    def get_value(key, default=None):
+        value = database.get(bytes("table_list/" + table_name + "/" + key, "utf-8"))
+        return value.decode("utf-8") if value is not None else default
+
+    columns = []
+    for column_name in loads(get_value("column_names")):
+        columns.append(ColumnSchema(
+            column_name,
+            get_value(column_name + "/type"),
+            get_value(column_name + "/is_nullable") == "True",
+            get_value(column_name + "/is_pk") == "True",
+            get_value(column_name + "/is_fk") == "True",
+        ))
+
+    return TableSchema(
+        table_name,
+        columns,
+        loads(get_value("primary_key")),
+        loads(get_value("foreign_key_values")),
+        loads(get_value("referencing_tables")),
+        loads(get_value("referencing_columns")),
+        loads(get_value("indexes", "{}")),                          # tables created before indexes have no index list
+        loads(get_value("statistics", "{}")),                       # tables never analyzed have no statistics
+        get_value("storage", "row"),
+    )
+
+def get_table_schema_keys(table):                                   # Catalog keys holding metadata of table
+    keys = ["column_names", "primary_key", "referencing_tables", "referencing_columns", "foreign_key_values", "indexes", "statistics", "storage", "uuid", "row_count", "record_ids"]
+    for column_name in table.column_names:
+        keys += [column_name + "/type", column_name + "/is_nullable", column_name + "/is_pk", column_name + "/is_fk"]
+    return [bytes("table_list/" + table.name + "/" + key, "utf-8") for key in keys]
+
+def print_table_schema(table):
+    result = "-" * 65 + "\n"
+    result += f"table_name [{table.name}]\n"
+    if table.storage != "row":
+        result += f"storage [{table.storage}]\n"
+    result += f"{'column_name':<20}{'type':<15}{'null':<15}{'key':<15}\n"  # alignment setting
 
-                    # case: compare with column
-                    if not second_operand.children[0] or second_operand.children[0].data != "comparable_value":
-                        is_comparison_with_column = True
-                        
-                        consequent_table_name = second_operand.children[0].children[0].value.lower() if second_operand.children[0] else None
-                        consequent_column_name = second_operand.children[1].children[0].value.lower()
+    for column_name in table.column_names:
+        column = table.columns[column_name]
 
-                    # case: compare with value
-                    else:
-                        comparable_value = second_operand.children[0].children[0].value
-                        comparable_value_type = second_operand.children[0].children[0].type.lower()
-                
-                else:                                                                   # null predicate
-                    is_null_predicate = True
-                    antecedent_table_name = predicate[0].children[0].children[0].children[0].value.lower() if predicate[0].children[0].children[0] else None
-                    antecedent_column_name = predicate[0].children[0].children[1].children[0].value.lower()
-                    null_negation = True if predicate[0].children[0].children[2].children[1] else False
+        null = "Y" if column.is_nullable else "N"
+        if column.is_pk and column.is_fk:
+            key = "PRI/FOR"
+        elif column.is_pk:
+            key = "PRI"
+        elif column.is_fk:
+            key = "FOR"
+        else:
+            key = ""
 
-                    operator = "is not" if null_negation else "is"
+        result += f"{column_name:<20}{column.type:<15}{null:<15}{key:<15}\n"
 
-                # WhereTableNotSpecified
-                if antecedent_table_name and antecedent_table_name != table_name:
-                    self.result = [True, f"Where clause trying to reference tables which are not specified"]
-                    return
-                if consequent_table_name and consequent_table_name != table_name:
-                    self.result = [True, f"Where clause trying to reference tables which are not specified"]
-                    return
-                
-                # if each table name is not specified, set it to table_name
-                antecedent_table_name = antecedent_table_name if antecedent_table_name else table_name
+    # list secondary indexes of table
+    if table.indexes:
+        result += f"{'index_name':<20}{'column_name':<15}\n"
+        for index_name, column_name in table.indexes.items():
+            result += f"{index_name:<20}{column_name:<15}\n"
 
-                column_names = loads(database.get(bytes("table_list/" + antecedent_table_name + "/column_names", "utf-8")).decode("utf-8"))
+    result += "-" * 65
+    return result
+    
+def get_column_width(col_name, col_type):                          # Width of column in select result
+    # width is decided before rows are produced: at least 18, column name, or declared length of char/date
+    width = max(18, len(col_name))
+    if col_type.startswith("char"):
+        width = max(width, int(col_type[5:-1]))
+    elif col_type == "date":
+        width = max(width, 10)
+    return width
+
+def render_table_select(select_column_names, rows, max_col_width_list):    # Render operator: yield formatted lines
+    separator = "".join(f"+{'-' * (width + 2)}" for width in max_col_width_list) + "+"
+    yield separator
 
-                # WhereColumnNotExist & WhereIncomparableError
-                if antecedent_column_name not in column_names:
-                    self.result = [True, f"Where clause trying to reference non existing column"]
-                    return
-                if consequent_column_name:
-                    if consequent_column_name == "null":                            # 'null' 이라는 컬럼명이 있다면...?
-                        self.result = [True, "Where clause trying to compare incomparable values"]
-                        return
-                    if consequent_column_name not in column_names:
-                        self.result = [True, f"Where clause trying to reference non existing column"]
-                        return
-                
-                antecedent_col_type = database.get(bytes("table_list/" + antecedent_table_name + "/" + antecedent_column_name + "/type", "utf-8")).decode("utf-8")
-                if antecedent_col_type.startswith("char"):
-                    antecedent_col_type = "char"
-                
-                # WhereIncomparableError
-                if not is_null_predicate:
+    header = "| " + " | ".join(f"{str(col_name).upper():<{max_col_width_list[idx]}}" for idx, col_name in enumerate(select_column_names)) + " |"
+    yield header
+
+    yield separator
+
+    for row in rows:
+        yield "| " + " | ".join(f"{value:<{max_col_width_list[idx]}}" if value is not None else f"{'NULL':<{max_col_width_list[idx]}}" for idx, value in enumerate(row)) + " |"
+
+    yield separator
+
+class JsonRecordCodec:                                              # Record stored as JSON object of {"table.column": value}
+    def encode(self, record):
+        return bytes(dumps(record), "utf-8")
+
+    def decode(self, data):
+        return loads(data.decode("utf-8"))
+
+    def decode_columns(self, datas, keys):                          # Decode records into {"table.column": [value of each record]}
+        records = [loads(data.decode("utf-8")) for data in datas]
+        return {key: list(map(operator.itemgetter(key), records)) for key in keys}
+
+INT_MIN, INT_MAX = -(1 << 63), (1 << 63) - 1                       # range of int column (stored in 8 bytes by binary records and index keys)
+
+class BinaryRecordCodec:                                            # Record stored in compact binary format driven by table schema
+    # layout: null bitmap | fixed-width slots | char values
+    # fixed-width slots: int (8 byte signed) of int columns, date (4 byte, year << 16 | month << 8 | day) of date columns,
+    # then length (2 byte) of char columns, so that whole fixed part is decoded with single unpack
+    # columns are ordered int columns, date columns, char columns (null bitmap follows this order)
+    def __init__(self, table_name, column_names, column_types):
+        int_columns = [column_names[idx] for idx, column_type in enumerate(column_types) if column_type == "int"]
+        date_columns = [column_names[idx] for idx, column_type in enumerate(column_types) if column_type == "date"]
+        char_columns = [column_names[idx] for idx, column_type in enumerate(column_types) if column_type == "char"]
+
+        self.keys = [table_name + "." + column_name for column_name in int_columns + date_columns + char_columns]
+        self.int_count = len(int_columns)
+        self.date_end = len(int_columns) + len(date_columns)
+        self.bitmap_size = (len(self.keys) + 7) // 8
+        self.empty_bitmap = bytes(self.bitmap_size)
+        self.fixed_struct = struct.Struct(">" + "q" * len(int_columns) + "I" * len(date_columns) + "H" * len(char_columns))
+        self.char_offset = self.bitmap_size + self.fixed_struct.size
+        self.date_strings = {}                                      # decoded date slot -> "YYYY-MM-DD"
+
+    def encode(self, record):
+        values = [record[key] for key in self.keys]
+        bitmap = bytearray(self.bitmap_size)
+        fixed_values = []
+        char_values = []
+
+        for idx, value in enumerate(values):
+            if value is None:
+                bitmap[idx >> 3] |= 1 << (idx & 7)
+
+        for value in values[:self.int_count]:                       # null slots are filled with zero
+            fixed_values.append(value if value is not None else 0)
+        for value in values[self.int_count:self.date_end]:
+            fixed_values.append(int(value[0:4]) << 16 | int(value[5:7]) << 8 | int(value[8:10]) if value is not None else 0)
+        for value in values[self.date_end:]:
+            char_values.append(value.encode("utf-8") if value is not None else b"")
+            fixed_values.append(len(char_values[-1]))
+
+        return bytes(bitmap) + self.fixed_struct.pack(*fixed_values) + b"".join(char_values)
+
+    def decode(self, data):
+        return dict(zip(self.keys, self.decode_values(data)))
+
+    def decode_columns(self, datas, keys):                          # Decode records into {"table.column": [value of each record]}
+        columns = dict(zip(self.keys, zip(*[self.decode_values(data) for data in datas])))
+        return {key: columns.get(key, ()) for key in keys}
+
+    def decode_values(self, data):                                  # Values of record in order of self.keys
+        fixed_values = self.fixed_struct.unpack_from(data, self.bitmap_size)
+        values = list(fixed_values[:self.int_count])
+
+        date_strings = self.date_strings
+        for date_value in fixed_values[self.int_count:self.date_end]:
+            date_string = date_strings.get(date_value)
+            if date_string is None:
+                date_string = "%04d-%02d-%02d" % (date_value >> 16, (date_value >> 8) & 0xFF, date_value & 0xFF)
+                if len(date_strings) < 65536:
+                    date_strings[date_value] = date_string
+            values.append(date_string)
+
+        offset = self.char_offset
+        for length in fixed_values[self.date_end:]:
+            values.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+
+        if data[:self.bitmap_size] != self.empty_bitmap:             # apply null bitmap
+            for idx in range(len(values)):
+                if data[idx >> 3] & (1 << (idx & 7)):
+                    values[idx] = None
+
+        return values
+
+STORAGE_FORMATS = ["json", "binary"]
+TABLE_STORAGES = ["row", "column"]                                  # layout chosen per table by create table ... with (storage = column)
+
+def get_storage_format(database):                                   # Record format of database (json when not recorded)
+    storage_format = database.get(b"storage_format")
+    return storage_format.decode("utf-8") if storage_format is not None else "json"
+
+def make_record_codec(table, storage_format):                       # Get codec which encodes and decodes records of table
+    if storage_format == "json":
+        return JsonRecordCodec()
+    column_types = [table.columns[column_name].type for column_name in table.column_names]
+    return BinaryRecordCodec(table.name, table.column_names, ["char" if column_type.startswith("char") else column_type for column_type in column_types])
+
+def get_record_key(record_id):                                      # Key of record in sub-database of its table ({uuid})
+    return bytes(str(record_id), "utf-8")
+
+def get_record(table_data, codec, record_id):                       # Read and decode record
+    return codec.decode(table_data.get(get_record_key(record_id)))
+
+def put_record(table_data, codec, record_id, record):               # Encode and write record
+    table_data.put(get_record_key(record_id), codec.encode(record))
+
+def migrate_storage_format(storage, storage_format):                # Rewrite all records of database in given format
+    database = storage.get_database()
+    if database is None:
+        raise db.DBNoSuchFileError(2, "database does not exist")
+    directory = storage.get_directory()
+
+    catalog = Catalog()
+    catalog.refresh(database)
+    old_storage_format = catalog.get_storage_format(database)
+    record_count = 0
+
+    if old_storage_format != storage_format:
+        for table_name in catalog.get_table_list(database):
+            table = catalog.get_table(database, table_name)
+            new_codec = make_record_codec(table, storage_format)
+            if table.storage == "column":                           # only append buffer holds encoded records (segments are kept)
+                column_data = storage.get_table_data(table_name)
+                for record_id, data in list(column_data.iterate_buffer()):
+                    column_data.handle.put(encode_buffer_key(record_id), new_codec.encode(table.codec.decode(data)))
+                    record_count += 1
+                continue
+            table_data = storage.open_table_data(table_name)       # indexes are not associated (index keys do not depend on record format)
+            for record_id in iterate_record_ids(database, directory, table_name):
+                put_record(table_data, new_codec, record_id, get_record(table_data, table.codec, record_id))
+                record_count += 1
+            table_data.close()
+        database.put(b"storage_format", bytes(storage_format, "utf-8"))
+        catalog.bump_version(database)
+
+    return record_count
+
+def parse_value_list(value_list):                                   # Parse value list of insert query into [(value, value type)]
+    row = []
+    for nullable_value in value_list.find_data('nullable_value'):
+        if nullable_value.children[0] == "null":                    # store null values as None
+            row.append((None, "null"))
+        else:
+            token = nullable_value.children[0].children[0]
+            value_type = token.type.lower()
+            if value_type == "str":
+                row.append((token.value[1:-1], value_type))         # Remove quotes
+            elif value_type == "int":
+                row.append((int(token.value), value_type))
+            else:
+                row.append((token.value, value_type))
+    return row
+
+INT_PATTERN = re.compile(r"[+-]?\d+")
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def parse_csv_row(fields, column_types):                            # Parse csv fields into [(value, value type)] (empty field is null)
+    row = []
+    for field, column_type in zip(fields, column_types):
+        if field == "":
+            row.append((None, "null"))
+        elif column_type is None or column_type.startswith("char"):
+            row.append((field, "str"))
+        elif INT_PATTERN.fullmatch(field):
+            row.append((int(field), "int"))
+        elif DATE_PATTERN.fullmatch(field):
+            row.append((field, "date"))
+        else:
+            row.append((field, "str"))
+    return row + [(None, "extra")] * (len(fields) - len(column_types))    # keep field count for count check
+
+def check_column_value(table, col_name, value, value_type, parent_key_exists, action):   # Validate value given to column and return value to store
+    # action is "Insertion" or "Update" (used in error messages)
+    # InsertColumnExistenceError
+    if col_name not in table.columns:
+        raise QueryError(f"{action} has failed: '{col_name}' does not exist")
+
+    column = table.columns[col_name]
+    col_type = column.type
+
+    # InsertTypeMismatchError (column type != value type)
+    if value_type != "null":
+        if col_type.startswith("char"):
+            if value_type != "str":
+                raise QueryError(f"{action} has failed: Types are not matched")
+        elif col_type != value_type:
+            raise QueryError(f"{action} has failed: Types are not matched")
+        # InsertIntRangeError
+        elif value_type == "int" and not INT_MIN <= value <= INT_MAX:
+            raise QueryError(f"{action} has failed: '{col_name}' is out of int range")
+
+    # InsertColumnNonNullableError
+    elif not column.is_nullable:
+        raise QueryError(f"{action} has failed: '{col_name}' is not nullable")
+
+    # InsertReferentialIntegrityError
+    if column.is_fk and not parent_key_exists(col_name, value):
+        raise QueryError(f"{action} has failed: Referential integrity violation")
+
+    # Truncate value if it exceeds length constraint
+    if value_type != "null" and col_type.startswith("char"):
+        value = value[:int(col_type[5:-1])]
+    return value
+
+def make_parent_key_exists(storage, catalog, table):                # Parent key lookup for foreign key columns of table
+    # foreign keys reference primary key of parent table, so parent key lookup is point lookup in primary key index
+    database = storage.get_database()
+    for referencing_table in set(table.referencing_tables):
+        build_pk_index(storage, catalog.get_table(database, referencing_table))
+
+    def parent_key_exists(col_name, value):
+        referencing_table = table.referencing_tables[table.foreign_key_values.index(col_name)]
+        return storage.get_pk_index().exists(encode_pk_key(referencing_table, [value]))
+    return parent_key_exists
+
+def make_insert_record(table, column_names, row, parent_key_exists):    # Validate row of insert query and make record dict
+    # parent_key_exists(col_name, value) tells whether referenced table has value as primary key
+    table_name = table.name
+
+    # InsertTypeMismatchError (column # != value #)
+    if len(column_names) != len(row):
+        raise QueryError("Insertion has failed: Types are not matched")
+
+    record_dict = {}
+
+    for (value, value_type), col_name in zip(row, column_names):
+        record_dict[table_name + "." + col_name] = check_column_value(table, col_name, value, value_type, parent_key_exists, "Insertion")
+
+    # put null to columns that are not given in input query
+    for col_name in table.column_names:
+        if table_name + "." + col_name not in record_dict:
+            # InsertColumnNonNullableError
+            if not table.columns[col_name].is_nullable:
+                raise QueryError(f"Insertion has failed: '{col_name}' is not nullable")
+            record_dict[table_name + "." + col_name] = None
+
+    return record_dict
+
+def insert_records(storage, catalog, table_name, column_names, rows, from_csv=False):  # Validate all rows, then write them in one batch
+    # rows are [(value, value type)] lists, or csv field lists when from_csv is True
+    # nothing is written unless every row is valid, so failed statement leaves table unchanged
+    database = storage.get_database()
+    if database is None:                                            # NoSuchFile
+        raise QueryError("No such table")
+    catalog.refresh(database)
+
+    # NoSuchTable
+    table = catalog.get_table(database, table_name)
+    if table is None:
+        raise QueryError("No such table")
+
+    if column_names is None:
+        column_names = table.column_names
+    column_types = [table.columns[col_name].type if col_name in table.columns else None for col_name in column_names]
+
+    directory = storage.get_directory()
+    table_data = storage.get_table_data(table_name)
+    pk_index = None
+    if table.primary_key:
+        pk_index = storage.get_pk_index()
+        build_pk_index(storage, table)
+
+    parent_key_exists = make_parent_key_exists(storage, catalog, table)
+
+    # validate all rows (primary keys are checked against index and keys of earlier rows in batch)
+    encoded_records = []
+    pk_keys = []
+    batch_pk_keys = set()
+    foreign_key_records = []                                        # foreign key values of each row (for reference counts)
+
+    for row in rows:
+        if from_csv:
+            if not row:                                             # skip blank lines
+                continue
+            row = parse_csv_row(row, column_types)
+        record_dict = make_insert_record(table, column_names, row, parent_key_exists)
+
+        # InsertDuplicatePrimaryKeyError (single lookup in primary key index)
+        if pk_index is not None:
+            pk_key = encode_pk_key(table_name, [record_dict[table_name + "." + pk] for pk in table.primary_key])
+            if pk_key in batch_pk_keys or pk_index.exists(pk_key):
+                raise QueryError("Insertion has failed: Primary key duplication")
+            batch_pk_keys.add(pk_key)
+            pk_keys.append(pk_key)
+
+        encoded_records.append(table.codec.encode(record_dict))
+        if table.foreign_key_values:
+            foreign_key_records.append({table_name + "." + col_name: record_dict[table_name + "." + col_name] for col_name in table.foreign_key_values})
+
+    # write records, primary key index and record directory entries with consecutive uuids
+    uuid = int(database.get(bytes("table_list/" + table_name + "/uuid", "utf-8")).decode("utf-8"))
+    migrate_record_ids(database, directory, table_name)
+    row_count = get_row_count(storage, table_name)
+
+    for idx, encoded_record in enumerate(encoded_records):
+        table_data.put(get_record_key(uuid + idx), encoded_record)
+        directory.put(encode_record_key(table_name, uuid + idx), b"")
+        if pk_index is not None:
+            pk_index.put(pk_keys[idx], bytes(str(uuid + idx), "utf-8"))
+
+    # update uuid
+    database.put(bytes("table_list/" + table_name + "/uuid", "utf-8"), bytes(str(uuid + len(encoded_records)), "utf-8"))
+    set_row_count(database, table_name, row_count + len(encoded_records))
+
+    # count new references to parent keys
+    if foreign_key_records:
+        update_fk_refs(storage, table, foreign_key_records, 1)
+
+    if table.storage == "column":                                   # full append buffer is moved into chunks
+        compact_column_table(storage, table)
+    return len(encoded_records)
+
+def update_records(storage, catalog, table_name, assignments, where_clause):   # Rewrite records satisfying where clause in place
+    # assignments are [(column name, (value, value type))], constraints are checked only for assigned columns
+    # nothing is written unless every record passes, so failed statement leaves table unchanged
+    database = storage.get_database()
+    if database is None:                                            # NoSuchFile
+        raise QueryError("No such table")
+    catalog.refresh(database)
+
+    # NoSuchTable
+    table = catalog.get_table(database, table_name)
+    if table is None:
+        raise QueryError("No such table")
+
+    # assigned values are constants, so type, nullability and parent key are checked once
+    parent_key_exists = make_parent_key_exists(storage, catalog, table)
+    new_values = {}
+    for col_name, (value, value_type) in assignments:
+        new_values[table_name + "." + col_name] = check_column_value(table, col_name, value, value_type, parent_key_exists, "Update")
+
+    table_data = storage.get_table_data(table_name)
+    pk_index = storage.get_pk_index() if table.primary_key else None
+    if pk_index is not None:
+        build_pk_index(storage, table)
+
+    # compile where clause into predicate
+    column_in_which_table = {column_name: [table_name] for column_name in table.column_names}
+    column_types = {table_name + "." + column_name: table.columns[column_name].type for column_name in table.column_names}
+    predicates = parse_where_clause(where_clause, [table_name], column_in_which_table, column_types)
+    check = combine_predicates(predicates)
+
+    # candidate records are found through primary key or secondary index when where clause allows it
+    access_path = choose_access_path(table, predicates)
+
+    # evaluate where clause once per record
+    updates = []                                                    # [(uuid, old record, new record)]
+    for record_id, record in read_records(storage, table, access_path, predicates):
+        if check(record):
+            new_record = dict(record)
+            new_record.update(new_values)
+            updates.append((record_id, record, new_record))
+
+    # primary key uniqueness and references to old keys (only when primary key is assigned)
+    pk_columns = [table_name + "." + pk for pk in table.primary_key]
+    pk_changes = []                                                 # [(uuid, old key, new key)]
+    if pk_index is not None and any(pk_column in new_values for pk_column in pk_columns):
+        for record_id, record, new_record in updates:
+            old_key = encode_pk_key(table_name, [record[pk_column] for pk_column in pk_columns])
+            new_key = encode_pk_key(table_name, [new_record[pk_column] for pk_column in pk_columns])
+            if old_key != new_key:
+                pk_changes.append((record_id, old_key, new_key))
+
+        # UpdateDuplicatePrimaryKeyError (new key must not be used by other records or other updated records)
+        old_keys = {old_key for _, old_key, _ in pk_changes}
+        new_keys = set()
+        for _, _, new_key in pk_changes:
+            if new_key in new_keys or (new_key not in old_keys and pk_index.exists(new_key)):
+                raise QueryError("Update has failed: Primary key duplication")
+            new_keys.add(new_key)
+
+        # UpdateReferentialIntegrityError (referenced key can not be changed)
+        if pk_changes and catalog.get_referenced_by(database, table_name):
+            build_fk_refs(storage, catalog, table)
+            for _, old_key, _ in pk_changes:
+                if int(storage.get_fk_refs().get(old_key) or b"0") > 0:
+                    raise QueryError(f"{len(updates)} row(s) are not updated due to referential integrity")
+
+    # rewrite records in place (uuid and record directory entry are kept)
+    for record_id, _, new_record in updates:
+        put_record(table_data, table.codec, record_id, new_record)
+
+    # move primary key index entries of changed keys
+    for _, old_key, _ in pk_changes:
+        if pk_index.exists(old_key):
+            pk_index.delete(old_key)
+    for record_id, _, new_key in pk_changes:
+        pk_index.put(new_key, bytes(str(record_id), "utf-8"))
+
+    # move references of assigned foreign key columns
+    if updates and any(table_name + "." + col_name in new_values for col_name in table.foreign_key_values):
+        update_fk_refs(storage, table, [record for _, record, _ in updates], -1)
+        update_fk_refs(storage, table, [new_record for _, _, new_record in updates], 1)
+
+    if table.storage == "column" and updates:                       # updated records of chunks were moved to append buffer
+        compact_column_table(storage, table)
+    return len(updates)
+
+def scan_table(storage, table, access_path=None):                   # Scan operator: yield decoded records of table one at a time
+    # with access path, only records found through primary key or secondary index are read (predicates are still checked by caller)
+    for _, record in read_records(storage, table, access_path if access_path else ["scan", None, 1.0, None]):
+        yield record
+
+def read_records(storage, table, access_path, predicates=()):       # Yield (uuid, record) of records found by access path
+    # full scan of column table reads chunks (skipping those ruled out by predicates), other records are read by uuid
+    if table.storage == "column" and access_path[0] == "scan":
+        keys = [table.name + "." + column_name for column_name in table.column_names]
+        for batch in scan_column_batches(storage, table, keys, predicates, with_ids=True):
+            columns = [batch.columns[key] for key in keys]
+            for position in batch.selection:
+                yield batch.ids[position], dict(zip(keys, [column[position] for column in columns]))
+        return
 
-                    # compare to null with operators other than is/is not          
-                    if is_comparison_with_column:
-                        consequent_table_name = consequent_table_name if consequent_table_name else table_name
+    table_data = storage.get_table_data(table.name)
+    for record_id in read_record_ids(storage, table, access_path):
+        yield record_id, get_record(table_data, table.codec, record_id)
+
+scan_worker = {}                                                    # handles opened once by each parallel scan worker process
+
+def init_scan_worker(db_path):                                      # Join environment of storage in worker process
+    env = db.DBEnv()
+    env.open(os.path.dirname(db_path), db.DB_JOINENV)
+    database = db.DB(env)
+    database.open(db_path, None, db.DB_HASH, db.DB_RDONLY)
+    scan_worker.update(env=env, database=database, tables_path=get_table_data_path(db_path))
+
+def scan_chunk(table_name, record_ids, conditions, with_ids):       # Decode records of chunk and keep those satisfying conditions (in worker process)
+    # conditions: [(boolean_factor, context)] compiled here, because compiled checks cannot be sent to other process
+    database = scan_worker["database"]
+    table = load_table_schema(database, table_name)
+    codec = make_record_codec(table, get_storage_format(database))
+    check = combine_predicates([Predicate(compile_boolean_factor(tree, context, set()), set()) for tree, context in conditions])
+
+    table_data = db.DB(scan_worker["env"])
+    table_data.open(scan_worker["tables_path"], table_name, db.DB_HASH, db.DB_RDONLY)
+    try:
+        matches = []
+        for record_id in record_ids:
+            data = table_data.get(get_record_key(record_id))
+            if data is None:                                        # deleted after its id was read
+                continue
+            record = codec.decode(data)
+            if check(record):
+                matches.append((record_id, record) if with_ids else record)
+        return matches
+    finally:
+        table_data.close()
+
+def use_parallel_scan(storage, table, access_path, row_count):      # Whether table read by access path is scanned by worker processes
+    # workers read committed records only, so statements in explicit transaction (which may see own writes) scan by themselves
+    # column tables are read by chunks instead
+    return (storage.parallel_degree > 1 and table.storage == "row" and access_path[0] == "scan" and row_count >= storage.parallel_min_rows
+            and len(storage.state.txns) <= 1)
+
+def parallel_scan(storage, table, predicates, with_ids=False):      # Parallel scan operator: yield records satisfying predicates in insertion order
+    # record ids are split into chunks, decoded and filtered by worker processes, results are merged in order of chunks
+    storage.get_table_data(table.name)                              # records of old databases are moved into table sub-database first
+    record_ids = iterate_record_ids(storage.get_database(), storage.get_directory(), table.name)
+    conditions = [(predicate.tree, predicate.context) for predicate in predicates]
+    executor = storage.get_scan_executor()
+
+    pending = deque()                                               # chunks in flight, bounded so that results are not piled up in memory
+    try:
+        while True:
+            chunk = list(islice(record_ids, PARALLEL_SCAN_CHUNK_ROWS))
+            if chunk:
+                pending.append(executor.submit(scan_chunk, table.name, chunk, conditions, with_ids))
+            if pending and (not chunk or len(pending) >= storage.parallel_degree * 2):
+                yield from pending.popleft().result()
+            elif not chunk:
+                return
+    finally:
+        for future in pending:
+            future.cancel()
+
+def filter_records(records, check):                                 # Filter operator
+    for record in records:
+        if check(record):
+            yield record
+
+def project_records(records, select_column_names):                  # Project operator: yield selected values of each record
+    for record in records:
+        yield [record[col_name] for col_name in select_column_names]
+
+def hash_join(outer_records, inner_records, outer_keys, inner_keys):    # Join operator on equality of key columns
+    hash_table = {}
+    for inner_record in inner_records:                              # build phase on newly joined table (held in memory)
+        key = tuple(inner_record[col] for col in inner_keys)
+        if None in key:                                             # null never satisfies equality
+            continue
+        hash_table.setdefault(key, []).append(inner_record)
+
+    for outer_record in outer_records:                              # probe phase streams outer records
+        key = tuple(outer_record[col] for col in outer_keys)
+        for inner_record in hash_table.get(key, []):
+            yield {**outer_record, **inner_record}
+
+def nested_loop_join(outer_records, inner_records, predicates):     # Join operator checking predicates for each pair
+    check = combine_predicates(predicates)
+    inner_records = list(inner_records)                             # inner records are decoded once and held in memory
+    for outer_record in outer_records:
+        for inner_record in inner_records:
+            record = {**outer_record, **inner_record}
+            if check(record):
+                yield record
+
+class RecordBatch:                                                  # Column values of up to batch size records with selection vector
+    def __init__(self, columns, size):
+        self.columns = columns                                      # {"table.column": [value of each record]}
+        self.size = size
+        self.selection = range(size)                                # positions of records satisfying filters so far (ascending)
+        self.ids = None                                             # uuid of each record (set when scan is asked for them)
+
+    def __len__(self):
+        return len(self.selection)
+
+def scan_batches(storage, table, access_path, batch_size, keys):    # Scan operator of batch execution: yield column batches of records
+    # only columns given by keys ("table.column") are put in batches
+    table_data = storage.get_table_data(table.name)
+    record_ids = iter(read_record_ids(storage, table, access_path))
+    while True:
+        batch_ids = list(islice(record_ids, batch_size))
+        if not batch_ids:
+            return
+        get, txn = table_data.handle.get, storage.txn               # transaction is looked up once per batch
+        datas = [get(key, None, txn=txn) for key in map(get_record_key, batch_ids)]
+        yield RecordBatch(table.codec.decode_columns(datas, keys), len(batch_ids))
+
+def filter_batches(batches, kernel):                                # Filter operator of batch execution: narrow selection vector of each batch
+    for batch in batches:
+        batch.selection = kernel(batch, batch.selection)
+        if batch.selection:
+            yield batch
+
+def project_batches(batches, select_column_names):                  # Project operator of batch execution: yield selected values of each selected record
+    for batch in batches:
+        columns = [batch.columns[col_name] for col_name in select_column_names]
+        if len(batch.selection) == batch.size:
+            yield from map(list, zip(*columns))
+        else:
+            for position in batch.selection:
+                yield [column[position] for column in columns]
+
+AGGREGATE_FUNCTIONS = ["count", "sum", "min", "max", "avg"]
+
+class Aggregate:                                                    # Aggregate function of select list
+    def __init__(self, function, key, text, label, type):
+        self.function = function                                    # count, sum, min, max or avg
+        self.key = key                                              # "table.column" of argument (None for count(*))
+        self.text = text                                            # function(table.column) shown by explain
+        self.label = label                                          # column name of result (alias or text)
+        self.type = type                                            # type of result (decides column width)
+
+def step_avg(accumulator, value):                                   # accumulator of avg is [sum, count]
+    if accumulator is None:
+        return [value, 1]
+    accumulator[0] += value
+    accumulator[1] += 1
+    return accumulator
+
+AGGREGATE_STEPS = {                                                 # step(accumulator, value) adds non-null value to accumulator (None before first value)
+    "count": lambda accumulator, value: accumulator + 1,
+    "sum": lambda accumulator, value: value if accumulator is None else accumulator + value,
+    "min": lambda accumulator, value: value if accumulator is None or value < accumulator else accumulator,
+    "max": lambda accumulator, value: value if accumulator is None or value > accumulator else accumulator,
+    "avg": step_avg,
+}
+
+AGGREGATE_FOLDS = {"sum": sum, "min": min, "max": max}             # reduce non-null values of batch before adding them to accumulator
+
+def new_accumulators(aggregates):                                   # Accumulator of each aggregate before first record of group
+    return [0 if aggregate.function == "count" else None for aggregate in aggregates]
+
+def fold_aggregate(function, accumulator, values):                  # Add non-null values of batch to accumulator at once
+    if function == "count":
+        return accumulator + len(values)
+    if not values:
+        return accumulator
+    if function == "avg":
+        return [sum(values), len(values)] if accumulator is None else [accumulator[0] + sum(values), accumulator[1] + len(values)]
+    return AGGREGATE_STEPS[function](accumulator, AGGREGATE_FOLDS[function](values))
+
+def finish_aggregate(function, accumulator):                        # Result of aggregate from its accumulator (null when no value was added)
+    if function == "avg":
+        return accumulator[0] / accumulator[1] if accumulator else None
+    return accumulator
+
+def finish_groups(groups, aggregates, output):                      # Yield result row of each group in select list order
+    # groups: {group values: accumulators}, output: (is aggregate, index of aggregate or group column) of each select item
+    for key, accumulators in groups.items():
+        results = [finish_aggregate(aggregate.function, accumulator) for aggregate, accumulator in zip(aggregates, accumulators)]
+        yield [results[index] if is_aggregate else key[index] for is_aggregate, index in output]
+
+def hash_aggregate(rows, group_count, aggregates, positions, output):   # Aggregate operator: keep one accumulator per group and aggregate
+    # rows hold group values followed by aggregate arguments, positions: index of argument of each aggregate in row (None for count(*))
+    steps = [AGGREGATE_STEPS[aggregate.function] for aggregate in aggregates]
+    groups = {}
+    for row in rows:
+        key = tuple(row[:group_count])
+        accumulators = groups.get(key)
+        if accumulators is None:                                    # first record of group
+            accumulators = groups[key] = new_accumulators(aggregates)
+        for index, position in enumerate(positions):
+            if position is None:                                    # count(*)
+                accumulators[index] += 1
+            elif row[position] is not None:                         # nulls are ignored by aggregate functions
+                accumulators[index] = steps[index](accumulators[index], row[position])
+
+    if not group_count and not groups:                              # aggregate without group by yields one row even for no records
+        groups[()] = new_accumulators(aggregates)
+    yield from finish_groups(groups, aggregates, output)
+
+def aggregate_batches(batches, aggregates, output):                 # Aggregate operator of batch execution without group by: fold selected values of whole batch
+    accumulators = new_accumulators(aggregates)
+    for batch in batches:
+        for index, aggregate in enumerate(aggregates):
+            if aggregate.key is None:                               # count(*)
+                accumulators[index] += len(batch)
+            else:
+                values = [value for value in gather_values(batch, aggregate.key, batch.selection) if value is not None]
+                accumulators[index] = fold_aggregate(aggregate.function, accumulators[index], values)
+    yield from finish_groups({(): accumulators}, aggregates, output)
 
-                    # classify case whether comparing with column or value
-                    consequent_col_type = (
-                        database.get(bytes(f"table_list/{consequent_table_name}/{consequent_column_name}/type", "utf-8"))
-                        .decode("utf-8") if is_comparison_with_column else comparable_value_type
-                    )
+class Descending:                                                   # Sort key of column sorted from largest to smallest value
+    __slots__ = ("key",)
 
-                    if consequent_col_type.startswith("char"):
-                        consequent_col_type = "char"
+    def __init__(self, key):
+        self.key = key
 
-                    # check type constraint between antecedent and consequent
-                    type_constraints = {"char": {"str", "char"}, "int": {"int"}, "date": {"date"}}
+    def __lt__(self, other):
+        return other.key < self.key
 
-                    if antecedent_col_type not in type_constraints or (consequent_col_type not in type_constraints and consequent_col_type != "str"):
-                        self.result = [True, "Where clause trying to compare incomparable values"]
-                        return
+    def __eq__(self, other):
+        return self.key == other.key
 
-                    if not type_constraints[antecedent_col_type].intersection({consequent_col_type}):
-                        self.result = [True, "Where clause trying to compare incomparable values"]
-                        return
-                    
-                    if antecedent_col_type == "char":
-                        if operator not in ["=", "!="]:
-                            self.result = [True, "Where clause trying to compare incomparable values"]
-                            return
-                        if not is_comparison_with_column:
-                            comparable_value = comparable_value[1:-1]                         # remove quotes
-
-                # set consequent      
-                if is_null_predicate:
-                    consequent = None
-                elif is_comparison_with_column:
-                    consequent = [consequent_table_name, consequent_col_type, consequent_column_name]
-                else:
-                    consequent = [comparable_value, comparable_value_type]
-
-                predicate_list.append([expr_negation, [antecedent_table_name, antecedent_column_name, antecedent_col_type], operator, consequent])
-
-            # get record_ids that satisfy predicate condition
-            for record_id in record_ids:
-                record = loads(database.get(bytes("table_list/" + table_name + "/" + str(record_id), "utf-8")).decode("utf-8"))
-                if log_con == "single":
-                    if check_predicate_condition(predicate_list[0], record):
-                        delete_uuids.append(record_id)
-                elif log_con == "and":
-                    if check_predicate_condition(predicate_list[0], record) and check_predicate_condition(predicate_list[1], record):
-                        delete_uuids.append(record_id)
-                else:
-                    if check_predicate_condition(predicate_list[0], record) or check_predicate_condition(predicate_list[1], record):
-                        delete_uuids.append(record_id)
+def make_sort_key(sort_keys):                                       # Key function of row for [(position, descending)] (null sorts after every value)
+    if not any(descending for _, descending in sort_keys):
+        return lambda row: [(row[position] is None, row[position]) for position, _ in sort_keys]
+    return lambda row: [Descending((row[position] is None, row[position])) if descending else (row[position] is None, row[position])
+                        for position, descending in sort_keys]
 
-        # DeleteReferentialIntegrityPassed
-        referenced_by_tables = []
-        referenced_by_columns = []
+def estimate_row_size(row):                                         # Approximate bytes held by row in memory
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row))
 
-        while x is not None:
-            if x[0].endswith(bytes("/referencing_tables", "utf-8")):
-                if table_name in loads(x[1].decode("utf-8")):
-                    referenced_by = x[0].decode("utf-8").split("/")[1]
-                    referenced_by_tables.append(referenced_by)
+def write_sort_run(rows):                                           # Write sorted rows to temporary file, return file positioned at its start
+    run_file = tempfile.TemporaryFile()
+    for row in rows:
+        pickle.dump(row, run_file, pickle.HIGHEST_PROTOCOL)
+    run_file.seek(0)
+    return run_file
 
-                    idx = loads(database.get(bytes("table_list/" + referenced_by + "/referencing_tables", "utf-8")).decode("utf-8")).index(table_name)
-                    referenced_by_columns.append(loads(database.get(bytes("table_list/" + referenced_by + "/foreign_key_values", "utf-8")).decode("utf-8"))[idx])
-                    referencing_column = loads(database.get(bytes("table_list/" + referenced_by + "/referencing_columns", "utf-8")).decode("utf-8"))[idx]
+def read_sort_run(run_file):                                        # Yield rows of sorted run (file is removed once read)
+    try:
+        while True:
+            try:
+                yield pickle.load(run_file)
+            except EOFError:
+                return
+    finally:
+        run_file.close()
+
+def sort_rows(rows, sort_keys, width, memory):                      # Sort operator: external merge sort spilling sorted runs to temporary files
+    # rows beyond memory budget (bytes) are sorted and written as run, runs are merged in input order so sort is stable
+    key = make_sort_key(sort_keys)
+    run, run_size, run_files = [], 0, []
+    for row in rows:
+        run.append(row)
+        run_size += estimate_row_size(row)
+        if run_size > memory:
+            run.sort(key=key)
+            run_files.append(write_sort_run(run))
+            run, run_size = [], 0
+            if len(run_files) == SORT_MERGE_FAN_IN:                 # merge runs into one, so open files stay bounded
+                run_files = [write_sort_run(heapq.merge(*map(read_sort_run, run_files), key=key))]
+
+    run.sort(key=key)
+    rows = heapq.merge(*map(read_sort_run, run_files), run, key=key) if run_files else run
+    yield from (row[:width] for row in rows) if width is not None else rows
+
+def top_k_rows(rows, sort_keys, width, limit):                      # Sort operator with limit: keep first limit rows in bounded heap
+    rows = heapq.nsmallest(limit, rows, key=make_sort_key(sort_keys))
+    yield from (row[:width] for row in rows) if width is not None else rows
+
+class PlanNode:                                                     # Operator of query plan
+    def __init__(self, name, detail, children, estimated_rows, make_records, batch=False):
+        self.name = name                                            # operator name (Scan, Hash Join, ...)
+        self.detail = detail                                        # table, index or condition shown by explain
+        self.children = children
+        self.estimated_rows = estimated_rows
+        self.make_records = make_records                            # callable(*child record iterators) -> record iterator
+        self.batch = batch                                          # operator yields RecordBatch instead of records
+        self.actual_rows = 0                                        # filled by explain analyze
+        self.elapsed = 0.0
+
+    def execute(self, analyze=False):                               # Build record iterator of plan (analyze counts rows and time of each operator)
+        records = self.make_records(*[child.execute(analyze) for child in self.children])
+        return measure_records(self, records) if analyze else records
+
+def measure_records(node, records):                                 # Count records and time spent producing them (including children)
+    records = iter(records)
+    while True:
+        start = time.perf_counter()
+        try:
+            record = next(records)
+        except StopIteration:
+            node.elapsed += time.perf_counter() - start
+            return
+        node.elapsed += time.perf_counter() - start
+        node.actual_rows += len(record) if node.batch else 1
+        yield record
+
+def render_plan(node, analyze=False, depth=0):                      # Yield lines of plan tree
+    line = node.name + (f" {node.detail}" if node.detail else "")
+    stats = f"estimated rows={max(1, round(node.estimated_rows))}"
+    if analyze:
+        stats += f", actual rows={node.actual_rows}, time={node.elapsed * 1000:.3f} ms"
+    yield ("  " * depth + "-> " if depth else "") + f"{line}  ({stats})"
+    for child in node.children:
+        yield from render_plan(child, analyze, depth + 1)
+
+def get_row_count(storage, table_name):                             # Number of records of table (kept by insert and delete)
+    database = storage.get_database()
+    row_count = database.get(bytes("table_list/" + table_name + "/row_count", "utf-8"))
+    if row_count is None:                                           # tables created before row counts were kept are counted once
+        row_count = sum(1 for _ in iterate_record_ids(database, storage.get_directory(), table_name))
+        set_row_count(database, table_name, row_count)
+        return row_count
+    return int(row_count)
+
+def set_row_count(database, table_name, row_count):
+    database.put(bytes("table_list/" + table_name + "/row_count", "utf-8"), bytes(str(row_count), "utf-8"))
+
+class HyperLogLog:                                                  # Distinct value counter using fixed memory (2^precision registers)
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest(), "big")
+        register = hashed >> (64 - self.precision)                  # first bits choose register
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1        # position of first 1 bit in remaining bits
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:                           # linear counting is more accurate for small sets
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+HISTOGRAM_BUCKETS = 10
+HISTOGRAM_SAMPLE_SIZE = 10000                                       # values kept (reservoir sample) to build histogram of each column
+
+def analyze_table(storage, table):                                  # Scan table once and compute statistics stored in catalog
+    # {"row_count": n, "columns": {column: {"null_fraction": f, "distinct": d, "histogram": [bound, ...]}}}
+    # histograms are equi-depth (each bucket holds same number of values) and are kept for int and date columns
+    sampler = random.Random(0)
+    row_count = 0
+    null_counts = {column_name: 0 for column_name in table.column_names}
+    counters = {column_name: HyperLogLog() for column_name in table.column_names}
+    samples = {column_name: [] for column_name in table.column_names if table.columns[column_name].type in ("int", "date")}
+
+    for record in scan_table(storage, table):
+        row_count += 1
+        for column_name in table.column_names:
+            value = record[table.name + "." + column_name]
+            if value is None:
+                null_counts[column_name] += 1
+                continue
+            counters[column_name].add(value)
+            if column_name in samples:
+                sample = samples[column_name]
+                seen = row_count - null_counts[column_name]
+                if len(sample) < HISTOGRAM_SAMPLE_SIZE:
+                    sample.append(value)
+                else:
+                    slot = sampler.randrange(seen)
+                    if slot < HISTOGRAM_SAMPLE_SIZE:
+                        sample[slot] = value
+
+    columns = {}
+    for column_name in table.column_names:
+        non_null_count = row_count - null_counts[column_name]
+        column_statistics = {
+            "null_fraction": null_counts[column_name] / row_count if row_count else 0.0,
+            "distinct": min(counters[column_name].count(), non_null_count),
+        }
+        if samples.get(column_name):
+            sample = sorted(samples[column_name])
+            column_statistics["histogram"] = [sample[i * (len(sample) - 1) // HISTOGRAM_BUCKETS] for i in range(HISTOGRAM_BUCKETS + 1)]
+        columns[column_name] = column_statistics
+    return {"row_count": row_count, "columns": columns}
+
+def estimate_fraction_below(histogram, value):                      # Fraction of column values less than value according to histogram
+    if value <= histogram[0]:
+        return 0.0
+    if value > histogram[-1]:
+        return 1.0
+    buckets = len(histogram) - 1
+    for i in range(buckets):
+        low, high = histogram[i], histogram[i + 1]
+        if value <= high:
+            if isinstance(value, int) and high > low:               # assume values are spread evenly inside bucket
+                return (i + (value - low) / (high - low)) / buckets
+            return (i + 0.5) / buckets
+    return 1.0
+
+def estimate_comparison_selectivity(column_statistics, operator_value, value):  # Fraction of records satisfying "column op constant"
+    non_null = 1 - column_statistics["null_fraction"]
+    equal = 1 / column_statistics["distinct"] if column_statistics["distinct"] else 0.0
+    if operator_value == "=":
+        return non_null * equal
+    if operator_value == "!=":
+        return non_null * (1 - equal)
+
+    histogram = column_statistics.get("histogram")
+    if not histogram or type(value) != type(histogram[0]):
+        return DEFAULT_SELECTIVITY[operator_value]
+    below = estimate_fraction_below(histogram, value)
+    if operator_value == "<":
+        fraction = below
+    elif operator_value == "<=":
+        fraction = below + equal
+    elif operator_value == ">":
+        fraction = 1 - below - equal
+    else:
+        fraction = 1 - below
+    return non_null * min(1.0, max(0.0, fraction))
+
+# selectivity of predicates without statistics (fraction of records which satisfy predicate)
+DEFAULT_SELECTIVITY = {"=": 0.1, "!=": 0.9, "<": 1 / 3, "<=": 1 / 3, ">": 1 / 3, ">=": 1 / 3}
+INDEX_LOOKUP_COST = 2.0                                             # cost of reading record through index relative to sequential read
+
+def estimate_selectivity(predicate, table_stats):                   # Fraction of records (or record pairs) which satisfy predicate
+    # table_stats: {table_name: {"row_count": n, "columns": column statistics collected by analyze}}
+    if predicate.equi_join:                                         # each record matches records having same value in other table
+        distinct_counts = []
+        for table_name, key in predicate.equi_join:
+            column_statistics = table_stats[table_name]["columns"].get(key.split(".", 1)[1])
+            distinct_counts.append(column_statistics["distinct"] if column_statistics else table_stats[table_name]["row_count"])
+        return 1 / max(distinct_counts + [1])
+    if predicate.constant_comparison:
+        key, operator_value, value = predicate.constant_comparison
+        table_name, column_name = key.split(".", 1)
+        column_statistics = table_stats.get(table_name, {"columns": {}})["columns"].get(column_name)
+        if column_statistics is not None:
+            return estimate_comparison_selectivity(column_statistics, operator_value, value)
+        return DEFAULT_SELECTIVITY[operator_value]
+    return 0.5
+
+def get_table_stats(storage, table):                                # Current row count with column statistics of last analyze
+    return {"row_count": get_row_count(storage, table.name), "columns": table.statistics.get("columns", {})}
+
+def choose_access_path(table, predicates):                          # Cheapest way to read records which may satisfy predicates
+    # returns [kind, detail, fraction of records read, lookup] (kind: "pk", "index", "scan"), cost is relative to full scan
+    # ordered paths ("pk order", "index order") are chosen by choose_order_path
+    pk_values = get_point_lookup(predicates, table)
+    if pk_values is not None:
+        return ["pk", pk_values, 0.0, None]
+
+    best_path = ["scan", None, 1.0, None]
+    best_cost = 1.0
+    for index_name, column_name in table.indexes.items():
+        column_key = table.name + "." + column_name
+        key_range = get_index_range(predicates, column_key, table.columns[column_name].type)
+        if key_range is None:
+            continue
+        fraction = estimate_index_fraction(table, predicates, column_key)
+        if fraction * INDEX_LOOKUP_COST < best_cost:
+            best_path = ["index", index_name, fraction, key_range]
+            best_cost = fraction * INDEX_LOOKUP_COST
+    return best_path
+
+def estimate_index_fraction(table, predicates, column_key):          # Fraction of records found through index on column for predicates
+    table_stats = {table.name: {"row_count": 0, "columns": table.statistics.get("columns", {})}}
+    fraction = 1.0
+    for predicate in predicates:
+        if predicate.constant_comparison and predicate.constant_comparison[0] == column_key and predicate.constant_comparison[1] != "!=":
+            fraction *= estimate_selectivity(predicate, table_stats)
+    return fraction
+
+def choose_order_path(table, predicates, order_keys):               # Access path reading records in order of sort keys (None when records have to be sorted)
+    # order_keys: [("table.column", descending)], primary key index and secondary indexes keep keys in value order
+    descending = order_keys[0][1]
+    if table.storage == "column" or any(key_descending != descending for _, key_descending in order_keys):
+        return None
+    column_names = [key.split(".", 1)[1] for key, _ in order_keys]
+    if table.primary_key and column_names[:len(table.primary_key)] == table.primary_key[:len(column_names)]:
+        return ["pk order", None, 1.0, descending]
+    if len(column_names) > 1:                                       # records having same index key are not ordered by other columns
+        return None
+
+    column_key = order_keys[0][0]
+    for index_name, column_name in table.indexes.items():
+        if column_name != column_names[0]:
+            continue
+        key_range = get_index_range(predicates, column_key, table.columns[column_name].type)
+        if key_range is None:
+            if table.columns[column_name].is_nullable:              # nulls are not indexed, comparison on column would have ruled them out
+                continue
+            key_range = [None, True, None, True]
+        return ["index order", index_name, estimate_index_fraction(table, predicates, column_key), [key_range, descending]]
+    return None
+
+def read_record_ids(storage, table, access_path):                   # Record ids found by access path, in insertion order (key order for ordered paths)
+    kind, detail, _, key_range = access_path
+    if kind == "pk":
+        if any(isinstance(value, int) and not INT_MIN <= value <= INT_MAX for value in detail):    # no stored key has value out of int range
+            return []
+        build_pk_index(storage, table)
+        record_id = storage.get_pk_index().get(encode_pk_key(table.name, detail))
+        return [int(record_id)] if record_id is not None else []
+    if kind == "index":
+        return sorted(scan_index(storage.get_index(table, detail), key_range))
+    if kind == "pk order":                                          # lookup of ordered path is descending flag
+        build_pk_index(storage, table)
+        return scan_pk_order(storage.get_pk_index(), table.name, key_range)
+    if kind == "index order":
+        return scan_index(storage.get_index(table, detail), *key_range)
+    return iterate_record_ids(storage.get_database(), storage.get_directory(), table.name)
+
+def get_predicate_text(tree):                                       # Source text of where clause conjunct (shown by explain)
+    words = []
+    prefix = ""
+    for child in tree.children:
+        if isinstance(child, Tree) and child.data == "table_name":  # table name is joined to following column name
+            prefix = get_predicate_text(child) + "."
+        elif child is not None:
+            words.append(prefix + (str(child) if isinstance(child, Token) else get_predicate_text(child)))
+            prefix = ""
+    return " ".join(words)
+
+def plan_table_access(storage, table, predicates, table_stats, access_path=None):   # Plan reading table and checking its local predicates
+    row_count = table_stats[table.name]["row_count"]
+    if access_path is None:
+        access_path = choose_access_path(table, [predicate for predicate in predicates if predicate.constant_comparison])
+    kind, detail, fraction, lookup = access_path
+
+    if kind == "pk":
+        node = PlanNode("Primary Key Lookup", f"on {table.name}", [], min(1, row_count), lambda: scan_table(storage, table, access_path))
+    elif kind == "pk order":
+        node = PlanNode("Primary Key Order Scan", f"on {table.name}" + (" descending" if lookup else ""), [], row_count,
+                        lambda: scan_table(storage, table, access_path))
+    elif kind == "index order":
+        node = PlanNode("Index Order Scan", f"on {table.name} using {detail}" + (" descending" if lookup[1] else ""), [], row_count * fraction,
+                        lambda: scan_table(storage, table, access_path))
+    elif kind == "index":
+        node = PlanNode("Index Scan", f"on {table.name} using {detail}", [], row_count * fraction, lambda: scan_table(storage, table, access_path))
+    elif use_parallel_scan(storage, table, access_path, row_count): # workers check predicates while decoding records
+        estimated_rows = row_count
+        for predicate in predicates:
+            estimated_rows *= estimate_selectivity(predicate, table_stats)
+        detail = f"on {table.name}" + (" filter " + " and ".join(predicate.text for predicate in predicates) if predicates else "")
+        return PlanNode("Parallel Scan", detail + f" ({storage.parallel_degree} workers)", [], estimated_rows,
+                        lambda: parallel_scan(storage, table, predicates))
+    else:
+        node = PlanNode("Scan", f"on {table.name}", [], row_count, lambda: scan_table(storage, table, access_path))
+
+    if predicates:
+        estimated_rows = row_count
+        for predicate in predicates:
+            estimated_rows *= estimate_selectivity(predicate, table_stats)
+        check = combine_predicates(predicates)
+        node = PlanNode("Filter", " and ".join(predicate.text for predicate in predicates), [node], min(node.estimated_rows, estimated_rows),
+                        lambda records: filter_records(records, check))
+    return node
+
+def choose_join_order(table_names, estimated_rows, predicates, table_stats):  # Left-deep join order with least estimated cost
+    # dynamic programming over sets of joined tables (greedy when there are many tables), ties keep order of from clause
+    # cost counts records read, built into hash tables, compared by nested loops and produced by each join
+    def join_step(joined, rows, cost, table_name):
+        applicable = [predicate for predicate in predicates if table_name in predicate.tables and predicate.tables <= joined | {table_name}]
+        inner_rows = estimated_rows[table_name]
+        if any(predicate.equi_join for predicate in applicable):
+            step_cost = rows + 2 * inner_rows                       # probe outer records, build hash table of inner records
+        else:
+            step_cost = rows * inner_rows                           # nested loop compares every pair
+        output_rows = rows * inner_rows
+        for predicate in applicable:
+            output_rows *= estimate_selectivity(predicate, table_stats)
+        return output_rows, cost + inner_rows + step_cost + output_rows
+
+    if len(table_names) > 8:
+        order = [min(table_names, key=lambda table_name: estimated_rows[table_name])]
+        rows, cost = estimated_rows[order[0]], estimated_rows[order[0]]
+        while len(order) < len(table_names):
+            steps = [(join_step(set(order), rows, cost, table_name), table_name) for table_name in table_names if table_name not in order]
+            (rows, cost), next_table = min(steps, key=lambda step: step[0][1])
+            order.append(next_table)
+        return order
+
+    best = {frozenset([table_name]): (estimated_rows[table_name], estimated_rows[table_name], [table_name]) for table_name in table_names}
+    for _ in range(len(table_names) - 1):
+        next_best = {}
+        for joined, (rows, cost, order) in best.items():
+            for table_name in table_names:
+                if table_name in joined:
+                    continue
+                output_rows, total_cost = join_step(set(joined), rows, cost, table_name)
+                key = joined | {table_name}
+                if key not in next_best or total_cost < next_best[key][1]:
+                    next_best[key] = (output_rows, total_cost, order + [table_name])
+        best = next_best
+    return list(best.values())[0][2]
+
+def plan_joins(order, access_nodes, predicates, table_stats):       # Plan joining tables in given order along given predicates
+    # access_nodes: {table_name: PlanNode}, predicates: Predicate objects which reference more than one table
+    # records of first table are streamed, records of other tables are held in memory by join operators
+    joined_tables = {order[0]}
+    plan = access_nodes[order[0]]
+    remaining_predicates = list(predicates)
+
+    for next_table in order[1:]:
+        joined_tables.add(next_table)
+
+        # collect predicates which become checkable after joining next_table
+        outer_keys = []
+        inner_keys = []
+        join_predicates = []
+        residual_predicates = []
+        for predicate in list(remaining_predicates):
+            if not predicate.tables <= joined_tables:
+                continue
+            remaining_predicates.remove(predicate)
+
+            if predicate.equi_join and next_table in predicate.tables:
+                (outer_table, outer_key), (inner_table, inner_key) = predicate.equi_join
+                if outer_table == next_table:
+                    outer_key, inner_key = inner_key, outer_key
+                outer_keys.append(outer_key)
+                inner_keys.append(inner_key)
+                join_predicates.append(predicate)
+            else:
+                residual_predicates.append(predicate)
+
+        inner = access_nodes[next_table]
+        estimated_rows = plan.estimated_rows * inner.estimated_rows
+        for predicate in join_predicates + residual_predicates:
+            estimated_rows *= estimate_selectivity(predicate, table_stats)
+        detail = " and ".join(predicate.text for predicate in join_predicates + residual_predicates)
+
+        if outer_keys:                                              # hash join, then check residual predicates
+            residual_check = combine_predicates(residual_predicates)
+            plan = PlanNode("Hash Join", detail, [plan, inner], estimated_rows,
+                            lambda outer, inner, outer_keys=outer_keys, inner_keys=inner_keys, check=residual_check:
+                                filter_records(hash_join(outer, inner, outer_keys, inner_keys), check))
+        else:                                                       # block nested loop join
+            plan = PlanNode("Nested Loop Join", detail, [plan, inner], estimated_rows,
+                            lambda outer, inner, residual_predicates=residual_predicates:
+                                nested_loop_join(outer, inner, residual_predicates))
+
+    return plan
+
+def plan_batch_scan(storage, table, predicates, column_names, table_stats):   # Plan of reading and filtering batches of given columns of single table
+    # returns None when records are better read one at a time (primary key lookup, parallel scan)
+    row_count = table_stats[table.name]["row_count"]
+    access_path = choose_access_path(table, [predicate for predicate in predicates if predicate.constant_comparison])
+    kind, detail, fraction, _ = access_path
+    if kind == "pk" or use_parallel_scan(storage, table, access_path, row_count):
+        return None
+
+    batch_size = storage.batch_size
+    keys = set(column_names)                                        # columns read by filter and operator above
+    for predicate in predicates:
+        keys.update(table.name + "." + column_name.children[0].value.lower() for column_name in predicate.tree.find_data("column_name"))
+    keys = [table.name + "." + column_name for column_name in table.column_names if table.name + "." + column_name in keys]
+
+    if table.storage == "column":                                   # chunks are batches, chunks ruled out by min/max are not read
+        node = PlanNode("Column Scan", f"on {table.name}", [], row_count,
+                        lambda: scan_column_batches(storage, table, keys, predicates), batch=True)
+    elif kind == "index":
+        node = PlanNode("Batch Index Scan", f"on {table.name} using {detail} (batch size {batch_size})", [], row_count * fraction,
+                        lambda: scan_batches(storage, table, access_path, batch_size, keys), batch=True)
+    else:
+        node = PlanNode("Batch Scan", f"on {table.name} (batch size {batch_size})", [], row_count,
+                        lambda: scan_batches(storage, table, access_path, batch_size, keys), batch=True)
+
+    if predicates:
+        estimated_rows = row_count
+        for predicate in predicates:
+            estimated_rows *= estimate_selectivity(predicate, table_stats)
+        kernel = make_and_kernel([compile_batch_boolean_factor(predicate.tree, predicate.context) for predicate in predicates])
+        node = PlanNode("Batch Filter", " and ".join(predicate.text for predicate in predicates), [node], min(node.estimated_rows, estimated_rows),
+                        lambda batches: filter_batches(batches, kernel), batch=True)
+
+    return node
+
+def plan_batch_select(storage, table, predicates, select_column_names, table_stats):   # Plan of single table select run on column batches
+    node = plan_batch_scan(storage, table, predicates, select_column_names, table_stats)
+    if node is None:
+        return None
+    return PlanNode("Batch Project", ", ".join(select_column_names), [node], node.estimated_rows,
+                    lambda batches: project_batches(batches, select_column_names))
+
+def plan_select(storage, tables, table_names, predicates, select_column_names):  # Plan of select query (tables: {table_name: TableSchema})
+    table_stats = {table_name: get_table_stats(storage, tables[table_name]) for table_name in table_names}
+
+    if storage.batch_size and len(table_names) == 1:                # predicates and projection run on whole column batches
+        plan = plan_batch_select(storage, tables[table_names[0]], predicates, select_column_names, table_stats)
+        if plan is not None:
+            return plan
+
+    access_nodes = {}
+    for table_name in table_names:
+        local_predicates = [
+            predicate for predicate in predicates
+            if predicate.tables == {table_name} or (not predicate.tables and table_name == table_names[0])   # constant predicates are checked on the first table
+        ]
+        access_nodes[table_name] = plan_table_access(storage, tables[table_name], local_predicates, table_stats)
+
+    # join tables in cheapest order (equality predicates between tables are processed with hash join)
+    join_predicates = [predicate for predicate in predicates if len(predicate.tables) > 1]
+    estimated_rows = {table_name: access_nodes[table_name].estimated_rows for table_name in table_names}
+    order = choose_join_order(table_names, estimated_rows, join_predicates, table_stats)
+    plan = plan_joins(order, access_nodes, join_predicates, table_stats)
+
+    return PlanNode("Project", ", ".join(select_column_names), [plan], plan.estimated_rows,
+                    lambda records: project_records(records, select_column_names))
+
+def plan_aggregate(storage, tables, table_names, predicates, group_column_names, aggregates, output):   # Plan of select query with aggregates or group by
+    detail = ", ".join(aggregate.text for aggregate in aggregates)
+    if group_column_names:
+        detail += (" " if detail else "") + "group by " + ", ".join(group_column_names)
+
+    # count(*) of whole table is kept by insert and delete, so table is not read
+    if len(table_names) == 1 and not predicates and not group_column_names and all(aggregate.key is None for aggregate in aggregates):
+        table_name = table_names[0]
+        return PlanNode("Row Count", f"on {table_name} ({detail})", [], 1,
+                        lambda: iter([[get_row_count(storage, table_name)] * len(output)]))
+
+    # input rows of aggregate hold group columns followed by arguments of aggregates
+    input_column_names = list(group_column_names)
+    for aggregate in aggregates:
+        if aggregate.key is not None and aggregate.key not in input_column_names:
+            input_column_names.append(aggregate.key)
+    positions = [input_column_names.index(aggregate.key) if aggregate.key is not None else None for aggregate in aggregates]
+
+    table_stats = {table_name: get_table_stats(storage, tables[table_name]) for table_name in table_names}
+    if storage.batch_size and len(table_names) == 1 and not group_column_names:    # accumulators take selected values of whole batch
+        node = plan_batch_scan(storage, tables[table_names[0]], predicates, input_column_names, table_stats)
+        if node is not None:
+            return PlanNode("Batch Aggregate", detail, [node], 1, lambda batches: aggregate_batches(batches, aggregates, output))
+
+    node = plan_select(storage, tables, table_names, predicates, input_column_names)
+    estimated_rows = 1                                              # number of groups: product of distinct values of group columns
+    for col_name in group_column_names:
+        table_name, column_name = col_name.split(".", 1)
+        column_statistics = table_stats[table_name]["columns"].get(column_name)
+        estimated_rows *= column_statistics["distinct"] + (column_statistics["null_fraction"] > 0) if column_statistics else node.estimated_rows
+    return PlanNode("Hash Aggregate", detail, [node], min(estimated_rows, node.estimated_rows) if group_column_names else 1,
+                    lambda rows: hash_aggregate(rows, len(group_column_names), aggregates, positions, output))
+
+def plan_order(storage, plan, sort_keys, sort_text, limit, width):  # Plan sorting result rows of plan and keeping first limit rows
+    # sort_keys: [(position in row, descending)], width: number of selected columns when rows carry order by columns after them
+    if sort_keys and limit is not None:
+        return PlanNode("Top-K Sort", f"{sort_text} limit {limit}", [plan], min(plan.estimated_rows, limit),
+                        lambda rows: top_k_rows(rows, sort_keys, width, limit))
+    if sort_keys:
+        return PlanNode("Sort", f"{sort_text} (memory {storage.sort_memory // 1024} KB)", [plan], plan.estimated_rows,
+                        lambda rows: sort_rows(rows, sort_keys, width, storage.sort_memory))
+    if limit is not None:
+        return PlanNode("Limit", str(limit), [plan], min(plan.estimated_rows, limit), lambda rows: islice(rows, limit))
+    return plan
+
+def plan_ordered_select(storage, table, predicates, select_column_names, order_keys, limit):   # Plan of single table select read in order of key
+    # returns None when no primary key or index gives order of order_keys ([("table.column", descending)]), or another access path is better
+    comparisons = [predicate for predicate in predicates if predicate.constant_comparison]
+    order_path = choose_order_path(table, comparisons, order_keys)
+    access_path = choose_access_path(table, comparisons)
+    if order_path is None or access_path[0] == "pk" or (access_path[0] == "index" and access_path[1] != order_path[1]):
+        return None
+
+    node = plan_table_access(storage, table, predicates, {table.name: get_table_stats(storage, table)}, order_path)
+    node = PlanNode("Project", ", ".join(select_column_names), [node], node.estimated_rows,
+                    lambda records: project_records(records, select_column_names))
+    return plan_order(storage, node, [], "", limit, None)           # records come in order, limit stops reading them
+
+def get_table_data_path(db_path):                                   # Records of all tables are stored next to the database file
+    return os.path.splitext(db_path)[0] + "_tables.db"
+
+def migrate_table_data(database, directory, table_data, table_name):    # Move records of old databases out of catalog into table sub-database
+    for record_id in iterate_record_ids(database, directory, table_name):
+        legacy_key = bytes("table_list/" + table_name + "/" + str(record_id), "utf-8")
+        data = database.get(legacy_key)
+        if data is not None:
+            table_data.put(get_record_key(record_id), data)
+            database.delete(legacy_key)
+
+def get_column_data_path(db_path):                                  # Column segments of column tables are stored next to the database file
+    return os.path.splitext(db_path)[0] + "_columns.db"
+
+COLUMN_CHUNK_ROWS = 4096                                            # records moved out of append buffer into one chunk
+COLUMN_COMPACT_FRACTION = 0.5                                       # chunk is rewritten once this fraction of its records is deleted
+ROW_ID_SEGMENT = "#ids"                                             # segment holding record ids of chunk (not a valid column name)
+
+def encode_chunk_key(kind, chunk_no, column_name=None):             # Key of chunk entry in column table ({kind}/{big endian chunk}[/{column}])
+    # kind: chunk (row count, min and max of columns), segment (values of one column), deleted (bitmap of deleted positions)
+    key = bytes(kind + "/", "utf-8") + chunk_no.to_bytes(8, "big")
+    return key + bytes("/" + column_name, "utf-8") if column_name is not None else key
+
+def encode_buffer_key(record_id):                                   # Key of record in append buffer of column table (sorted by uuid)
+    return b"buffer/" + record_id.to_bytes(8, "big")
+
+def is_deleted(deleted, position):                                  # Whether position is set in delete bitmap of chunk
+    return deleted[position >> 3] & (1 << (position & 7))
+
+class ColumnTableData:                                              # Records of column table: column segments of chunks, append buffer and delete bitmaps
+    # inserted records are appended to buffer (encoded like rows) and moved into chunk of column segments once buffer is full
+    # record directory value of record stored in chunk is its chunk number, so point access finds it without scanning
+    # get, put and delete take record keys like sub-database of row table, so insert, update and delete work on both layouts
+    def __init__(self, storage, handle, table):
+        self.storage = storage
+        self.handle = handle                                        # B-tree sub-database of table in column file
+        self.table = table
+
+    def get(self, key, default=None):                               # Encoded record (default when record does not exist)
+        record_id = int(key)
+        data = self.handle.get(encode_buffer_key(record_id))
+        if data is not None:
+            return data
+        location = self.locate(record_id)
+        if location is None:
+            return default
+        chunk_no, position = location
+        return self.table.codec.encode({self.table.name + "." + column_name: self.read_segment(chunk_no, column_name)[position]
+                                        for column_name in self.table.column_names})
+
+    def put(self, key, data):                                       # Write record into append buffer (updated record moves out of its chunk)
+        record_id = int(key)
+        location = self.locate(record_id)
+        if location is not None:
+            self.mark_deleted(*location)
+            self.storage.get_directory().put(encode_record_key(self.table.name, record_id), b"")
+        buffer_key = encode_buffer_key(record_id)
+        if not self.handle.exists(buffer_key):
+            self.set_buffer_rows(self.get_buffer_rows() + 1)
+        self.handle.put(buffer_key, data)
+
+    def delete(self, key):                                          # Remove buffered record, or mark record of chunk in delete bitmap
+        record_id = int(key)
+        buffer_key = encode_buffer_key(record_id)
+        if self.handle.exists(buffer_key):
+            self.handle.delete(buffer_key)
+            self.set_buffer_rows(self.get_buffer_rows() - 1)
+            return
+        location = self.locate(record_id)
+        if location is not None:
+            self.mark_deleted(*location)
+
+    def exists(self, key):
+        return self.get(key) is not None
+
+    def close(self):
+        self.handle.close()
+
+    def locate(self, record_id):                                    # (chunk number, position) of live record stored in chunk (None otherwise)
+        location = self.storage.get_directory().get(encode_record_key(self.table.name, record_id))
+        if not location:                                            # buffered (empty value) or not existing
+            return None
+        chunk_no = int.from_bytes(location, "big")
+        record_ids = self.read_segment(chunk_no, ROW_ID_SEGMENT)
+        position = bisect_left(record_ids, record_id)               # records of chunk are sorted by uuid
+        if position == len(record_ids) or record_ids[position] != record_id:
+            return None
+        deleted = self.read_deleted(chunk_no)
+        if deleted is not None and is_deleted(deleted, position):
+            return None
+        return chunk_no, position
+
+    def get_buffer_rows(self):                                      # Number of records in append buffer
+        buffer_rows = self.handle.get(b"buffer_rows")
+        return int(buffer_rows) if buffer_rows is not None else 0
+
+    def set_buffer_rows(self, buffer_rows):
+        self.handle.put(b"buffer_rows", bytes(str(buffer_rows), "utf-8"))
+
+    def iterate_buffer(self):                                       # Yield (uuid, encoded record) of buffered records in insertion order
+        cursor = self.handle.cursor()
+        try:
+            x = cursor.set_range(b"buffer/")
+            while x is not None and x[0].startswith(b"buffer/"):
+                yield int.from_bytes(x[0][len(b"buffer/"):], "big"), x[1]
+                x = cursor.next()
+        finally:
+            cursor.close()
+
+    def iterate_chunks(self, kind="chunk"):                         # Yield (chunk number, value) of chunk entries of given kind in chunk order
+        prefix = bytes(kind + "/", "utf-8")
+        cursor = self.handle.cursor()
+        try:
+            x = cursor.set_range(prefix)
+            while x is not None and x[0].startswith(prefix):
+                yield int.from_bytes(x[0][len(prefix):], "big"), x[1]
+                x = cursor.next()
+        finally:
+            cursor.close()
+
+    def read_chunk(self, chunk_no):                                 # {"rows": n, "min": {column: value}, "max": {column: value}} (nulls are left out)
+        return loads(self.handle.get(encode_chunk_key("chunk", chunk_no)).decode("utf-8"))
+
+    def read_segment(self, chunk_no, column_name):                  # Values of column in chunk, in order of records
+        return loads(self.handle.get(encode_chunk_key("segment", chunk_no, column_name)).decode("utf-8"))
+
+    def read_deleted(self, chunk_no):                               # Delete bitmap of chunk (None when no record of chunk is deleted)
+        return self.handle.get(encode_chunk_key("deleted", chunk_no))
+
+    def mark_deleted(self, chunk_no, position):
+        deleted = self.read_deleted(chunk_no)
+        deleted = bytearray(deleted) if deleted is not None else bytearray((self.read_chunk(chunk_no)["rows"] + 7) // 8)
+        deleted[position >> 3] |= 1 << (position & 7)
+        self.handle.put(encode_chunk_key("deleted", chunk_no), bytes(deleted))
+
+    def write_chunk(self, chunk_no, record_ids, records):           # Store records (sorted by uuid) as column segments of chunk
+        chunk = {"rows": len(record_ids), "min": {}, "max": {}}
+        for column_name in self.table.column_names:
+            values = [record[self.table.name + "." + column_name] for record in records]
+            present = [value for value in values if value is not None]
+            if present:
+                chunk["min"][column_name] = min(present)
+                chunk["max"][column_name] = max(present)
+            self.handle.put(encode_chunk_key("segment", chunk_no, column_name), bytes(dumps(values), "utf-8"))
+        self.handle.put(encode_chunk_key("segment", chunk_no, ROW_ID_SEGMENT), bytes(dumps(record_ids), "utf-8"))
+        self.handle.put(encode_chunk_key("chunk", chunk_no), bytes(dumps(chunk), "utf-8"))
+
+    def remove_chunk(self, chunk_no):
+        for column_name in self.table.column_names + [ROW_ID_SEGMENT]:
+            self.handle.delete(encode_chunk_key("segment", chunk_no, column_name))
+        self.handle.delete(encode_chunk_key("chunk", chunk_no))
+        if self.read_deleted(chunk_no) is not None:
+            self.handle.delete(encode_chunk_key("deleted", chunk_no))
+
+    def next_chunk_no(self):                                        # Allocate number of new chunk
+        chunk_no = int(self.handle.get(b"next_chunk") or b"0")
+        self.handle.put(b"next_chunk", bytes(str(chunk_no + 1), "utf-8"))
+        return chunk_no
+
+def compact_column_table(storage, table):                           # Move full chunks out of append buffer, rewrite chunks with many deleted records
+    column_data = storage.get_table_data(table.name)
+    directory = storage.get_directory()
+
+    while column_data.get_buffer_rows() >= COLUMN_CHUNK_ROWS:
+        buffered = column_data.iterate_buffer()
+        records = list(islice(buffered, COLUMN_CHUNK_ROWS))
+        buffered.close()                                            # cursor is closed before buffer is written
+
+        chunk_no = column_data.next_chunk_no()
+        column_data.write_chunk(chunk_no, [record_id for record_id, _ in records], [table.codec.decode(data) for _, data in records])
+        for record_id, _ in records:
+            column_data.handle.delete(encode_buffer_key(record_id))
+            directory.put(encode_record_key(table.name, record_id), chunk_no.to_bytes(8, "big"))
+        column_data.set_buffer_rows(column_data.get_buffer_rows() - len(records))
+
+    for chunk_no, deleted in list(column_data.iterate_chunks("deleted")):
+        rows = column_data.read_chunk(chunk_no)["rows"]
+        if sum(bin(byte).count("1") for byte in deleted) < rows * COLUMN_COMPACT_FRACTION:
+            continue
 
+        # remaining records keep chunk number (and record directory entries), deleted positions are dropped
+        positions = [position for position in range(rows) if not is_deleted(deleted, position)]
+        record_ids = column_data.read_segment(chunk_no, ROW_ID_SEGMENT)
+        columns = {table.name + "." + column_name: column_data.read_segment(chunk_no, column_name) for column_name in table.column_names}
+        records = [{key: values[position] for key, values in columns.items()} for position in positions]
+        column_data.remove_chunk(chunk_no)
+        if positions:
+            column_data.write_chunk(chunk_no, [record_ids[position] for position in positions], records)
+
+def chunk_may_match(chunk, comparisons):                            # Whether min/max of chunk allow records satisfying all comparisons
+    # comparisons: [(column_name, operator, constant)] taken from conjuncts of where clause
+    for column_name, operator_value, value in comparisons:
+        if column_name not in chunk["min"]:                         # only nulls: comparison is never true
+            return False
+        low, high = chunk["min"][column_name], chunk["max"][column_name]
+        if operator_value == "=" and not low <= value <= high:
+            return False
+        if operator_value == "!=" and low == high == value:
+            return False
+        if (operator_value == "<" and not low < value) or (operator_value == "<=" and not low <= value):
+            return False
+        if (operator_value == ">" and not high > value) or (operator_value == ">=" and not high >= value):
+            return False
+    return True
+
+def scan_column_batches(storage, table, keys, predicates=(), with_ids=False):   # Scan operator of column table: yield batch per chunk, then buffered records
+    # only segments of columns given by keys ("table.column") are read, chunks ruled out by min/max are skipped
+    column_data = storage.get_table_data(table.name)
+    comparisons = [(key[len(table.name) + 1:], operator_value, value) for key, operator_value, value in
+                   [predicate.constant_comparison for predicate in predicates if predicate.constant_comparison]
+                   if key.startswith(table.name + ".")]
+
+    for chunk_no, chunk in list(column_data.iterate_chunks()):
+        chunk = loads(chunk.decode("utf-8"))
+        if not chunk_may_match(chunk, comparisons):
+            continue
+        batch = RecordBatch({key: column_data.read_segment(chunk_no, key[len(table.name) + 1:]) for key in keys}, chunk["rows"])
+        deleted = column_data.read_deleted(chunk_no)
+        if deleted is not None:
+            batch.selection = [position for position in range(batch.size) if not is_deleted(deleted, position)]
+        if with_ids:
+            batch.ids = column_data.read_segment(chunk_no, ROW_ID_SEGMENT)
+        if batch.selection:
+            yield batch
+
+    buffered = list(column_data.iterate_buffer())                   # less than a chunk after compaction
+    for start in range(0, len(buffered), COLUMN_CHUNK_ROWS):
+        records = buffered[start:start + COLUMN_CHUNK_ROWS]
+        batch = RecordBatch(table.codec.decode_columns([data for _, data in records], keys), len(records))
+        if with_ids:
+            batch.ids = [record_id for record_id, _ in records]
+        yield batch
+
+def get_record_directory_path(db_path):                             # Record directory is stored next to the database file
+    return os.path.splitext(db_path)[0] + "_records.db"
+
+def open_record_directory(db_path, env=None):                       # Open (or create) record directory
+    directory = db.DB(env)
+    directory.open(get_record_directory_path(db_path), None, db.DB_BTREE, db.DB_CREATE | db.DB_THREAD)
+    return directory
+
+def encode_record_key(table_name, record_id=None):                  # Encode record directory key ({table_name}/{big endian uuid})
+    # record_id None encodes the prefix shared by all records of table_name
+    prefix = bytes(table_name + "/", "utf-8")
+    return prefix + record_id.to_bytes(8, "big") if record_id is not None else prefix
+
+def iterate_record_ids(database, directory, table_name):            # Yield record ids of table in insertion order
+    migrate_record_ids(database, directory, table_name)
+
+    prefix = encode_record_key(table_name)
+    cursor = directory.cursor()
+    try:
+        x = cursor.set_range(prefix)                                # B-tree keys of a table are contiguous and sorted by uuid
+        while x is not None and x[0].startswith(prefix):
+            yield int.from_bytes(x[0][len(prefix):], "big")
             x = cursor.next()
+    finally:
+        cursor.close()
 
-        if referenced_by_tables:
-            child_table_foreign_key_values = []
+def add_record_id(database, directory, table_name, record_id):      # Append record id to record directory
+    migrate_record_ids(database, directory, table_name)
+    directory.put(encode_record_key(table_name, record_id), b"")
 
-            for idx, referenced_by_table in enumerate(referenced_by_tables):
-                child_record_ids = loads(database.get(bytes("table_list/" + referenced_by_table + "/record_ids", "utf-8")).decode("utf-8"))
-                referenced_by_column = referenced_by_columns[idx]
+def remove_record_id(directory, table_name, record_id):             # Remove record id from record directory
+    key = encode_record_key(table_name, record_id)
+    if directory.exists(key):
+        directory.delete(key)
 
-                for record_id in child_record_ids:
-                    record = loads(database.get(bytes("table_list/" + referenced_by_table + "/" + str(record_id), "utf-8")).decode("utf-8"))
-                    child_table_foreign_key_values.append(record[f"{referenced_by_table}.{referenced_by_column}"])
+def drop_record_directory(directory, table_name):                   # Delete all record ids of given table
+    prefix = encode_record_key(table_name)
+    cursor = directory.cursor()
+    x = cursor.set_range(prefix)
 
-            for delete_uuid in delete_uuids:
-                record = loads(database.get(bytes("table_list/" + table_name + "/" + str(delete_uuid), "utf-8")).decode("utf-8"))
-                if record[f"{table_name}.{referencing_column}"] in child_table_foreign_key_values:
-                    self.result = [True, f"{len(delete_uuids)} row(s) are not deleted due to referential integrity"]
-                    return
+    while x is not None and x[0].startswith(prefix):
+        cursor.delete()
+        x = cursor.next()
 
-        success_count = 0
-        delete_uuids_str = [str(uuid) for uuid in delete_uuids]
+    cursor.close()
 
-        # delete records that satisfy predicate condition
-        x  = cursor.first()
-
-        while x is not None:
-            leaf_str = str(x[0]).strip("'").split("/")[-1]
-            if x[0].startswith(bytes("table_list/" + table_name, "utf-8")) and leaf_str in delete_uuids_str:
-                database.delete(x[0])
-                success_count += 1
-            x = cursor.next()
-
-        # update record_ids information in table metadata
-        updated_record_ids = list(set(record_ids).difference(set(delete_uuids)))
-
-        database.put(bytes("table_list/" + table_name + "/record_ids", "utf-8"), bytes(dumps(updated_record_ids), "utf-8"))
-        
-        cursor.close()                                                      # Close cursor
-        database.close()                                                    # Close database
-        self.result = [True, f"{success_count} row(s) deleted"]
+def migrate_record_ids(database, directory, table_name):            # Move JSON record id list of old databases into record directory
+    legacy_key = bytes("table_list/" + table_name + "/record_ids", "utf-8")
+    legacy_record_ids = database.get(legacy_key)
+    if legacy_record_ids is None:                                   # already migrated
         return
-    
-    def update_query(self, items):
 
-        # implement update query
+    for record_id in loads(legacy_record_ids.decode("utf-8")):
+        directory.put(encode_record_key(table_name, record_id), b"")
+    database.delete(legacy_key)
+
+def get_pk_index_path(db_path):                                   # Primary key index is stored next to the database file
+    return os.path.splitext(db_path)[0] + "_pk_index.db"
+
+def open_pk_index(db_path, env=None):                               # Open (or create) primary key index
+    pk_index = db.DB(env)
+    pk_index.open(get_pk_index_path(db_path), None, db.DB_BTREE, db.DB_CREATE | db.DB_THREAD)
+    return pk_index
+
+PK_INDEX_MARKER = b"\xff"                                          # marker key suffix, sorts after every encoded value (they start with type byte)
+
+def encode_pk_value(value):                                         # Encode value of key column (byte order follows value order)
+    if value is None:
+        return b"\x00"
+    if isinstance(value, int):
+        return b"\x01" + (value + (1 << 63)).to_bytes(8, "big")      # shift sign so negative values come first
+    return b"\x02" + bytes(value, "utf-8") + b"\x00"                 # char, date: terminator orders shorter value first
+
+def encode_pk_key(table_name, pk_values=None):                      # Encode primary key tuple as index key ({table_name}/{encoded values})
+    # pk_values None encodes the marker key which tells the index of table_name is built
+    # keys of table follow order of primary key values, so index is read in primary key order
+    prefix = bytes(table_name + "/", "utf-8")
+    return prefix + (b"".join(map(encode_pk_value, pk_values)) if pk_values is not None else PK_INDEX_MARKER)
+
+def build_pk_index(storage, table):                                 # Build primary key index of existing table once
+    table_name = table.name
+    pk_index = storage.get_pk_index()
+    if pk_index.exists(encode_pk_key(table_name)):                  # index is already built
         return
-    
-def print_table_schema(table_name, column_names, database):
-    result = "-" * 65 + "\n"
-    result += f"table_name [{table_name}]\n"
-    result += f"{'column_name':<20}{'type':<15}{'null':<15}{'key':<15}\n"  # alignment setting
 
-    for column_name in column_names:
-        column_type = database.get(bytes("table_list/" + table_name + "/" + column_name + "/type", "utf-8")).decode("utf-8")
-        column_is_nullable = database.get(bytes("table_list/" + table_name + "/" + column_name + "/is_nullable", "utf-8")).decode("utf-8")
-        column_is_pk = database.get(bytes("table_list/" + table_name + "/" + column_name + "/is_pk", "utf-8")).decode("utf-8")
-        column_is_fk = database.get(bytes("table_list/" + table_name + "/" + column_name + "/is_fk", "utf-8")).decode("utf-8")
+    drop_pk_index(pk_index, table_name)                             # keys of older layout (json of values) are removed first
+    for record_id, record in read_records(storage, table, ["scan", None, 1.0, None]):
+        pk_key = encode_pk_key(table_name, [record[table_name + "." + pk] for pk in table.primary_key])
+        pk_index.put(pk_key, bytes(str(record_id), "utf-8"))
 
-        null = "Y" if column_is_nullable == "True" else "N"
-        if column_is_pk == "True" and column_is_fk == "True":
-            key = "PRI/FOR"
-        elif column_is_pk == "True":
-            key = "PRI"
-        elif column_is_fk == "True":
-            key = "FOR"
-        else:
-            key = ""
+    pk_index.put(encode_pk_key(table_name), b"")
 
-        result += f"{column_name:<20}{column_type:<15}{null:<15}{key:<15}\n"
-
-    result += "-" * 65
-    return result
-    
-def print_table_select(select_column_names, selected_records, max_col_width_list):
-    separator = "".join(f"+{'-' * (width + 2)}" for width in max_col_width_list) + "+"
-    result = separator + "\n"
-
-    header = "| " + " | ".join(f"{str(col_name).upper():<{max_col_width_list[idx]}}" for idx, col_name in enumerate(select_column_names)) + " |"
-    result += header + "\n"
-
-    result += separator + "\n"
-
-    for record in selected_records:
-        row = "| " + " | ".join(f"{record[str(col_name)]:<{max_col_width_list[idx]}}" if record[str(col_name)] else f"{'NULL':<{max_col_width_list[idx]}}" for idx, col_name in enumerate(select_column_names)) + " |"
-        result += row + "\n"
+def scan_pk_order(pk_index, table_name, descending=False):          # Yield record ids of table in primary key order
+    prefix = bytes(table_name + "/", "utf-8")
+    marker = encode_pk_key(table_name)                              # marker sorts after every key of table
+    cursor = pk_index.cursor()
+    try:
+        if descending:                                              # start at last key before marker
+            x = cursor.prev() if cursor.set_range(marker) is not None else cursor.last()
+        else:
+            x = cursor.set_range(prefix)
+        while x is not None and x[0].startswith(prefix) and x[0] != marker:
+            yield int(x[1])
+            x = cursor.prev() if descending else cursor.next()
+    finally:
+        cursor.close()
+
+def drop_pk_index(pk_index, table_name):                            # Delete all index entries of given table (including marker)
+    prefix = bytes(table_name + "/", "utf-8")
+    cursor = pk_index.cursor()
+    x = cursor.set_range(prefix)                                    # B-tree keys of a table are contiguous
+
+    while x is not None and x[0].startswith(prefix):
+        cursor.delete()
+        x = cursor.next()
+
+    cursor.close()
+
+def get_fk_refs_path(db_path):                                      # Reference counts are stored next to the database file
+    return os.path.splitext(db_path)[0] + "_fk_refs.db"
+
+def open_fk_refs(db_path, env=None):                                # Open (or create) reference counts (parent key -> # of child rows)
+    fk_refs = db.DB(env)
+    fk_refs.open(get_fk_refs_path(db_path), None, db.DB_BTREE, db.DB_CREATE | db.DB_THREAD)
+    return fk_refs
+
+def get_fk_ref_count(fk_refs, table_name, pk_values):               # Number of child rows referencing primary key of table
+    count = fk_refs.get(encode_pk_key(table_name, pk_values))
+    return int(count) if count is not None else 0
+
+def build_fk_refs(storage, catalog, table):                         # Count references to table from all child tables once
+    # keys are same as primary key index ({table_name}/{pk values}), with marker key telling counts are built
+    fk_refs = storage.get_fk_refs()
+    if fk_refs.exists(encode_pk_key(table.name)):                   # counts are already built
+        return
 
-    result += separator
+    drop_fk_refs(fk_refs, table.name)                               # counts of older key layout are removed first
+    database = storage.get_database()
+    counts = {}
+    for child_table_name, idx in catalog.get_referenced_by(database, table.name):
+        child_table = catalog.get_table(database, child_table_name)
+        column_name = child_table_name + "." + child_table.foreign_key_values[idx]
+        for record in scan_table(storage, child_table):
+            pk_key = encode_pk_key(table.name, [record[column_name]])
+            counts[pk_key] = counts.get(pk_key, 0) + 1
+
+    for pk_key, count in counts.items():
+        fk_refs.put(pk_key, bytes(str(count), "utf-8"))
+    fk_refs.put(encode_pk_key(table.name), b"")
+
+def update_fk_refs(storage, table, records, delta):                 # Add delta to reference count of each parent key of records
+    # counts which are not built yet are skipped (they are counted from child rows when built)
+    fk_refs = storage.get_fk_refs()
+    changes = {}
+    for idx, col_name in enumerate(table.foreign_key_values):
+        referencing_table = table.referencing_tables[idx]
+        if not fk_refs.exists(encode_pk_key(referencing_table)):
+            continue
+        for record in records:
+            pk_key = encode_pk_key(referencing_table, [record[table.name + "." + col_name]])
+            changes[pk_key] = changes.get(pk_key, 0) + delta
+
+    for pk_key, change in changes.items():
+        count = int(fk_refs.get(pk_key) or b"0") + change
+        if count > 0:
+            fk_refs.put(pk_key, bytes(str(count), "utf-8"))
+        elif fk_refs.exists(pk_key):
+            fk_refs.delete(pk_key)
+
+def drop_fk_refs(fk_refs, table_name):                              # Delete reference counts of given table (including marker)
+    drop_pk_index(fk_refs, table_name)                              # same key layout as primary key index
+
+def get_index_path(db_path):                                        # Secondary indexes are stored next to the database file (one sub-database per index)
+    return os.path.splitext(db_path)[0] + "_indexes.db"
+
+def encode_index_key(value, column_type):                           # Encode column value as index key (byte order follows value order)
+    if column_type == "int":
+        return (value + (1 << 63)).to_bytes(8, "big")               # shift sign so negative values come first
+    return bytes(value, "utf-8")                                    # char, date (yyyy-mm-dd)
+
+def make_index_key_function(table, column_name):                    # Secondary key callback of index on column (nulls are not indexed)
+    codec = table.codec
+    column_key = table.name + "." + column_name
+    column_type = table.columns[column_name].type
+
+    def get_index_key(record_key, data):
+        value = codec.decode(data)[column_key]
+        return encode_index_key(value, column_type) if value is not None else db.DB_DONOTINDEX
+    return get_index_key
+
+def get_index_range(predicates, column_key, column_type):           # Key range of column fixed by predicates (None if column is not compared)
+    # returns [low, low_inclusive, high, high_inclusive] of encoded keys (None bound is open)
+    low, low_inclusive, high, high_inclusive = None, True, None, True
+    found = False
+    for predicate in predicates:
+        if not predicate.constant_comparison or predicate.constant_comparison[0] != column_key:
+            continue
+        _, operator_value, value = predicate.constant_comparison
+        if operator_value == "!=":
+            continue
+        found = True
+        if operator_value in ["=", ">", ">="] and (low is None or value > low or (value == low and operator_value == ">")):
+            low, low_inclusive = value, operator_value != ">"
+        if operator_value in ["=", "<", "<="] and (high is None or value < high or (value == high and operator_value == "<")):
+            high, high_inclusive = value, operator_value != "<"
+
+    if not found:
+        return None
+    if column_type == "int":                                        # stored ints are in int range, so wider bounds are clamped to it
+        if low is not None and low < INT_MIN:
+            low = None
+        elif low is not None and low > INT_MAX:                     # nothing is above
+            low, low_inclusive = INT_MAX, False
+        if high is not None and high > INT_MAX:
+            high = None
+        elif high is not None and high < INT_MIN:                   # nothing is below
+            high, high_inclusive = INT_MIN, False
+    return [
+        encode_index_key(low, column_type) if low is not None else None, low_inclusive,
+        encode_index_key(high, column_type) if high is not None else None, high_inclusive,
+    ]
+
+def scan_index(index, key_range, descending=False):                 # Yield record ids of index entries in key range (in key order)
+    low, low_inclusive, high, high_inclusive = key_range
+    cursor = index.cursor()
+    try:
+        if descending:                                              # start at last entry not above high (high + 0 byte is above every duplicate of high)
+            x = cursor.pget(high + b"\x00", flags=db.DB_SET_RANGE) if high is not None else None
+            x = cursor.pget(flags=db.DB_PREV) if x is not None else cursor.pget(flags=db.DB_LAST)
+        else:
+            x = cursor.pget(low, flags=db.DB_SET_RANGE) if low is not None else cursor.pget(flags=db.DB_FIRST)
+        while x is not None:
+            index_key, record_key, _ = x
+            if descending and low is not None and (index_key < low or (index_key == low and not low_inclusive)):
+                break
+            if not descending and high is not None and (index_key > high or (index_key == high and not high_inclusive)):
+                break
+            if (low_inclusive or index_key != low) and (high_inclusive or index_key != high):
+                yield int(record_key)
+            x = cursor.pget(flags=db.DB_PREV if descending else db.DB_NEXT)
+    finally:
+        cursor.close()
 
-    return result
-    
-def parse_where_clause(where_clause):
-    # TODO: integrate where clause processing
-    # TODO: consider antecedent for comparable_value
+class QueryError(Exception):                                        # Error raised while resolving query (message is shown to user)
     pass
 
-def check_predicate_condition(predicate, record):                           # Check if predicate condition is satisfied
-    # predicate: [expr_negation, [antecedent_table_name, antecedent_column_name, antecedent_column_type], operator, consequent]
-    # operator: =, !=, >, <, >=, <=, is, is not
-    # consequent: None or [consequent_table_name, consequent_column_type, consequent_column_name] or [comparable_value, comparable_value_type]
-    
-    antecedent_value = record[predicate[1][0] + "." + predicate[1][1]]      # antecedent value
-
-    if predicate[3] is None:                                                # Null predicate
-        result = (predicate[2] == "is") == (antecedent_value is None)
-
+def resolve_select_column(table_name_tree, column_name_tree, column_in_which_table, column_types):
+    # Resolve column reference of select list or group by clause, returns "table.column"
+    column_name = column_name_tree.children[0].value.lower()
+
+    # SelectColumnResolveError
+    if table_name_tree:                                             # if table name is specified
+        table_name = table_name_tree.children[0].value.lower()
+        if table_name + "." + column_name not in column_types:
+            raise QueryError(f"Selection has failed: fail to resolve '{table_name}.{column_name}'")
+        return table_name + "." + column_name
+
+    column_existence = column_in_which_table.get(column_name)     # if table name is ambiguous
+    if not column_existence or len(column_existence) > 1:
+        raise QueryError(f"Selection has failed: fail to resolve '{column_name}'")
+    return column_existence[0] + "." + column_name
+
+def make_aggregate(aggregate, column_in_which_table, column_types):    # Resolve aggregate of select list into Aggregate
+    function = aggregate.children[0].children[0].value.lower()
+    argument = aggregate.children[2]
+
+    # SelectAggregateError
+    if function not in AGGREGATE_FUNCTIONS:
+        raise QueryError(f"Selection has failed: unknown aggregate function '{function}'")
+    if not argument.children:                                       # function(*)
+        if function != "count":
+            raise QueryError("Selection has failed: '*' is only allowed in count")
+        key = None
     else:
-        if predicate[2] == "=":                                             # Equality predicate
-                predicate[2] = "=="
-
-        consequent_value = (                                                # Consequent value
-            record[predicate[3][0] + "." + predicate[3][2]]
-            if len(predicate[3]) == 3
-            else predicate[3][0]
-        )
-
-        if antecedent_value is None or consequent_value is None:            # comparison with null
-            return False
-        
-        # typecasting
-        if predicate[1][2] == "char" or predicate[3][1] == "char":
-            antecedent_value, consequent_value = f"'{antecedent_value}'", f"'{consequent_value}'"
-
-        if predicate[1][2] == "date" or predicate[3][1] == "date":
-            antecedent_value, consequent_value = f"'{antecedent_value}'", f"'{consequent_value}'"
+        key = resolve_select_column(argument.children[0], argument.children[1], column_in_which_table, column_types)
+        if function in ("sum", "avg") and column_types[key] != "int":
+            raise QueryError(f"Selection has failed: '{function}' needs int column")
+
+    text = f"{function}({key if key else '*'})"
+    label = aggregate.children[5].children[0].value.lower() if aggregate.children[5] else text
+    return Aggregate(function, key, text, label, column_types[key] if function in ("min", "max") else "int")
+
+class Predicate:                                                    # Compiled conjunct of where clause
+    def __init__(self, check, tables, equi_join=None, constant_comparison=None, text="", tree=None, context=None):
+        self.check = check                                          # callable(record) -> True, False or None (unknown, rejected like False)
+        self.tree = tree                                            # boolean_factor compiled into check (compiled again by parallel scan workers)
+        self.context = context
+        self.text = text                                            # source text of conjunct (shown by explain)
+        self.tables = tables                                        # set of table names referenced by predicate
+        self.equi_join = equi_join                                  # [(table, "table.column"), (table, "table.column")] when predicate is equality between two tables
+        self.constant_comparison = constant_comparison              # ("table.column", operator, value) when predicate compares column with constant
+
+COMPARISON_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+def parse_where_clause(where_clause, table_names, column_in_which_table, column_types):
+    # Compile where clause once into list of Predicate (conjuncts), raises QueryError on invalid where clause
+    # column_in_which_table: {column_name: [table_name, ...]}, column_types: {"table.column": type}
+    if where_clause is None:
+        return []
+
+    context = [table_names, column_in_which_table, column_types]
+    predicates = []
+
+    for boolean_factor in split_conjuncts(where_clause.children[1]):
+        tables = set()
+        check = compile_boolean_factor(boolean_factor, context, tables)
+        equi_join = get_equi_join(boolean_factor, context)
+        constant_comparison = get_constant_comparison(boolean_factor, context)
+        predicates.append(Predicate(check, tables, equi_join, constant_comparison, get_predicate_text(boolean_factor), boolean_factor, context))
+
+    return predicates
+
+def combine_predicates(predicates):                                 # Combine predicates into single check with AND
+    checks = [predicate.check for predicate in predicates]
+    if not checks:
+        return lambda record: True
+    if len(checks) == 1:
+        return checks[0]
+    return make_and_check(checks)
+
+def get_subtrees(tree):                                             # Children of tree without tokens (OR, AND, LP, ...)
+    return [child for child in tree.children if isinstance(child, Tree)]
+
+def split_conjuncts(boolean_expr):                                  # Split boolean_expr into boolean_factors combined with AND
+    boolean_terms = get_subtrees(boolean_expr)
+    if len(boolean_terms) != 1:                                     # disjunction is single conjunct
+        return [boolean_expr]
+
+    conjuncts = []
+    for boolean_factor in get_subtrees(boolean_terms[0]):
+        boolean_test = boolean_factor.children[1]
+        if boolean_factor.children[0] is None and boolean_test.children[0].data == "parenthesized_boolean_expr":
+            conjuncts += split_conjuncts(boolean_test.children[0].children[1])      # flatten "(a and b)"
+        else:
+            conjuncts.append(boolean_factor)
+    return conjuncts
+
+def compile_boolean_expr(boolean_expr, context, tables):            # boolean_term (OR boolean_term)*
+    checks = [compile_boolean_term(boolean_term, context, tables) for boolean_term in get_subtrees(boolean_expr)]
+    return checks[0] if len(checks) == 1 else make_or_check(checks)
+
+def compile_boolean_term(boolean_term, context, tables):            # boolean_factor (AND boolean_factor)*
+    checks = [compile_boolean_factor(boolean_factor, context, tables) for boolean_factor in get_subtrees(boolean_term)]
+    return checks[0] if len(checks) == 1 else make_and_check(checks)
+
+def compile_boolean_factor(boolean_factor, context, tables):        # [NOT] boolean_test
+    if boolean_factor.data == "boolean_expr":                       # disjunction split by split_conjuncts
+        return compile_boolean_expr(boolean_factor, context, tables)
+
+    boolean_test = boolean_factor.children[1].children[0]
+    if boolean_test.data == "parenthesized_boolean_expr":
+        check = compile_boolean_expr(boolean_test.children[1], context, tables)
+    elif boolean_test.children[0].data == "comparison_predicate":
+        check = compile_comparison_predicate(boolean_test.children[0], context, tables)
+    else:
+        check = compile_null_predicate(boolean_test.children[0], context, tables)
+
+    if boolean_factor.children[0] is not None:                      # NOT
+        return make_not_check(check)
+    return check
+
+# checks follow three-valued logic: comparison with null is unknown (None), NOT of unknown stays unknown
+def make_not_check(check):
+    def check_not(record):
+        result = check(record)
+        return None if result is None else not result
+    return check_not
+
+def make_and_check(checks):
+    def check_and(record):
+        result = True
+        for check in checks:
+            value = check(record)
+            if value is False:
+                return False
+            if value is None:
+                result = None
+        return result
+    return check_and
+
+def make_or_check(checks):
+    def check_or(record):
+        result = False
+        for check in checks:
+            value = check(record)
+            if value:
+                return True
+            if value is None:
+                result = None
+        return result
+    return check_or
+
+def resolve_where_column(table_name_tree, column_name, context, is_comparison=False):
+    # Resolve column reference of where clause, returns [table_name, "table.column", column_type]
+    table_names, column_in_which_table, column_types = context
+    table_name = table_name_tree.children[0].value.lower() if table_name_tree else None
+
+    # WhereTableNotSpecified
+    if table_name and table_name not in table_names:
+        raise QueryError("Where clause trying to reference tables which are not specified")
+
+    # compare to null with operators other than is/is not
+    if is_comparison and column_name == "null":
+        raise QueryError("Where clause trying to compare incomparable values")
+
+    # WhereColumnNotExist
+    if table_name and table_name + "." + column_name not in column_types:
+        raise QueryError("Where clause trying to reference non existing column")
+    if not table_name and column_name not in column_in_which_table:
+        raise QueryError("Where clause trying to reference non existing column")
+
+    # WhereAmbiguousReference
+    if not table_name and len(column_in_which_table[column_name]) != 1:
+        raise QueryError("Where clause contains ambiguous reference")
+
+    # clarify table name if not given
+    table_name = table_name if table_name else column_in_which_table[column_name][0]
+    column_type = column_types[table_name + "." + column_name]
+
+    return [table_name, table_name + "." + column_name, "char" if column_type.startswith("char") else column_type]
+
+def compile_comp_operand(comp_operand, context, tables):
+    # Returns [is_column, "table.column" or constant value, type] (type: int, char, date)
+    if len(comp_operand.children) == 1:                             # comparable value
+        token = comp_operand.children[0].children[0]
+        if token.type == "INT":
+            return [False, int(token.value), "int"]
+        if token.type == "STR":
+            return [False, token.value[1:-1], "char"]               # remove quotes
+        return [False, token.value, "date"]
+
+    column_name = comp_operand.children[1].children[0].value.lower()
+    table_name, key, column_type = resolve_where_column(comp_operand.children[0], column_name, context, is_comparison=True)
+    tables.add(table_name)
+    return [True, key, column_type]
+
+def compile_comparison_predicate(comparison_predicate, context, tables):
+    left = compile_comp_operand(comparison_predicate.children[0], context, tables)
+    operator_value = comparison_predicate.children[1].value
+    right = compile_comp_operand(comparison_predicate.children[2], context, tables)
+
+    # WhereIncomparableError
+    if left[2] != right[2]:
+        raise QueryError("Where clause trying to compare incomparable values")
+    if left[2] == "char" and operator_value not in ["=", "!="]:
+        raise QueryError("Where clause trying to compare incomparable values")
+
+    compare = COMPARISON_OPERATORS[operator_value]
+    left_key, right_key = left[1], right[1]
+
+    # comparison with null is unknown
+    if left[0] and right[0]:
+        def check(record):
+            left_value, right_value = record[left_key], record[right_key]
+            return None if left_value is None or right_value is None else compare(left_value, right_value)
+    elif left[0]:
+        def check(record):
+            value = record[left_key]
+            return None if value is None else compare(value, right_key)
+    elif right[0]:
+        def check(record):
+            value = record[right_key]
+            return None if value is None else compare(left_key, value)
+    else:                                                           # constant comparison is evaluated once
+        result = compare(left_key, right_key)
+        def check(record):
+            return result
+    return check
+
+def compile_null_predicate(null_predicate, context, tables):
+    column_name = null_predicate.children[1].children[0].value.lower()
+    table_name, key, _ = resolve_where_column(null_predicate.children[0], column_name, context)
+    tables.add(table_name)
+    is_null = null_predicate.children[2].children[1] is None        # IS [NOT] NULL
+
+    def check(record):
+        return (record[key] is None) == is_null
+    return check
+
+# batch kernels: callable(batch, positions) -> positions (ascending) of records satisfying condition, compiled from same trees as checks
+# kernel given unknown set also adds positions where condition is unknown (comparison with null), so NOT leaves them out like check does
+def compile_batch_boolean_expr(boolean_expr, context):              # boolean_term (OR boolean_term)*
+    kernels = [compile_batch_boolean_term(boolean_term, context) for boolean_term in get_subtrees(boolean_expr)]
+    return kernels[0] if len(kernels) == 1 else make_or_kernel(kernels)
+
+def compile_batch_boolean_term(boolean_term, context):              # boolean_factor (AND boolean_factor)*
+    kernels = [compile_batch_boolean_factor(boolean_factor, context) for boolean_factor in get_subtrees(boolean_term)]
+    return kernels[0] if len(kernels) == 1 else make_and_kernel(kernels)
+
+def compile_batch_boolean_factor(boolean_factor, context):          # [NOT] boolean_test
+    if boolean_factor.data == "boolean_expr":                       # disjunction split by split_conjuncts
+        return compile_batch_boolean_expr(boolean_factor, context)
+
+    boolean_test = boolean_factor.children[1].children[0]
+    if boolean_test.data == "parenthesized_boolean_expr":
+        kernel = compile_batch_boolean_expr(boolean_test.children[1], context)
+    elif boolean_test.children[0].data == "comparison_predicate":
+        kernel = compile_batch_comparison_predicate(boolean_test.children[0], context)
+    else:
+        kernel = compile_batch_null_predicate(boolean_test.children[0], context)
+
+    if boolean_factor.children[0] is not None:                      # NOT
+        return make_not_kernel(kernel)
+    return kernel
+
+def make_and_kernel(kernels):                                       # each kernel checks only positions kept by previous ones
+    if len(kernels) == 1:
+        return kernels[0]
+    def kernel_and(batch, positions, unknown=None):
+        if unknown is None:
+            for kernel in kernels:
+                if not positions:
+                    break
+                positions = kernel(batch, positions)
+            return positions
+        unknown_positions = set()                                   # unknown for some kernel, false for none (yet)
+        for kernel in kernels:
+            if not positions:
+                break
+            kernel_unknown = set()
+            kept = set(kernel(batch, positions, kernel_unknown)) | kernel_unknown
+            unknown_positions |= kernel_unknown
+            positions = [position for position in positions if position in kept]
+        unknown.update(position for position in positions if position in unknown_positions)
+        return [position for position in positions if position not in unknown_positions]
+    return kernel_and
+
+def make_or_kernel(kernels):                                        # each kernel checks only positions not accepted by previous ones
+    def kernel_or(batch, positions, unknown=None):
+        accepted = set()
+        unknown_positions = set()
+        remaining = positions
+        for kernel in kernels:
+            if not remaining:
+                break
+            matched = kernel(batch, remaining, unknown_positions if unknown is not None else None)
+            accepted.update(matched)
+            matched = set(matched)
+            remaining = [position for position in remaining if position not in matched]
+        if unknown is not None:                                     # unknown unless accepted by later kernel
+            unknown.update(position for position in remaining if position in unknown_positions)
+        return [position for position in positions if position in accepted]
+    return kernel_or
+
+def make_not_kernel(kernel):
+    def kernel_not(batch, positions, unknown=None):
+        kernel_unknown = set()
+        matched = set(kernel(batch, positions, kernel_unknown))
+        if unknown is not None:
+            unknown |= kernel_unknown
+        return [position for position in positions if position not in matched and position not in kernel_unknown]
+    return kernel_not
+
+def gather_values(batch, key, positions):                           # Values of column at given positions
+    values = batch.columns[key]
+    return values if len(positions) == batch.size else [values[position] for position in positions]
+
+def compile_batch_comparison_predicate(comparison_predicate, context):
+    # comparisons of null-free columns run through map of operator (no Python code per value)
+    left = compile_comp_operand(comparison_predicate.children[0], context, set())
+    operator_value = comparison_predicate.children[1].value
+    right = compile_comp_operand(comparison_predicate.children[2], context, set())
+    if left[2] != right[2] or (left[2] == "char" and operator_value not in ["=", "!="]):
+        raise QueryError("Where clause trying to compare incomparable values")
+
+    if not left[0] and right[0]:                                    # constant on the left: compare column with flipped operator
+        left, right = right, left
+        operator_value = FLIPPED_OPERATORS[operator_value]
+    compare = COMPARISON_OPERATORS[operator_value]
+    left_key, right_key = left[1], right[1]
+
+    # comparison with null is unknown (not satisfied)
+    if left[0] and right[0]:
+        def kernel(batch, positions, unknown=None):
+            left_values = gather_values(batch, left_key, positions)
+            right_values = gather_values(batch, right_key, positions)
+            if None in left_values or None in right_values:
+                if unknown is not None:
+                    unknown.update(position for position, left_value, right_value in zip(positions, left_values, right_values)
+                                   if left_value is None or right_value is None)
+                return [position for position, left_value, right_value in zip(positions, left_values, right_values)
+                        if left_value is not None and right_value is not None and compare(left_value, right_value)]
+            return list(compress(positions, map(compare, left_values, right_values)))
+    elif left[0]:
+        def kernel(batch, positions, unknown=None):
+            values = gather_values(batch, left_key, positions)
+            if None in values:
+                if unknown is not None:
+                    unknown.update(position for position, value in zip(positions, values) if value is None)
+                return [position for position, value in zip(positions, values) if value is not None and compare(value, right_key)]
+            return list(compress(positions, map(compare, values, repeat(right_key))))
+    else:                                                           # constant comparison is evaluated once
+        result = compare(left_key, right_key)
+        def kernel(batch, positions, unknown=None):
+            return positions if result else []
+    return kernel
+
+def compile_batch_null_predicate(null_predicate, context):
+    column_name = null_predicate.children[1].children[0].value.lower()
+    _, key, _ = resolve_where_column(null_predicate.children[0], column_name, context)
+    test = operator.is_ if null_predicate.children[2].children[1] is None else operator.is_not     # IS [NOT] NULL
+
+    def kernel(batch, positions, unknown=None):                     # null test is never unknown
+        return list(compress(positions, map(test, gather_values(batch, key, positions), repeat(None))))
+    return kernel
+
+def get_comparison(boolean_factor):                                 # Get comparison predicate if conjunct is plain (not negated) comparison
+    if boolean_factor.data != "boolean_factor" or boolean_factor.children[0] is not None:
+        return None
+    boolean_test = boolean_factor.children[1].children[0]
+    if boolean_test.data != "predicate" or boolean_test.children[0].data != "comparison_predicate":
+        return None
+    return boolean_test.children[0]
+
+def get_equi_join(boolean_factor, context):                         # Get join columns if conjunct is equality between two tables
+    comparison_predicate = get_comparison(boolean_factor)
+    if comparison_predicate is None or comparison_predicate.children[1].value != "=":
+        return None
+
+    operands = []
+    for comp_operand in [comparison_predicate.children[0], comparison_predicate.children[2]]:
+        if len(comp_operand.children) == 1:                         # comparable value
+            return None
+        column_name = comp_operand.children[1].children[0].value.lower()
+        table_name, key, _ = resolve_where_column(comp_operand.children[0], column_name, context)
+        operands.append((table_name, key))
+
+    return operands if operands[0][0] != operands[1][0] else None
+
+FLIPPED_OPERATORS = {"=": "=", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+def get_constant_comparison(boolean_factor, context):               # Get (column, operator, constant) if conjunct compares column with constant
+    comparison_predicate = get_comparison(boolean_factor)
+    if comparison_predicate is None:
+        return None
+
+    left = compile_comp_operand(comparison_predicate.children[0], context, set())
+    operator_value = comparison_predicate.children[1].value
+    right = compile_comp_operand(comparison_predicate.children[2], context, set())
+    if left[0] == right[0]:                                         # two columns or two constants
+        return None
+    if left[0]:
+        return (left[1], operator_value, right[1])
+    return (right[1], FLIPPED_OPERATORS[operator_value], left[1])   # constant on the left ("3 < a" is "a > 3")
+
+def get_point_lookup(predicates, table):                            # Primary key values fixed by predicates (None if key is not fully fixed)
+    constants = {
+        predicate.constant_comparison[0]: predicate.constant_comparison[2]
+        for predicate in predicates if predicate.constant_comparison and predicate.constant_comparison[1] == "="
+    }
+    keys = [table.name + "." + pk for pk in table.primary_key]
+    if not keys or any(key not in constants for key in keys):
+        return None
+    return [constants[key] for key in keys]
+
+def format_result(output):                          # Lines shown for result of statement
+    if isinstance(output[1], Iterator):             # streamed lines are produced one at a time
+        yield from output[1]
+        return
 
-        result = eval(f"{antecedent_value} {predicate[2]} {consequent_value}")
-    
-    return result if not predicate[0] else not result 
-    
-def print_with_prompt(output):                      # Show prompt message with student ID
     if type(output[1]) != str:
         output[1] = str(output[1])
 
-    print("DB_2018-15001> " + output[1] if output[0] else output[1])                # Show prompt message
+    yield "DB_2018-15001> " + output[1] if output[0] else output[1]                 # Show prompt message
+
+def print_with_prompt(output):                      # Show prompt message with student ID
+    for line in format_result(output):              # print streamed lines as soon as they are produced
+        print(line)
 
 def split_input_include_semicolon(input_queries):   # Split input queries by semicolon
     query_list = []
@@ -1076,34 +3291,206 @@ def input_until_semicolon_followed_enter():         # Input queries
 
     return ' '.join(input_lines)                    # Return input queries as a string
 
-if __name__ == "__main__":                                          # Main function to execute parser
-    db_path = "myDB.db"                                             # Set database path
-
-    with open('grammar.lark') as file:                              # Open grammar file
-        sql_parser = Lark(file.read(), start="command", lexer="dynamic")
+def get_parser_cache_path(grammar_path):                            # Compiled parser is stored next to the grammar file
+    return os.path.splitext(grammar_path)[0] + "_lalr.cache"
+
+def create_sql_parser(grammar_path="grammar.lark", parser="lalr"):  # Build lark parser from grammar file
+    # lalr parser with contextual lexer (keywords and identifiers are told apart by parser state) is loaded from cache file
+    # after first run, cache is rebuilt automatically when grammar changes; earley parser is kept for comparison
+    with open(grammar_path) as file:                                # Open grammar file
+        if parser == "earley":
+            return Lark(file.read(), start="command", lexer="dynamic")
+        return Lark(file.read(), start="command", parser="lalr", lexer="contextual", cache=get_parser_cache_path(grammar_path))
+
+# literals of statement text (same forms as STR, DATE and INT tokens of grammar) and parameter placeholders
+LITERAL_PATTERN = re.compile(r"""(?P<STR>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(?P<DATE>(?<!\w)\d{4}-\d{2}-\d{2}(?!\w))|(?P<INT>(?<!\w)[+-]?\d+(?!\w))|(?P<PLACEHOLDER>\?)""")
+STATEMENT_CACHE_SIZE = 256                                          # number of parse trees kept by statement cache
+
+def strip_literals(query):                                          # Replace literals by placeholders, return (normalized text, [literal token])
+    literals = []
+    def replace(match):
+        literals.append(Token(match.lastgroup, match.group()))
+        return "?"
+    normalized = LITERAL_PATTERN.sub(replace, query)
+    return " ".join(normalized.split()), literals
+
+def bind_placeholders(tree, tokens):                                # Copy of tree with placeholder tokens replaced by given tokens in order
+    tokens = iter(tokens)
+    def copy(node):
+        if isinstance(node, Tree):
+            return Tree(node.data, [copy(child) for child in node.children])
+        if isinstance(node, Token) and node.type == "PLACEHOLDER":
+            return next(tokens)
+        return node
+    return copy(tree)
+
+def count_placeholders(tree):                                       # Number of parameters of statement
+    return sum(1 for _ in tree.scan_values(lambda value: isinstance(value, Token) and value.type == "PLACEHOLDER"))
+
+class StatementCache:                                               # Parse trees of statements kept across statements (least recently used are evicted)
+    # statements differing only in literals share one parse tree, literals are bound into a copy of it
+    # only parsing is skipped: plans depend on literal values (lookup keys, selectivity), so statements are resolved and planned on every run
+    def __init__(self, sql_parser, capacity=STATEMENT_CACHE_SIZE):
+        self.sql_parser = sql_parser
+        self.capacity = capacity
+        self.trees = OrderedDict()                                  # normalized text -> parse tree with placeholders
+        self.prepared = {}                                          # prepared statement name -> query tree with placeholders
+
+    def parse(self, query):                                         # Parse tree of query (parameters typed as "?" are left as placeholders)
+        normalized, literals = strip_literals(query)
+        tree = self.trees.get(normalized)
+        if tree is None:
+            try:
+                tree = self.sql_parser.parse(normalized)
+            except UnexpectedInput:                                 # literal where grammar takes no value (char(10), copy file name): parse as is
+                return self.sql_parser.parse(query)
+            self.trees[normalized] = tree
+            if len(self.trees) > self.capacity:
+                self.trees.popitem(last=False)
+        else:
+            self.trees.move_to_end(normalized)
+        return bind_placeholders(tree, literals)
+
+TRANSACTION_STATEMENTS = ("begin_query", "commit_query", "rollback_query")
+SCHEMA_STATEMENTS = ("create_table_query", "drop_table_query", "create_index_query", "drop_index_query")
+LOCK_ERRORS = (db.DBLockDeadlockError, db.DBLockNotGrantedError)
+
+class SchemaLock:                                                   # Lock between sessions: statements share it, schema changes hold it alone
+    # schema change holds it until its transaction ends, since rolling it back reopens handles used by every session
+    # waiting schema change does not block new statements, so it never blocks transaction whose locks it waits for
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0                                            # statements running
+        self.owner = None                                           # transaction state of session changing schema
+
+    def acquire(self, state, exclusive):                            # Wait until statement of session can run (False when wait timed out)
+        # waits are bounded like lock waits, so statements blocked by idle schema change do not hold worker threads forever
+        with self.condition:
+            if self.owner is state:
+                return True
+            if exclusive:
+                if not self.condition.wait_for(lambda: self.owner is None and self.readers == 0, LOCK_TIMEOUT / 1000000):
+                    return False
+                self.owner = state
+            else:
+                if not self.condition.wait_for(lambda: self.owner is None, LOCK_TIMEOUT / 1000000):
+                    return False
+                self.readers += 1
+            return True
+
+    def release(self, state):                                       # Statement of session has ended
+        with self.condition:
+            if self.owner is state:
+                if not state.txns:
+                    self.owner = None
+            else:
+                self.readers -= 1
+            self.condition.notify_all()
+
+def run_statement(transformer, statements, query, schema_lock=None):   # Parse query through statement cache and run it, return result
+    # with schema_lock (server), statement waits for schema changes of other sessions and select rows are read inside its transaction
+    tree = statements.parse(query)
+    statement = tree.children[0].children[0].children[0] if tree.children[0].data == "query_list" else None
+
+    if statement is not None and statement.data == "prepare_query":    # keep query tree to run it later with parameters
+        statement_name = statement.children[1].children[0].value.lower()
+        if statement.children[3].children[0].data in ("prepare_query", "execute_query") + TRANSACTION_STATEMENTS:
+            return [True, "Syntax error"]
+        statements.prepared[statement_name] = statement.children[3]
+        return [True, f"'{statement_name}' statement is prepared"]
+
+    if statement is not None and statement.data == "execute_query":
+        statement_name = statement.children[1].children[0].value.lower()
+        prepared = statements.prepared.get(statement_name)
+        # NoSuchPreparedStatement
+        if prepared is None:
+            return [True, "No such prepared statement"]
+        parameters = [comparable_value.children[0] for comparable_value in statement.find_data("comparable_value")]
+        # ParameterCountError
+        if len(parameters) != count_placeholders(prepared) or count_placeholders(statement) > 0:
+            return [True, f"Execute has failed: '{statement_name}' takes {count_placeholders(prepared)} parameter(s)"]
+        tree = bind_placeholders(prepared, parameters)
+        statement = prepared.children[0]
+
+    elif count_placeholders(tree) > 0:                              # parameters are allowed only in prepared statements
+        return [True, "Syntax error"]
+
+    storage = transformer.storage
+    state = storage.state
+    if schema_lock is not None and not schema_lock.acquire(state, statement is not None and statement.data in SCHEMA_STATEMENTS):
+        return [True, "Statement has failed: conflict with concurrent transaction, retry it"]
+    try:
+        return run_transaction(transformer, tree, statement, schema_lock is not None)
+    finally:
+        if schema_lock is not None:
+            schema_lock.release(state)
+
+def run_transaction(transformer, tree, statement, read_rows=False): # Run parsed statement in its own transaction
+    # read_rows (server): select rows are read inside the transaction, so writes of other sessions cannot change them while read
+    transformer.result = None
+    if statement is not None and statement.data in TRANSACTION_STATEMENTS:
+        transformer.transform(tree)
+        return transformer.result
+
+    # statement is atomic: its writes are rolled back when it fails halfway (without read_rows, rows of select are read after commit)
+    storage = transformer.storage
+    storage.begin()
+    try:
+        transformer.transform(tree)                                 # Transform parse tree with MyTransformer class
+        result = transformer.result
+        if read_rows and result is not None and isinstance(result[1], Iterator):
+            result[1] = iter(list(result[1]))
+    except BaseException as e:
+        storage.abort()
+        transformer.catalog.invalidate()
+        if isinstance(getattr(e, "orig_exc", e), LOCK_ERRORS):     # deadlock or lock wait timeout with other session
+            return [True, "Statement has failed: conflict with concurrent transaction, retry it"]
+        raise
+    storage.commit()
+    return transformer.result
 
-    while(1):                                                       # Loop until exit command is given
-        input_queries = input_until_semicolon_followed_enter()      # Input queries
-        query_list = split_input_include_semicolon(input_queries)   # Split input queries by semicolon
-        result_seq = []                                             # List to store query results
+if __name__ == "__main__":                                          # Main function to execute parser
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--storage-format", choices=STORAGE_FORMATS, default="json",
+                            help="record format of newly created database (use migrate_storage.py to convert existing one)")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                            help="Berkeley DB cache size in MB")
+    arg_parser.add_argument("--durability", choices=DURABILITY_FLAGS.keys(), default="sync",
+                            help="log flush on commit (write_nosync and nosync trade durability on crash for commit throughput)")
+    arg_parser.add_argument("--parallel-degree", type=int, default=DEFAULT_PARALLEL_DEGREE,
+                            help="worker processes scanning large tables (1 disables parallel scan)")
+    arg_parser.add_argument("--parallel-min-rows", type=int, default=PARALLEL_SCAN_MIN_ROWS,
+                            help="rows a table needs before it is scanned in parallel")
+    arg_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help="records per column batch of single table select (0 runs row at a time)")
+    arg_parser.add_argument("--sort-memory", type=int, default=DEFAULT_SORT_MEMORY // (1024 * 1024),
+                            help="MB of rows order by sorts in memory before spilling sorted runs to temporary files")
+    args = arg_parser.parse_args()
 
-        for query in query_list:                                    # Parse each query
-            if query[:-1].strip() == "exit":                        # Exit command
-                exit(0)                                             # Exit program
-            try:
-                output = sql_parser.parse(query)                    # Parse query with lark parser
-                transformer = MyTransformer(db_path)                # Create MyTransformer class
-                transformer.transform(output)                       # Transform parse tree with MyTransformer class
-                result = transformer.result                         # Get result from MyTransformer class
-                if result != None:
-                    result_seq.append(result)
-            except UnexpectedCharacters:                            # Lark grammar error
-                result_seq.append([True, "Syntax error"])                   # Print error message when syntax error occurs
-                break
-            except Exception as e:                                  # Print error message when unexpected error occurs
-                result_seq.append([True, f"Unexpected: {e}"])
-                break
-            
-        for result in result_seq:                                   # Print each result
-            if result != None:
-                print_with_prompt(result)
+    db_path = "myDB.db"                                             # Set database path
+    sql_parser = create_sql_parser()
+    storage = Storage(db_path, args.cache_size * 1024 * 1024, args.durability, args.parallel_degree, args.parallel_min_rows, args.batch_size,
+                      args.sort_memory * 1024 * 1024)               # Open database environment once per session
+    transformer = MyTransformer(storage, args.storage_format, Catalog())    # Transformer (and its catalog cache) is reused by all queries
+    statements = StatementCache(sql_parser)                         # Parse trees and prepared statements are reused by all queries
+
+    try:
+        while(1):                                                   # Loop until exit command is given
+            input_queries = input_until_semicolon_followed_enter()  # Input queries
+            query_list = split_input_include_semicolon(input_queries)   # Split input queries by semicolon
+
+            for query in query_list:                                # Parse each query
+                if query[:-1].strip() == "exit":                    # Exit command
+                    exit(0)                                         # Exit program (storage is closed below)
+                try:
+                    result = run_statement(transformer, statements, query)  # Parse (or reuse parse tree of) query and run it
+                    if result != None:
+                        print_with_prompt(result)                   # Print result (select rows are streamed before next query runs)
+                except UnexpectedInput:                             # Lark grammar error
+                    print_with_prompt([True, "Syntax error"])       # Print error message when syntax error occurs
+                    break
+                except Exception as e:                              # Print error message when unexpected error occurs
+                    print_with_prompt([True, f"Unexpected: {e}"])
+                    break
+    finally:
+        storage.close()                                             # Close database handles on exit, EOF or interrupt
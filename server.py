@@ -0,0 +1,126 @@
+from run import MyTransformer, Storage, Catalog, StatementCache, SchemaLock, TransactionState, create_sql_parser, run_statement
+from run import format_result, split_input_include_semicolon, DEFAULT_CACHE_SIZE, DURABILITY_FLAGS, STORAGE_FORMATS
+from run import DEFAULT_PARALLEL_DEGREE, PARALLEL_SCAN_MIN_ROWS, DEFAULT_BATCH_SIZE, DEFAULT_SORT_MEMORY
+from client import encode_response, DEFAULT_HOST, DEFAULT_PORT
+from lark.exceptions import UnexpectedInput
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import argparse
+import os
+
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark")
+
+
+class Session:                                                      # Statements and transactions of one client connection
+    def __init__(self, server):
+        self.server = server
+        self.transformer = MyTransformer(server.storage, server.storage_format, Catalog())
+        self.statements = StatementCache(server.sql_parser)         # prepared statements belong to session
+        self.state = TransactionState()
+
+    def run(self, queries):                                         # Run statements of one request and return output lines (on worker thread)
+        self.server.storage.use_state(self.state)
+        lines = []
+        for query in split_input_include_semicolon(queries):
+            try:
+                result = run_statement(self.transformer, self.statements, query, self.server.schema_lock)
+                if result is not None:
+                    lines += format_result(result)
+            except UnexpectedInput:                                 # Lark grammar error
+                lines += format_result([True, "Syntax error"])
+                break
+            except Exception as e:
+                lines += format_result([True, f"Unexpected: {e}"])
+                break
+        return "\n".join(lines).split("\n") if lines else []
+
+    def close(self):                                                # Roll back transaction left open by client (on worker thread)
+        storage = self.server.storage
+        storage.use_state(self.state)
+        while self.state.txns:
+            storage.abort()
+        if self.server.schema_lock.owner is self.state:
+            self.server.schema_lock.release(self.state)
+
+class Server:                                                       # Clients share one database environment, statements run on bounded thread pool
+    # Berkeley DB locking isolates concurrent transactions, schema lock keeps schema changes apart from other statements
+    def __init__(self, storage, sql_parser, storage_format="json", workers=8):
+        self.storage = storage
+        self.sql_parser = sql_parser
+        self.storage_format = storage_format
+        self.schema_lock = SchemaLock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.sessions = set()
+
+    async def handle_client(self, reader, writer):                  # Serve requests of one connection in order
+        loop = asyncio.get_running_loop()
+        session = Session(self)
+        self.sessions.add(session)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                queries = line.decode("utf-8").strip()
+                if queries[:-1].strip().lower() == "exit":
+                    break
+                lines = await loop.run_in_executor(self.executor, session.run, queries)
+                writer.write(encode_response(lines))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            await loop.run_in_executor(self.executor, session.close)
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):  # Start listening (port 0 picks free port)
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self.handle_client, path=socket_path)
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    def close(self):                                                # Stop workers and roll back transactions of remaining clients
+        self.executor.shutdown()
+        for session in list(self.sessions):
+            session.close()
+
+async def serve(server, args):
+    listener = await server.start(args.host, args.port, args.socket)
+    print(f"listening on {args.socket if args.socket else f'{args.host}:{args.port}'}")
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":                                          # Serve database to clients of client.py
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default=DEFAULT_HOST)
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--socket", help="listen on unix socket path instead of host and port")
+    arg_parser.add_argument("--db-path", default="myDB.db")
+    arg_parser.add_argument("--workers", type=int, default=8, help="threads running statements (bounds concurrent statements)")
+    arg_parser.add_argument("--storage-format", choices=STORAGE_FORMATS, default="json",
+                            help="record format of newly created database")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                            help="Berkeley DB cache size in MB")
+    arg_parser.add_argument("--durability", choices=DURABILITY_FLAGS.keys(), default="sync",
+                            help="log flush on commit (commits of concurrent clients share log flushes)")
+    arg_parser.add_argument("--parallel-degree", type=int, default=DEFAULT_PARALLEL_DEGREE,
+                            help="worker processes scanning large tables (shared by all clients, 1 disables parallel scan)")
+    arg_parser.add_argument("--parallel-min-rows", type=int, default=PARALLEL_SCAN_MIN_ROWS,
+                            help="rows a table needs before it is scanned in parallel")
+    arg_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help="records per column batch of single table select (0 runs row at a time)")
+    arg_parser.add_argument("--sort-memory", type=int, default=DEFAULT_SORT_MEMORY // (1024 * 1024),
+                            help="MB of rows each order by sorts in memory before spilling sorted runs to temporary files")
+    args = arg_parser.parse_args()
+
+    storage = Storage(args.db_path, args.cache_size * 1024 * 1024, args.durability, args.parallel_degree, args.parallel_min_rows, args.batch_size,
+                      args.sort_memory * 1024 * 1024)
+    server = Server(storage, create_sql_parser(GRAMMAR_PATH), args.storage_format, args.workers)
+    try:
+        asyncio.run(serve(server, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        storage.close()